@@ -0,0 +1,487 @@
+"""
+Golden-page regression suite and parser benchmark.
+
+Every saved page in golden_pages/ is parsed with the production extractors
+and compared against golden_pages/expected.json. Each available parser
+backend is then timed (pages/s, MB/s) and its peak memory measured, and the
+numbers are compared against baseline.json so that parser slowdowns are
+caught before a change is merged. The baseline was recorded on a
+development machine, so CI runs with --relative-only instead: it skips
+baseline.json and gates on ratios measured on the runner itself, the
+per-card offer extraction against the page-wide legacy one on the same
+large offers page (--max-relative-time, --max-relative-memory).
+--check-only checks the golden output alone.
+
+Usage (from the repository root):
+    python -m benchmarks.parser_benchmark
+    python -m benchmarks.parser_benchmark --check-only
+    python -m benchmarks.parser_benchmark --relative-only
+    python -m benchmarks.parser_benchmark --update-expected
+    python -m benchmarks.parser_benchmark --update-baseline
+    python -m benchmarks.parser_benchmark --large-offers 2000
+"""
+import argparse
+import contextlib
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from scraping_logics import page_schemas
+from scraping_logics.page_schemas import OFFERS_LISTING, PRODUCT_PAGE, make_soup
+from scraping_logics.merchant_info_scraper import MerchantInfoScraper
+from scraping_logics.request_handler import ScraperResponse, is_blocked_page
+from scraping_logics.seller_products import CARD_FIELDS, TrovaPrezziScraper, extract_listing_info
+from scraping_logics.url_scheda_prodotto import SchedaProdottoScraper
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIR = os.path.join(BENCHMARK_DIR, "golden_pages")
+EXPECTED_FILE = os.path.join(GOLDEN_DIR, "expected.json")
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+CANDIDATE_PARSERS = ["html.parser", "lxml", "html5lib"]
+
+# Fields that change on every run and are not part of the golden output
+VOLATILE_FIELDS = {"Data Scraping", "scraping_date"}
+
+
+def _strip_volatile(data):
+    if isinstance(data, dict):
+        return {
+            key: _strip_volatile(value)
+            for key, value in data.items()
+            if key not in VOLATILE_FIELDS
+        }
+    if isinstance(data, list):
+        return [_strip_volatile(item) for item in data]
+    return data
+
+
+def extract_merchant_page(html: str) -> Dict[str, Any]:
+    scraper = MerchantInfoScraper("farmaciauno")
+    soup = make_soup(html)
+    return {
+        **scraper.extract_merchant_info(soup),
+        **scraper.extract_rating_info(soup),
+        **scraper.extract_logo_info(soup),
+    }
+
+
+def extract_categories_page(html: str) -> List[Dict[str, Any]]:
+    scraper = MerchantInfoScraper("farmaciauno")
+    return scraper.extract_merchant_categories(make_soup(html))
+
+
+def extract_offers_listing(html: str) -> Dict[str, Any]:
+    scraper = TrovaPrezziScraper("farmaciauno")
+    response = ScraperResponse(
+        url="https://www.trovaprezzi.it/negozi/farmaciauno/offerte",
+        text=html,
+        status=200,
+        meta={"page_number": 1},
+    )
+    return {
+        "products": [record.to_dict() for record in scraper.iter_products(response)],
+        "listing": extract_listing_info(make_soup(html)),
+    }
+
+
+def _links(tags) -> List[Dict[str, str]]:
+    return [
+        {"title": tag.get("title") or tag.text.strip(), "href": tag.get("href")}
+        for tag in tags
+    ]
+
+
+def extract_product_page(html: str) -> Dict[str, Any]:
+    scraper = SchedaProdottoScraper("HP 15s-fq5000 9B9R8EA")
+    soup = make_soup(html)
+    container = PRODUCT_PAGE.select_one("variations_container", soup)
+    return {
+        "competitors": scraper.estrai_competitors(soup),
+        "variants": _links(PRODUCT_PAGE.select("variants", container)) if container else [],
+        "suggestions": _links(PRODUCT_PAGE.select("suggestions", soup)),
+    }
+
+
+def extract_blocked_page(html: str) -> Dict[str, Any]:
+    return {"blocked": is_blocked_page(html)}
+
+
+EXTRACTORS: Dict[str, Callable[[str], Any]] = {
+    "merchant_page": extract_merchant_page,
+    "categories_page": extract_categories_page,
+    "offers_listing": extract_offers_listing,
+    "product_page": extract_product_page,
+    "blocked_page": extract_blocked_page,
+}
+
+
+@contextlib.contextmanager
+def use_parser(parser: str):
+    """Temporarily switch the parser backend used by make_soup()"""
+    previous = page_schemas.HTML_PARSER
+    page_schemas.HTML_PARSER = parser
+    try:
+        yield
+    finally:
+        page_schemas.HTML_PARSER = previous
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the scrapers' progress prints while measuring"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def available_parsers() -> List[str]:
+    parsers = []
+    for parser in CANDIDATE_PARSERS:
+        try:
+            make_soup("<p></p>", parser)
+            parsers.append(parser)
+        except Exception:
+            continue
+    return parsers
+
+
+def load_golden_pages() -> Dict[str, Dict[str, Any]]:
+    """Return {file name: {"page_type", "expected", "html"}} for every golden page"""
+    with open(EXPECTED_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)
+    pages = {}
+    for name, entry in manifest.items():
+        with open(os.path.join(GOLDEN_DIR, name), encoding="utf-8") as f:
+            pages[name] = {**entry, "html": f.read()}
+    return pages
+
+
+def extract(page: Dict[str, Any]):
+    with quiet():
+        return _strip_volatile(EXTRACTORS[page["page_type"]](page["html"]))
+
+
+def check_correctness(pages: Dict[str, Dict[str, Any]], parser: str) -> List[str]:
+    """Return a description of every golden page whose extraction changed"""
+    failures = []
+    with use_parser(parser):
+        for name, page in pages.items():
+            actual = extract(page)
+            if actual != page["expected"]:
+                failures.append(
+                    f"{parser}: {name} ({page['page_type']}) extraction differs\n"
+                    f"  expected: {json.dumps(page['expected'], ensure_ascii=False)[:500]}\n"
+                    f"  actual:   {json.dumps(actual, ensure_ascii=False)[:500]}"
+                )
+    return failures
+
+
+def measure(pages: Dict[str, Dict[str, Any]], parser: str, iterations: int) -> Dict[str, float]:
+    """Parse every golden page `iterations` times and report throughput and peak memory"""
+    total_bytes = sum(len(page["html"].encode("utf-8")) for page in pages.values())
+    with use_parser(parser), quiet():
+        # Warm-up pass so that import and selector compilation costs are excluded
+        for page in pages.values():
+            EXTRACTORS[page["page_type"]](page["html"])
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for page in pages.values():
+                EXTRACTORS[page["page_type"]](page["html"])
+        elapsed = time.perf_counter() - start
+
+        peak_bytes = 0
+        for page in pages.values():
+            tracemalloc.start()
+            EXTRACTORS[page["page_type"]](page["html"])
+            peak_bytes = max(peak_bytes, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    parsed_pages = len(pages) * iterations
+    return {
+        "pages_per_s": round(parsed_pages / elapsed, 2),
+        "mb_per_s": round(total_bytes * iterations / elapsed / 1_000_000, 3),
+        "peak_kb": round(peak_bytes / 1024, 1),
+    }
+
+
+OFFER_CARD_RE = re.compile(r"[ \t]*<li class=\"listing_item\">.*?</li>\n", re.S)
+IMAGE_WRAPPER_RE = re.compile(r"\s*<div class=\"item_image_wrapper\">.*?</div>", re.S)
+OFFER_ID_RE = re.compile(r"(?:/goto/|/)(\d{6,})")
+
+
+def synthesize_offers_page(html: str, cards: int, drop_image_every: int = 7) -> str:
+    """
+    A large offers page built from the golden one's cards, with the image
+    removed from every drop_image_every-th card
+    """
+    templates = [match.group(0) for match in OFFER_CARD_RE.finditer(html)]
+    generated = []
+    for index in range(cards):
+        card = templates[index % len(templates)]
+        if drop_image_every and index % drop_image_every == drop_image_every - 1:
+            card = IMAGE_WRAPPER_RE.sub("", card, count=1)
+        generated.append(card)
+    first, last = OFFER_CARD_RE.search(html), list(OFFER_CARD_RE.finditer(html))[-1]
+    return html[:first.start()] + "".join(generated) + html[last.end():]
+
+
+def _offer_id(tag, attribute: str):
+    match = OFFER_ID_RE.search(tag.get(attribute, "")) if tag is not None else None
+    return match.group(1) if match else None
+
+
+def count_misaligned(rows) -> int:
+    """Rows whose image or button belongs to a different offer than the name"""
+    misaligned = 0
+    for name, image, cta in rows:
+        offer = _offer_id(name, "href")
+        for other in (_offer_id(image, "src"), _offer_id(cta, "href")):
+            if other is not None and other != offer:
+                misaligned += 1
+                break
+    return misaligned
+
+
+def legacy_offer_rows(soup):
+    """The previous extraction: one select() per field over the page, zipped"""
+    return list(
+        zip(
+            OFFERS_LISTING.select("name", soup),
+            OFFERS_LISTING.select("image", soup),
+            OFFERS_LISTING.select("cta", soup),
+            OFFERS_LISTING.select("price", soup),
+        )
+    )
+
+
+def per_card_offer_rows(soup):
+    """The production extraction: every field looked up inside its own card"""
+    rows = []
+    for card in OFFERS_LISTING.select("card", soup):
+        fields = OFFERS_LISTING.extract(card, CARD_FIELDS)
+        rows.append((fields["name"], fields["image"], fields["cta"], fields["price"]))
+    return rows
+
+
+def _peak_kb(extractor, soup) -> float:
+    tracemalloc.start()
+    extractor(soup)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+
+def benchmark_large_offers(html: str, parser: str, cards: int, iterations: int) -> Dict[str, Any]:
+    """Time both extractions on a large offers page and count misaligned offers"""
+    page = synthesize_offers_page(html, cards)
+    extractors = (("legacy_zip", legacy_offer_rows), ("per_card", per_card_offer_rows))
+    with use_parser(parser):
+        soup = make_soup(page)
+        results = {"cards": cards, "tags": len(soup.find_all(True))}
+        best = {label: float("inf") for label, _ in extractors}
+        # Interleaved runs, keeping the fastest of each: a busy runner slows
+        # both extractions alike instead of skewing their ratio
+        for _ in range(iterations):
+            for label, extractor in extractors:
+                start = time.perf_counter()
+                extractor(soup)
+                best[label] = min(best[label], time.perf_counter() - start)
+        for label, extractor in extractors:
+            rows = extractor(soup)
+            results[label] = {
+                "ms_per_page": round(best[label] * 1000, 2),
+                "peak_kb": _peak_kb(extractor, soup),
+                "offers": len(rows),
+                "misaligned": count_misaligned((name, image, cta) for name, image, cta, _ in rows),
+            }
+    return results
+
+
+def compare_relative(
+    parser: str, large: Dict[str, Any], max_time_ratio: float, max_memory_ratio: float
+) -> List[str]:
+    """
+    Machine-relative gate: the per-card extraction against the page-wide
+    legacy one, timed on the same soup and runner
+    """
+    regressions = []
+    legacy, per_card = large["legacy_zip"], large["per_card"]
+    time_ratio = per_card["ms_per_page"] / max(legacy["ms_per_page"], 0.01)
+    if time_ratio > max_time_ratio:
+        regressions.append(
+            f"{parser}: per-card extraction takes {time_ratio:.2f}x the legacy one "
+            f"(at most {max_time_ratio}x)"
+        )
+    memory_ratio = per_card["peak_kb"] / max(legacy["peak_kb"], 0.1)
+    if memory_ratio > max_memory_ratio:
+        regressions.append(
+            f"{parser}: per-card extraction peaks at {memory_ratio:.2f}x the legacy memory "
+            f"(at most {max_memory_ratio}x)"
+        )
+    return regressions
+
+
+def compare_to_baseline(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    max_slowdown: float,
+    max_memory_growth: float,
+) -> List[str]:
+    """Return a description of every metric that regressed beyond the tolerances"""
+    regressions = []
+    for parser, metrics in results.items():
+        reference = baseline.get(parser)
+        if not reference:
+            continue
+        min_throughput = reference["pages_per_s"] * (1 - max_slowdown)
+        if metrics["pages_per_s"] < min_throughput:
+            regressions.append(
+                f"{parser}: throughput {metrics['pages_per_s']} pages/s is below "
+                f"{min_throughput:.2f} (baseline {reference['pages_per_s']})"
+            )
+        max_peak = reference["peak_kb"] * (1 + max_memory_growth)
+        if metrics["peak_kb"] > max_peak:
+            regressions.append(
+                f"{parser}: peak memory {metrics['peak_kb']} KB is above "
+                f"{max_peak:.1f} KB (baseline {reference['peak_kb']})"
+            )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Golden-page parser regression suite")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed passes over all pages")
+    parser.add_argument(
+        "--parsers", nargs="*", help="Parser backends to run (default: all installed)"
+    )
+    parser.add_argument(
+        "--max-slowdown", type=float, default=0.5,
+        help="Allowed throughput drop vs baseline, as a fraction (default: 0.5)",
+    )
+    parser.add_argument(
+        "--max-memory-growth", type=float, default=0.25,
+        help="Allowed peak memory growth vs baseline, as a fraction (default: 0.25)",
+    )
+    parser.add_argument(
+        "--large-offers", type=int, default=500,
+        help="Cards on the synthetic large offers page (0 to skip)",
+    )
+    parser.add_argument(
+        "--max-relative-time", type=float, default=1.75,
+        help="Allowed per-card / legacy extraction time on the large offers page (default: 1.75)",
+    )
+    parser.add_argument(
+        "--max-relative-memory", type=float, default=1.5,
+        help="Allowed per-card / legacy peak memory on the large offers page (default: 1.5)",
+    )
+    parser.add_argument(
+        "--check-only", action="store_true",
+        help="Only check the extracted data, without timing or baseline comparison",
+    )
+    parser.add_argument(
+        "--relative-only", action="store_true",
+        help="Check the extracted data and the machine-relative gates, not baseline.json",
+    )
+    parser.add_argument(
+        "--update-expected", action="store_true",
+        help="Rewrite expected.json from the current extractors",
+    )
+    parser.add_argument(
+        "--update-baseline", action="store_true",
+        help="Rewrite baseline.json from this run",
+    )
+    args = parser.parse_args(argv)
+
+    pages = load_golden_pages()
+    parsers = args.parsers or available_parsers()
+
+    if args.update_expected:
+        with use_parser("html.parser"):
+            manifest = {
+                name: {"page_type": page["page_type"], "expected": extract(page)}
+                for name, page in pages.items()
+            }
+        with open(EXPECTED_FILE, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"Updated {EXPECTED_FILE}")
+        return 0
+
+    failures = []
+    for backend in parsers:
+        failures.extend(check_correctness(pages, backend))
+
+    # Absolute timings depend on the machine: compared to baseline.json only
+    # outside of --check-only and --relative-only
+    results = {}
+    if not args.check_only and not args.relative_only:
+        print(f"\n{'parser':<12} {'pages/s':>10} {'MB/s':>8} {'peak KB':>10}")
+        for backend in parsers:
+            results[backend] = measure(pages, backend, args.iterations)
+            metrics = results[backend]
+            print(
+                f"{backend:<12} {metrics['pages_per_s']:>10} "
+                f"{metrics['mb_per_s']:>8} {metrics['peak_kb']:>10}"
+            )
+
+    if args.large_offers:
+        offers_html = pages["offers_page.html"]["html"]
+        print(
+            f"\n{'large offers page':<20} {'ms/page':>10} {'peak KB':>10} "
+            f"{'offers':>8} {'misaligned':>11}"
+        )
+        for backend in parsers:
+            large = benchmark_large_offers(
+                offers_html, backend, args.large_offers, 1 if args.check_only else 5
+            )
+            for label in ("legacy_zip", "per_card"):
+                metrics = large[label]
+                print(
+                    f"{backend + ' ' + label:<20} {metrics['ms_per_page']:>10} "
+                    f"{metrics['peak_kb']:>10} {metrics['offers']:>8} {metrics['misaligned']:>11}"
+                )
+            if large["per_card"]["misaligned"] or large["per_card"]["offers"] != args.large_offers:
+                failures.append(
+                    f"{backend}: per-card extraction returned {large['per_card']['offers']} offers, "
+                    f"{large['per_card']['misaligned']} misaligned, on the large offers page"
+                )
+            if not args.check_only:
+                failures.extend(
+                    compare_relative(
+                        backend, large, args.max_relative_time, args.max_relative_memory
+                    )
+                )
+
+    if args.check_only:
+        print("\nTiming and memory checks skipped (--check-only)")
+    elif args.relative_only:
+        print("\nBaseline timing and memory checks skipped (--relative-only)")
+    elif args.update_baseline:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Updated {BASELINE_FILE}")
+    elif os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding="utf-8") as f:
+            baseline = json.load(f)
+        failures.extend(
+            compare_to_baseline(results, baseline, args.max_slowdown, args.max_memory_growth)
+        )
+
+    if failures:
+        print(f"\n❌ {len(failures)} regression(s):")
+        for failure in failures:
+            print(f"- {failure}")
+        return 1
+
+    print(f"\n✅ {len(pages)} golden pages OK with {', '.join(parsers)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,137 +1,459 @@
 import json
-from scraping_logics.merchant_info_scraper import scrape_merchant_info
-from scraping_logics.seller_products import run_spider_locally
-from scraping_logics.url_scheda_prodotto import SchedaProdottoScraper
+from scraping_logics.merchant_info_scraper import scrape_merchant_info, scrape_merchants_info
+from scraping_logics.merchant_onboarding import onboard_merchant
+from scraping_logics.seller_products import (
+    run_spider_locally,
+    build_category_plan,
+    resume_spider,
+)
+from scraping_logics.competitor_jobs import job_deadline, process_scraping_job
+from scraping_logics.batch_jobs import is_sqs_event, jobs_from_sqs, run_batch
+from scraping_logics.request_handler import page_flight
+from scraping_logics.price_history import price_history
+from scraping_logics.refresh_scheduler import plan_refresh
+from scraping_logics.shard_planner import (
+    SHARD_QUEUE_URL,
+    dispatch_to_sqs,
+    plan_competitor_shards,
+    plan_product_shards,
+)
 import asyncio
 import traceback, os
-import requests
 
 BASE_API_URL = os.environ.get("BASE_API_URL", "http://host.docker.internal:8000")
 print(f"BASE_API_URL: {BASE_API_URL}")
-def handler(event, context):
-    """AWS Lambda handler function - Runs scraping directly"""
 
-    query_params = event.get("queryStringParameters", {})
+
+def scrape_merchant_info_action(query_params, payload, context):
     venditore = query_params.get("venditore", "")
-    action = query_params.get("action", "")
     user_id = query_params.get("user_id", "")
-    payload = event.get("body", [])
-    print(f"Payload: {payload}")
-    if action == "scrape_merchant_info":
-        if not venditore or not user_id:
-            return {
-                "statusCode": 400,
-                "body": json.dumps({"error": "Missing required parameters"}),
-                "headers": {"Content-Type": "application/json"},
-            }
+    # Several merchants at once: {"venditori": [...]}
+    venditori = payload.get("venditori") if isinstance(payload, dict) else None
+    if not (venditore or venditori) or not user_id:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": "Missing required parameters"}),
+            "headers": {"Content-Type": "application/json"},
+        }
 
-        try:
+    try:
+        # Ensure the result is JSON serializable
+        response_body = {
+            "message": "Scraping completed",
+            # "data": result
+        }
+        if venditori:
+            results = scrape_merchants_info(venditori)
+            response_body["merchants"] = {
+                name: result["status"] for name, result in results.items()
+            }
+        else:
             # Run scraping directly
             result = scrape_merchant_info(venditore)
             # print(f"Scraping completed for {venditore}: {result}")
 
-            # Ensure the result is JSON serializable
-            response_body = {
-                "message": "Scraping completed",
-                # "data": result
-            }
+        return {
+            "statusCode": 200,
+            "body": json.dumps(response_body),
+            "headers": {
+                "Content-Type": "application/json",
+                "Access-Control-Allow-Origin": "*",  # Add CORS header
+            },
+        }
+
+    except Exception as e:
+        print(f"Error in scraping {venditore}: {str(e)}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)}),
+            "headers": {
+                "Content-Type": "application/json",
+                "Access-Control-Allow-Origin": "*",  # Add CORS header
+            },
+        }
 
+
+def scrape_seller_products_by_category_action(query_params, payload, context):
+    venditore = query_params.get("venditore", "")
+    if not payload:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": "Missing required payload"}),
+            "headers": {"Content-Type": "application/json"},
+        }
+    try:
+        # A merchant categories result is planned straight into page URLs
+        if isinstance(payload, dict) and "categories" in payload:
+            if not venditore:
+                return {
+                    "statusCode": 400,
+                    "body": json.dumps({"error": "Missing required parameters"}),
+                    "headers": {"Content-Type": "application/json"},
+                }
+            categories = payload["categories"]
+            if isinstance(categories, dict):
+                categories = categories.get("data", [])
+            payload = build_category_plan(venditore, categories)
+            if not payload:
+                return {
+                    "statusCode": 400,
+                    "body": json.dumps({"error": "No categories with products to scrape"}),
+                    "headers": {"Content-Type": "application/json"},
+                }
+        incremental = query_params.get("incremental")
+        result = run_spider_locally(
+            payload,
+            incremental=None if incremental is None else incremental in ("1", "true"),
+            job_id=query_params.get("job_id"),
+        )
+        if result["status"] != "success":
+            return {
+                "statusCode": 500,
+                "body": json.dumps({"error": result["message"]}),
+                "headers": {"Content-Type": "application/json"},
+            }
+        # Pages left unscraped fail the job, so that a queued shard is redelivered
+        pages_left = len(result["urls_data"]) - result["pages_scraped"]
+        response_body = {
+            "total_products": result["total_products"],
+            "pages_scraped": result["pages_scraped"],
+            "pages_left": pages_left,
+            "resumable": result["resumable"],
+            "checkpoint_durable": result["checkpoint_durable"],
+        }
+        if pages_left:
             return {
-                "statusCode": 200,
-                "body": json.dumps(response_body),
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",  # Add CORS header
-                },
+                "statusCode": 500,
+                "body": json.dumps({"error": f"{pages_left} pages not scraped", **response_body}),
+                "headers": {"Content-Type": "application/json"},
             }
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"message": "Scraping completed", **response_body}),
+            "headers": {"Content-Type": "application/json"},
+        }
+    except Exception as e:
+        print(f"Error in scraping {venditore}: {str(e)}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)}),
+            "headers": {"Content-Type": "application/json"},
+        }
+
 
-        except Exception as e:
-            print(f"Error in scraping {venditore}: {str(e)}")
+def onboard_merchant_action(query_params, payload, context):
+    venditore = query_params.get("venditore", "")
+    if not venditore:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": "Missing required parameters"}),
+            "headers": {"Content-Type": "application/json"},
+        }
+    try:
+        # Merchant info, categories and offers in one pipelined run
+        incremental = query_params.get("incremental")
+        result = onboard_merchant(
+            venditore,
+            incremental=None if incremental is None else incremental in ("1", "true"),
+            job_id=query_params.get("job_id"),
+        )
+        if result["status"] != "success":
             return {
                 "statusCode": 500,
-                "body": json.dumps({"error": str(e)}),
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",  # Add CORS header
-                },
+                "body": json.dumps({"error": result["message"]}),
+                "headers": {"Content-Type": "application/json"},
             }
-    elif action == "scrape_seller_products_by_category":
-        if not payload:
+        return {
+            "statusCode": 200,
+            "body": json.dumps(
+                {
+                    "message": "Onboarding completed",
+                    "total_products": result["total_products"],
+                    "pages_scraped": result["pages_scraped"],
+                    "resumable": result["resumable"],
+                    "checkpoint_durable": result["checkpoint_durable"],
+                    "timings": result["timings"],
+                }
+            ),
+            "headers": {"Content-Type": "application/json"},
+        }
+    except Exception as e:
+        traceback.print_exc()
+        print(f"Error onboarding {venditore}: {str(e)}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)}),
+            "headers": {"Content-Type": "application/json"},
+        }
+
+
+def plan_shards_action(query_params, payload, context):
+    venditore = query_params.get("venditore", "")
+    # Split a job into shards that fit one invocation each, for a fan-out
+    target_action = query_params.get("target_action", "")
+    try:
+        if target_action == "scrape_seller_products_by_category":
+            urls = payload
+            if isinstance(payload, dict) and "categories" in payload:
+                categories = payload["categories"]
+                if isinstance(categories, dict):
+                    categories = categories.get("data", [])
+                urls = build_category_plan(venditore, categories)
+            if not urls or not venditore:
+                return {
+                    "statusCode": 400,
+                    "body": json.dumps({"error": "Missing required parameters"}),
+                    "headers": {"Content-Type": "application/json"},
+                }
+            events = plan_product_shards(venditore, urls)
+        elif target_action == "scrape_products_competitors":
+            events = plan_competitor_shards(payload.get("scraping_job", {}))
+        else:
             return {
                 "statusCode": 400,
-                "body": json.dumps({"error": "Missing required payload"}),
+                "body": json.dumps({"error": f"Cannot shard action {target_action!r}"}),
                 "headers": {"Content-Type": "application/json"},
             }
-        try:
-            run_spider_locally(payload)
-        except Exception as e:
-            print(f"Error in scraping {venditore}: {str(e)}")
+
+        print(f"Planned {len(events)} shards for {target_action}")
+        response_body = {
+            "shards": len(events),
+            "estimated_seconds": [event["shard"]["estimated_seconds"] for event in events],
+        }
+        if query_params.get("dispatch") == "sqs":
+            queue_url = query_params.get("queue_url") or SHARD_QUEUE_URL
+            if not queue_url:
+                return {
+                    "statusCode": 400,
+                    "body": json.dumps({"error": "No shard queue configured"}),
+                    "headers": {"Content-Type": "application/json"},
+                }
+            response_body["queued"] = dispatch_to_sqs(events, queue_url)
+        else:
+            response_body["events"] = events
+        return {
+            "statusCode": 200,
+            "body": json.dumps(response_body),
+            "headers": {"Content-Type": "application/json"},
+        }
+    except Exception as e:
+        traceback.print_exc()
+        print(f"Error planning shards for {target_action}: {str(e)}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)}),
+            "headers": {"Content-Type": "application/json"},
+        }
+
+
+def resume_seller_products_action(query_params, payload, context):
+    venditore = query_params.get("venditore", "")
+    # Continue a crawl that was cut short, from its first unscraped page
+    job_id = query_params.get("job_id") or venditore
+    if not job_id:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": "Missing required parameters"}),
+            "headers": {"Content-Type": "application/json"},
+        }
+    try:
+        incremental = query_params.get("incremental")
+        result = resume_spider(
+            job_id,
+            incremental=None if incremental is None else incremental in ("1", "true"),
+        )
+        if result["status"] != "success":
             return {
-                "statusCode": 500,
-                "body": json.dumps({"error": str(e)}),
+                "statusCode": 404 if result["status"] == "not_found" else 500,
+                "body": json.dumps({"error": result["message"]}),
                 "headers": {"Content-Type": "application/json"},
             }
-    elif action == "scrape_products_competitors":
-        try:
-            scraping_job = payload.get("scraping_job", {})
-            # get the products from the scraping job
-            print(scraping_job)
-            products = scraping_job.get("products", [])
-
-            async def scrape_product(product):
-                titolo_prodotto = product.get("name", "")
-                #make titolo url encoded %20
-                titolo_prodotto = titolo_prodotto.replace(" ", "%20")
-                categoria_id = product.get("category", {}).get("id", "")
-                scheda_prodotto = product.get("scheda_prodotto", None)
-                scraper = SchedaProdottoScraper(
-                    titolo_prodotto, categoria_id, scheda_prodotto
-                )
-                
-                if scheda_prodotto:
-                    print(f"Scheda prodotto already scraped for {titolo_prodotto}")
-                    result = await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        scraper.estrai_dati_competitor
-                    )
-                else:
-                    print(f"Scraping scheda prodotto for {titolo_prodotto}")
-                    result = await asyncio.get_event_loop().run_in_executor(
-                        None,
-                        scraper.cerca_scheda_prodotto_estrai_dati_competitor
-                    )
-                #only keep id and result_data
-                result = {
-                    "product_id": product.get("id", ""),
-                    "scraping_result": result,
-                    "status": "completed"
+        return {
+            "statusCode": 200,
+            "body": json.dumps(
+                {
+                    "message": "Scraping resumed",
+                    "pages_scraped": result["pages_scraped"],
+                    "resumable": result["resumable"],
+                    "checkpoint_durable": result["checkpoint_durable"],
                 }
-                return result
-
-            # Create and run all tasks concurrently
-            loop = asyncio.get_event_loop()
-            tasks = [scrape_product(product) for product in products]
-            results = loop.run_until_complete(asyncio.gather(*tasks))
-            scraping_job['result_data'] = results
-            print(f"All results (products with competitor data): {results}")
-            response = requests.post(
-                f"{BASE_API_URL}/businessManager/scraping/job/update/",
-                json=scraping_job
-            )
-            print(f"Response: {BASE_API_URL}")
-            if response.status_code == 200:
-                print(f"Successfully updated scraping status for {venditore}")
-            else:
-                print(f"Failed to update scraping status: {response.status_code}")
+            ),
+            "headers": {"Content-Type": "application/json"},
+        }
+    except Exception as e:
+        print(f"Error resuming {job_id}: {str(e)}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)}),
+            "headers": {"Content-Type": "application/json"},
+        }
+
+
+def plan_competitor_refresh_action(query_params, payload, context):
+    # Pick the products whose prices move, within a request budget
+    try:
+        scraping_job = payload.get("scraping_job", {})
+        budget = int(payload.get("request_budget") or query_params.get("request_budget", "0"))
+        if not scraping_job.get("products") or budget <= 0:
             return {
-                "statusCode": 200,
+                "statusCode": 400,
+                "body": json.dumps({"error": "Missing products or request_budget"}),
                 "headers": {"Content-Type": "application/json"},
             }
-        except Exception as e:
-            traceback.print_exc()
-            print(f"Error in scraping {venditore}: {str(e)}")
+        plan = plan_refresh(scraping_job["products"], budget)
+        refresh_job = {**scraping_job, "products": plan["batch"]}
+        response_body = {
+            "selected": [product.get("id") for product in plan["batch"]],
+            "requests": plan["requests"],
+            "schedule": plan["schedule"],
+        }
+        if query_params.get("run") in ("1", "true") and plan["batch"]:
+            outcome = asyncio.run(
+                process_scraping_job(
+                    refresh_job, deadline=job_deadline(context), base_url=BASE_API_URL
+                )
+            )
+            response_body["updated"] = outcome["updated"]
+        else:
+            response_body["scraping_job"] = refresh_job
+        return {
+            "statusCode": 200,
+            "body": json.dumps(response_body),
+            "headers": {"Content-Type": "application/json"},
+        }
+    except Exception as e:
+        traceback.print_exc()
+        print(f"Error planning competitor refresh: {str(e)}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)}),
+            "headers": {"Content-Type": "application/json"},
+        }
+
+
+def price_changes_action(query_params, payload, context):
+    # Competitor price changes recorded since a unix timestamp
+    try:
+        since = int(query_params.get("since", "0"))
+        product_ids = query_params.get("product_ids")
+        changes = price_history.changes_since(
+            since, product_ids.split(",") if product_ids else None
+        )
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"since": since, "changes": changes}),
+            "headers": {"Content-Type": "application/json"},
+        }
+    except ValueError:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": "Invalid since parameter"}),
+            "headers": {"Content-Type": "application/json"},
+        }
+
+
+def scrape_products_competitors_action(query_params, payload, context):
+    venditore = query_params.get("venditore", "")
+    try:
+        scraping_job = payload.get("scraping_job", {})
+        # get the products from the scraping job
+        print(scraping_job)
+
+        # Bounded pool, ordered results streamed to the backend as they
+        # complete; stop starting products near the Lambda timeout
+        outcome = asyncio.run(
+            process_scraping_job(
+                scraping_job, deadline=job_deadline(context), base_url=BASE_API_URL
+            )
+        )
+        print(f"All results (products with competitor data): {outcome['results']}")
+        if outcome["updated"]:
+            print(f"Successfully updated scraping status for {venditore}")
+        else:
+            print("Failed to update scraping status")
+        return {
+            "statusCode": 200,
+            "headers": {"Content-Type": "application/json"},
+        }
+    except Exception as e:
+        traceback.print_exc()
+        print(f"Error in scraping {venditore}: {str(e)}")
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)}),
+            "headers": {"Content-Type": "application/json"},
+        }
+
+
+ACTIONS = {
+    "scrape_merchant_info": scrape_merchant_info_action,
+    "scrape_seller_products_by_category": scrape_seller_products_by_category_action,
+    "onboard_merchant": onboard_merchant_action,
+    "plan_shards": plan_shards_action,
+    "resume_seller_products": resume_seller_products_action,
+    "plan_competitor_refresh": plan_competitor_refresh_action,
+    "price_changes": price_changes_action,
+    "scrape_products_competitors": scrape_products_competitors_action,
+}
+
+
+def run_action(event, context):
+    """Run the action of a single handler event"""
+    query_params = event.get("queryStringParameters") or {}
+    payload = event.get("body", [])
+    print(f"Payload: {payload}")
+    action_function = ACTIONS.get(query_params.get("action", ""))
+    if action_function is None:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": "Unknown action"}),
+            "headers": {"Content-Type": "application/json"},
+        }
+    return action_function(query_params, payload, context)
+
+
+def batch_action(jobs, context):
+    """Run several jobs in this invocation; one outcome per job"""
+    return asyncio.run(
+        run_batch(jobs, run_action, context, job_deadline(context), BASE_API_URL)
+    )
+
+
+def handler(event, context):
+    """AWS Lambda handler function - Runs scraping directly"""
+    # A warm container must not serve pages fetched by a previous invocation
+    page_flight.reset()
+
+    # SQS batch (e.g. queued shards): failed messages are redelivered
+    if is_sqs_event(event):
+        outcomes = batch_action(jobs_from_sqs(event), context)
+        return {
+            "batchItemFailures": [
+                {"itemIdentifier": outcome["id"]}
+                for outcome in outcomes
+                if outcome["status"] != "success"
+            ]
+        }
+
+    query_params = event.get("queryStringParameters") or {}
+    if query_params.get("action") == "batch":
+        payload = event.get("body", [])
+        if isinstance(payload, dict):
+            payload = payload.get("jobs", [])
+        if not payload:
             return {
-                "statusCode": 500,
-                "body": json.dumps({"error": str(e)}),
+                "statusCode": 400,
+                "body": json.dumps({"error": "Missing required payload"}),
                 "headers": {"Content-Type": "application/json"},
             }
+        outcomes = batch_action(
+            [{"id": index, "event": job_event} for index, job_event in enumerate(payload)],
+            context,
+        )
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"jobs": outcomes}),
+            "headers": {"Content-Type": "application/json"},
+        }
+
+    return run_action(event, context)
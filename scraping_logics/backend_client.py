@@ -0,0 +1,432 @@
+"""
+Async client for the business manager backend.
+
+All calls share one keep-alive aiohttp session, bodies can be
+gzip-compressed (UPLOAD_GZIP=1, once the backend decodes them), and
+transient failures are retried with exponential backoff.
+
+add-products is not idempotent: a request that may have been processed
+(timeout, dropped connection, 5xx) is not retried, unless the backend
+deduplicates on the Idempotency-Key header (BACKEND_DEDUPES_IDEMPOTENCY_KEY=1,
+which also turns the header on). job/update is replay-safe and is always
+retried. Requests the backend certainly did not process (connection
+refused, 408/425/429) are always retried.
+"""
+import asyncio
+import gzip
+import json
+import os
+import random
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import aiohttp
+
+BASE_API_URL = os.environ.get("BASE_API_URL", "http://172.17.0.1:8000")
+# Compress request bodies (Content-Encoding: gzip); off until the backend decodes them
+UPLOAD_GZIP = os.environ.get("UPLOAD_GZIP", "0") == "1"
+# Send Idempotency-Key and retry add-products on timeouts and 5xx; off until
+# the backend drops requests whose key it has already processed
+BACKEND_DEDUPES_IDEMPOTENCY_KEY = os.environ.get("BACKEND_DEDUPES_IDEMPOTENCY_KEY", "0") == "1"
+# Upper bounds for a single add-products request
+UPLOAD_BATCH_PRODUCTS = int(os.environ.get("UPLOAD_BATCH_PRODUCTS", "500"))
+UPLOAD_BATCH_BYTES = int(os.environ.get("UPLOAD_BATCH_BYTES", "1000000"))
+UPLOAD_MAX_RETRIES = int(os.environ.get("UPLOAD_MAX_RETRIES", "5"))
+# Competitor results are reported every PROGRESS_BATCH_RESULTS results or
+# PROGRESS_MAX_DELAY seconds, whichever comes first
+PROGRESS_BATCH_RESULTS = int(os.environ.get("PROGRESS_BATCH_RESULTS", "10"))
+PROGRESS_MAX_DELAY = float(os.environ.get("PROGRESS_MAX_DELAY", "5"))
+
+ADD_PRODUCTS_PATH = "/businessManager/onboarding/add-products/"
+JOB_UPDATE_PATH = "/businessManager/scraping/job/update/"
+
+# Client errors worth retrying: the request was not processed
+RETRYABLE_CLIENT_STATUSES = {408, 425, 429}
+
+
+def create_session(limit: int = 10) -> aiohttp.ClientSession:
+    """Keep-alive session for backend calls"""
+    connector = aiohttp.TCPConnector(limit=limit, keepalive_timeout=60)
+    return aiohttp.ClientSession(
+        connector=connector, timeout=aiohttp.ClientTimeout(total=60)
+    )
+
+
+class BackendClient:
+    """Posts JSON payloads to the backend with compression and retries"""
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        base_url: str = BASE_API_URL,
+        gzip_requests: bool = UPLOAD_GZIP,
+        max_retries: int = UPLOAD_MAX_RETRIES,
+        dedupes_idempotency_key: bool = BACKEND_DEDUPES_IDEMPOTENCY_KEY,
+    ):
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.gzip_requests = gzip_requests
+        self.max_retries = max_retries
+        self.dedupes_idempotency_key = dedupes_idempotency_key
+
+    async def post_json(
+        self,
+        path: str,
+        payload: Any,
+        idempotency_key: Optional[str] = None,
+        replay_safe: bool = False,
+    ) -> bool:
+        """
+        POST a payload (or an already encoded JSON body); True on a 2xx
+        answer. A request that may already have been processed is only
+        retried when it is replay_safe, or has an idempotency_key and the
+        backend deduplicates on it.
+        """
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        deduplicated = bool(idempotency_key) and self.dedupes_idempotency_key
+        if deduplicated:
+            headers["Idempotency-Key"] = idempotency_key
+        retry_processed = replay_safe or deduplicated
+        if self.gzip_requests:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.session.post(url, data=body, headers=headers) as response:
+                    if response.status < 300:
+                        return True
+                    print(f"⚠️ Backend answered {response.status} for {path}")
+                    if response.status not in RETRYABLE_CLIENT_STATUSES and (
+                        response.status < 500 or not retry_processed
+                    ):
+                        return False
+            except aiohttp.ClientConnectorError as e:
+                # Never reached the backend: safe to send again
+                print(f"⚠️ Backend request to {path} failed: {type(e).__name__}: {e}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"⚠️ Backend request to {path} failed: {type(e).__name__}: {e}")
+                if not retry_processed:
+                    print(f"❌ Not retrying {path}: it may already have been processed")
+                    return False
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(min(30.0, 0.5 * 2 ** attempt) + random.random())
+
+        print(f"❌ Giving up on {path} after {self.max_retries + 1} attempts")
+        return False
+
+
+class ProductUploader:
+    """
+    Coalesces the products of many scraped pages into size-bounded
+    add-products requests. Pages are queued without blocking the event loop;
+    add_page() only waits when max_pending batches are already queued.
+
+    on_uploaded, when given, is awaited with the pages whose products have
+    all been accepted by the backend (including every batch queued before).
+    """
+
+    def __init__(
+        self,
+        client: BackendClient,
+        venditore: str,
+        max_products: int = UPLOAD_BATCH_PRODUCTS,
+        max_bytes: int = UPLOAD_BATCH_BYTES,
+        max_pending: int = 4,
+        senders: int = 2,
+        on_uploaded: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None,
+    ):
+        self.client = client
+        self.venditore = venditore
+        self.max_products = max_products
+        self.max_bytes = max_bytes
+        self.senders = senders
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._tasks: List[asyncio.Task] = []
+        self._encoded: List[str] = []
+        self._encoded_bytes = 0
+        self._pages: List[Dict[str, Any]] = []
+        self.on_uploaded = on_uploaded
+        # Idempotency keys are "<run>-<batch id>", unique to this uploader
+        # (only sent when the backend deduplicates on them)
+        self._run_id = uuid.uuid4().hex
+        # Batch ids are assigned in queue order; a page is acknowledged once
+        # every batch up to its last one is done and none of its own failed
+        self._batch_id = 0
+        self._done: Set[int] = set()
+        self._failed: Set[int] = set()
+        self._done_upto = -1
+        self._waiting: List[Tuple[int, int, Dict[str, Any]]] = []
+        self.uploaded_products = 0
+        self.uploaded_batches = 0
+        self.failed_batches = 0
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._send_loop()) for _ in range(self.senders)]
+
+    async def add_page(
+        self, url_entry: Dict[str, Any], products: Optional[Iterable[Any]] = None
+    ) -> None:
+        """
+        Queue the products of one scraped page for upload. Products (dicts,
+        or records with a to_dict() method) default to url_entry["products"]
+        and are encoded one at a time as they are consumed.
+        """
+        page = {
+            "page_number": url_entry.get("page_number"),
+            "url": url_entry.get("url"),
+            "scraped_products": url_entry.get("scraped_products", 0),
+        }
+        self._pages.append(page)
+        first_batch = self._batch_id
+        has_products = False
+        for product in url_entry.get("products", []) if products is None else products:
+            has_products = True
+            if hasattr(product, "to_dict"):
+                product = product.to_dict()
+            encoded = json.dumps(product, ensure_ascii=False)
+            self._encoded.append(encoded)
+            self._encoded_bytes += len(encoded) + 1
+            if (
+                len(self._encoded) >= self.max_products
+                or self._encoded_bytes >= self.max_bytes
+            ):
+                await self.flush()
+
+        if self.on_uploaded is not None:
+            if not has_products:
+                await self._acknowledge([page])
+            else:
+                last_batch = self._batch_id if self._encoded else self._batch_id - 1
+                self._waiting.append((first_batch, last_batch, page))
+
+    def _next_batch_id(self) -> int:
+        batch_id = self._batch_id
+        self._batch_id += 1
+        return batch_id
+
+    async def flush(self) -> None:
+        """Hand the buffered products over to the senders"""
+        if not self._encoded:
+            self._pages = []
+            return
+        encoded, pages = self._encoded, self._pages
+        self._encoded, self._encoded_bytes, self._pages = [], 0, []
+        await self._queue.put(
+            (self._build_body(encoded, pages), len(encoded), self._next_batch_id())
+        )
+
+    async def remove_offers(self, offer_ids: List[int]) -> None:
+        """Queue the ids of offers that disappeared since the previous run"""
+        if not offer_ids:
+            return
+        await self.flush()
+        body = {
+            "business_name": self.venditore,
+            "products": {
+                "scraped": True,
+                "scraped_products": 0,
+                "products": [],
+                "removed_offers": offer_ids,
+            },
+        }
+        await self._queue.put((json.dumps(body).encode("utf-8"), 0, self._next_batch_id()))
+
+    def _build_body(self, encoded: List[str], pages: List[Dict[str, Any]]) -> bytes:
+        # Same shape as a single scraped page entry, with all pages' products
+        first_page = pages[0] if pages else {}
+        header = {
+            "page_number": first_page.get("page_number"),
+            "url": first_page.get("url"),
+            "page_numbers": [page["page_number"] for page in pages],
+            "scraped": True,
+            "scraped_products": len(encoded),
+        }
+        header_json = json.dumps(header, ensure_ascii=False)[:-1]
+        body = (
+            '{"business_name": ' + json.dumps(self.venditore, ensure_ascii=False)
+            + ', "products": ' + header_json
+            + ', "products": [' + ", ".join(encoded) + "]}}"
+        )
+        return body.encode("utf-8")
+
+    async def _send_loop(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                if item is None:
+                    return
+                body, count, batch_id = item
+                if await self.client.post_json(
+                    ADD_PRODUCTS_PATH, body, idempotency_key=f"{self._run_id}-{batch_id}"
+                ):
+                    self.uploaded_products += count
+                    self.uploaded_batches += 1
+                    print(f"✅ Uploaded {count} products for {self.venditore}")
+                else:
+                    self.failed_batches += 1
+                    self._failed.add(batch_id)
+                await self._batch_done(batch_id)
+            finally:
+                self._queue.task_done()
+
+    async def _batch_done(self, batch_id: int) -> None:
+        self._done.add(batch_id)
+        while self._done_upto + 1 in self._done:
+            self._done_upto += 1
+            self._done.discard(self._done_upto)
+        if self.on_uploaded is None:
+            return
+
+        uploaded, waiting = [], []
+        for first_batch, last_batch, page in self._waiting:
+            if last_batch > self._done_upto:
+                waiting.append((first_batch, last_batch, page))
+            elif not any(first_batch <= failed <= last_batch for failed in self._failed):
+                uploaded.append(page)
+        self._waiting = waiting
+        if uploaded:
+            await self._acknowledge(uploaded)
+
+    async def _acknowledge(self, pages: List[Dict[str, Any]]) -> None:
+        try:
+            await self.on_uploaded(pages)
+        except Exception as e:
+            print(f"⚠️ Upload acknowledgement failed: {type(e).__name__}: {e}")
+
+    async def close(self) -> None:
+        """Flush what is left and wait for every batch to be sent"""
+        await self.flush()
+        for _ in self._tasks:
+            await self._queue.put(None)
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "uploaded_products": self.uploaded_products,
+            "uploaded_batches": self.uploaded_batches,
+            "failed_batches": self.failed_batches,
+        }
+
+
+class JobProgressReporter:
+    """
+    Streams the results of a competitor scraping job to job/update as they
+    complete, in micro-batches, then posts the whole job once it is done.
+
+    Every update carries the job fields (without its products), the new
+    result_data entries and an "update" header with a per-job sequence
+    number. Results are keyed by product_id and the final update holds all
+    of them, so a replayed or lost partial update does not change the
+    outcome.
+    """
+
+    def __init__(
+        self,
+        client: BackendClient,
+        scraping_job: Dict[str, Any],
+        max_results: int = PROGRESS_BATCH_RESULTS,
+        max_delay: float = PROGRESS_MAX_DELAY,
+    ):
+        self.client = client
+        self.scraping_job = scraping_job
+        self.max_results = max_results
+        self.max_delay = max_delay
+        self.total = len(scraping_job.get("products", []))
+        self._pending: List[Dict[str, Any]] = []
+        self._reported = 0
+        self._sequence = 0
+        # A job can be scraped again: its updates must not look like replays
+        self._run_id = uuid.uuid4().hex
+        self._wake = asyncio.Event()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+        self.failed_updates = 0
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._report_loop())
+
+    def add(self, result: Dict[str, Any]) -> None:
+        """Queue a product result; never waits for the backend"""
+        self._pending.append(result)
+        if len(self._pending) >= self.max_results:
+            self._wake.set()
+
+    def _body(self, results: List[Dict[str, Any]], final: bool) -> Dict[str, Any]:
+        self._sequence += 1
+        if final:
+            body = dict(self.scraping_job)
+        else:
+            # Partial updates leave the job's product list out
+            body = {key: value for key, value in self.scraping_job.items() if key != "products"}
+        body["result_data"] = results
+        body["update"] = {
+            "sequence": self._sequence,
+            "final": final,
+            "completed": self._reported,
+            "total": self.total,
+        }
+        return body
+
+    def _idempotency_key(self) -> str:
+        # Updates are replay-safe anyway; the key lets the backend drop a retried one
+        return f"job-{self.scraping_job.get('id', '')}-{self._run_id}-{self._sequence}"
+
+    async def _report_loop(self) -> None:
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self._pending or self._closed:
+                continue
+            batch, self._pending = self._pending, []
+            self._reported += len(batch)
+            body = self._body(batch, final=False)
+            if await self.client.post_json(
+                JOB_UPDATE_PATH, body, self._idempotency_key(), replay_safe=True
+            ):
+                print(f"📤 Reported {self._reported}/{self.total} competitor results")
+            else:
+                self.failed_updates += 1
+
+    async def stop(self) -> None:
+        """Stop streaming; pending results go out with finish()"""
+        self._closed = True
+        self._wake.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def finish(self, results: List[Dict[str, Any]]) -> bool:
+        """Post the whole job with every result; True if the backend accepted it"""
+        await self.stop()
+        self._pending = []
+        self._reported = len(results)
+        self.scraping_job["result_data"] = results
+        body = self._body(results, final=True)
+        return await self.client.post_json(
+            JOB_UPDATE_PATH, body, self._idempotency_key(), replay_safe=True
+        )
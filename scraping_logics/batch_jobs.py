@@ -0,0 +1,120 @@
+"""
+Runs several handler events (jobs) in one invocation.
+
+Jobs come from an SQS batch (for instance the shard events queued by
+shard_planner.dispatch_to_sqs) or from a "batch" action. They share the
+invocation's TLS session, the page cache and one CompetitorPool, so the
+products of all competitor jobs together stay within the concurrency and
+pacing limits, and the fixed cost of an invocation is paid once.
+Competitor jobs run on the event loop; other actions run in threads.
+"""
+import asyncio
+import json
+import os
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+from .backend_client import BASE_API_URL
+from .competitor_jobs import CompetitorPool, process_scraping_job, product_flight
+from .request_handler import page_flight
+from .shard_planner import load_shard_event
+
+# Jobs of a batch running at the same time
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+
+
+def is_sqs_event(event: Dict[str, Any]) -> bool:
+    records = event.get("Records")
+    return bool(records) and all(
+        record.get("eventSource") == "aws:sqs" for record in records
+    )
+
+
+def jobs_from_sqs(event: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """[{"id": message id, "event": handler event}] of an SQS batch"""
+    jobs = []
+    for record in event["Records"]:
+        try:
+            job_event = json.loads(record["body"])
+            if isinstance(job_event, dict):
+                job_event = load_shard_event(job_event)
+        except (TypeError, ValueError):
+            job_event = None
+        except Exception as e:
+            # The event stays in S3: the message fails and is redelivered
+            print(f"❌ Could not load the shard event of message {record['messageId']}: {e}")
+            job_event = None
+        jobs.append({"id": record["messageId"], "event": job_event})
+    return jobs
+
+
+def _succeeded(response: Any) -> bool:
+    # An action that returns nothing has not reported its outcome
+    return isinstance(response, dict) and response.get("statusCode", 200) < 300
+
+
+async def run_batch(
+    jobs: List[Dict[str, Any]],
+    run_action: Callable[[Dict[str, Any], Any], Any],
+    context=None,
+    deadline: Optional[float] = None,
+    base_url: str = BASE_API_URL,
+    concurrency: int = BATCH_CONCURRENCY,
+) -> List[Dict[str, Any]]:
+    """
+    Run jobs ({"id", "event"}) at most `concurrency` at a time and return
+    one {"id", "action", "status", ...} outcome per job, in order. Jobs not
+    started by `deadline` (time.monotonic()) fail, so that they are retried.
+    """
+    slots = asyncio.Semaphore(max(1, concurrency))
+    pool = CompetitorPool()
+    product_flight.reset()
+    page_flight.reset()
+
+    async def run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+        job_event = job.get("event")
+        if not isinstance(job_event, dict):
+            return {"id": job["id"], "action": None, "status": "error", "error": "Invalid job event"}
+        action = (job_event.get("queryStringParameters") or {}).get("action", "")
+        outcome = {"id": job["id"], "action": action}
+        async with slots:
+            if deadline is not None and time.monotonic() >= deadline:
+                return {**outcome, "status": "error", "error": "Not started before the deadline"}
+            try:
+                if action == "scrape_products_competitors":
+                    body = job_event.get("body") or {}
+                    result = await process_scraping_job(
+                        body.get("scraping_job", {}),
+                        deadline=deadline,
+                        base_url=base_url,
+                        pool=pool,
+                    )
+                    if not result["updated"]:
+                        return {**outcome, "status": "error", "error": "Job update not accepted"}
+                    return {**outcome, "status": "success"}
+                response = await asyncio.to_thread(run_action, job_event, context)
+            except Exception as e:
+                traceback.print_exc()
+                return {**outcome, "status": "error", "error": str(e)}
+        if _succeeded(response):
+            return {**outcome, "status": "success"}
+        if not isinstance(response, dict):
+            return {**outcome, "status": "error", "error": "No response from the action"}
+        return {
+            **outcome,
+            "status": "error",
+            "statusCode": response.get("statusCode"),
+            "error": response.get("body"),
+        }
+
+    try:
+        outcomes = await asyncio.gather(*(run_job(job) for job in jobs))
+    finally:
+        pool.shutdown()
+        product_flight.reset()
+        page_flight.reset()
+
+    failed = sum(outcome["status"] != "success" for outcome in outcomes)
+    print(f"Batch summary: {len(outcomes) - failed}/{len(outcomes)} jobs succeeded")
+    return list(outcomes)
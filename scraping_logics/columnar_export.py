@@ -0,0 +1,232 @@
+"""
+Columnar export of scraped offers and competitor prices (Arrow/Parquet).
+
+Rows are buffered column by column and written as Arrow record batches to
+one Parquet file per job, with typed columns (prices in cents, offer ids,
+dictionary-encoded merchant and category names, timestamps). When
+EXPORT_BUCKET is set, finished files are also uploaded to S3.
+
+Exporting is off unless EXPORT_DIR is set. pyarrow is not in
+requirements.txt (it would weigh on the Lambda package): a deployment that
+sets EXPORT_DIR has to add it, and logs an error at every cold start until
+it does.
+"""
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from .offer_snapshot import offer_id
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "")
+EXPORT_BUCKET = os.environ.get("EXPORT_BUCKET", "")
+EXPORT_PREFIX = os.environ.get("EXPORT_PREFIX", "exports/")
+EXPORT_S3_ENDPOINT = os.environ.get("EXPORT_S3_ENDPOINT") or None
+# Rows per Arrow record batch (and Parquet row group)
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", "10000"))
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pq = None
+    if EXPORT_DIR:
+        print("❌ EXPORT_DIR is set but pyarrow is not installed: nothing will be exported")
+
+# "1.234,56" → 123456
+ITALIAN_PRICE_RE = re.compile(r"(\d{1,3}(?:\.\d{3})*|\d+),(\d{1,2})")
+
+
+def price_to_cents(price) -> Optional[int]:
+    """Cents from a float or an Italian formatted price ("1.234,56"), or None"""
+    if price is None:
+        return None
+    if isinstance(price, (int, float)):
+        return int(round(price * 100))
+    match = ITALIAN_PRICE_RE.search(str(price))
+    if not match:
+        return None
+    euros, cents = match.groups()
+    return int(euros.replace(".", "")) * 100 + int(cents.ljust(2, "0"))
+
+
+def export_enabled() -> bool:
+    return bool(EXPORT_DIR) and pa is not None
+
+
+if pa is not None:
+    OFFERS_SCHEMA = pa.schema(
+        [
+            ("offer_id", pa.int64()),
+            ("merchant", pa.dictionary(pa.int32(), pa.string())),
+            ("category", pa.dictionary(pa.int32(), pa.string())),
+            ("page", pa.int32()),
+            ("name", pa.string()),
+            ("price_cents", pa.int64()),
+            ("url", pa.string()),
+            ("image_url", pa.string()),
+            ("scraped_at", pa.timestamp("ms")),
+        ]
+    )
+    COMPETITORS_SCHEMA = pa.schema(
+        [
+            ("job_id", pa.string()),
+            # Backend product ids are ints or strings
+            ("product_id", pa.string()),
+            ("product_name", pa.string()),
+            ("scheda_url", pa.string()),
+            ("competitor", pa.dictionary(pa.int32(), pa.string())),
+            ("rank", pa.int16()),
+            ("price_cents", pa.int64()),
+            ("scraped_at", pa.timestamp("ms")),
+        ]
+    )
+
+
+class ColumnarWriter:
+    """Buffers rows per column and writes them as record batches to a Parquet file"""
+
+    def __init__(self, path: str, schema, batch_rows: int = EXPORT_BATCH_ROWS):
+        self.path = path
+        self.schema = schema
+        self.batch_rows = batch_rows
+        self.rows = 0
+        self._columns: Dict[str, List[Any]] = {name: [] for name in schema.names}
+        self._buffered = 0
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def append(self, **row) -> None:
+        for name, column in self._columns.items():
+            column.append(row.get(name))
+        self._buffered += 1
+        if self._buffered >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffered:
+            return
+        batch = pa.RecordBatch.from_arrays(
+            [
+                pa.array(self._columns[field.name], type=field.type)
+                for field in self.schema
+            ],
+            schema=self.schema,
+        )
+        if self._writer is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._writer = pq.ParquetWriter(self.path, self.schema, compression="zstd")
+        self._writer.write_batch(batch)
+        self.rows += self._buffered
+        self._columns = {name: [] for name in self.schema.names}
+        self._buffered = 0
+
+    def close(self) -> Optional[str]:
+        """Write what is left; returns the file path, or None if nothing was written"""
+        self.flush()
+        if self._writer is None:
+            return None
+        self._writer.close()
+        self._writer = None
+        print(f"📦 Exported {self.rows} rows to {self.path}")
+        upload_export(self.path)
+        return self.path
+
+
+def upload_export(path: str) -> None:
+    """Copy a finished export to EXPORT_BUCKET, when configured"""
+    if not EXPORT_BUCKET:
+        return
+    try:
+        import boto3
+
+        key = f"{EXPORT_PREFIX}{os.path.basename(path)}"
+        boto3.client("s3", endpoint_url=EXPORT_S3_ENDPOINT).upload_file(path, EXPORT_BUCKET, key)
+        print(f"📦 Uploaded export to s3://{EXPORT_BUCKET}/{key}")
+    except Exception as e:
+        print(f"⚠️ Could not upload export {path}: {e}")
+
+
+def _export_path(kind: str, name: str) -> str:
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    safe_name = re.sub(r"[^\w.-]+", "_", str(name))
+    return os.path.join(EXPORT_DIR, f"{kind}-{safe_name}-{stamp}.parquet")
+
+
+class OfferExporter:
+    """Offers of one products run, appended page by page"""
+
+    def __init__(self, name: str):
+        # name: merchant, or the shard's job id so parallel shards do not collide
+        self.writer = ColumnarWriter(_export_path("offers", name), OFFERS_SCHEMA)
+        self._timestamps: Dict[str, datetime] = {}
+        # Pages are added from worker threads
+        self._lock = threading.Lock()
+
+    def add_records(self, records: Iterable[Any]) -> None:
+        """Append OfferRecords (the whole page shares one timestamp string)"""
+        with self._lock:
+            self._add_records(records)
+
+    def _add_records(self, records: Iterable[Any]) -> None:
+        for record in records:
+            scraped_at = self._timestamps.get(record.scraped_at)
+            if scraped_at is None:
+                self._timestamps = {record.scraped_at: datetime.fromisoformat(record.scraped_at)}
+                scraped_at = self._timestamps[record.scraped_at]
+            self.writer.append(
+                offer_id=offer_id(record.url),
+                merchant=record.merchant,
+                category=record.category_name or record.category,
+                page=record.page,
+                name=record.name,
+                price_cents=price_to_cents(record.price),
+                url=record.url,
+                image_url=record.image,
+                scraped_at=scraped_at,
+            )
+
+    def close(self) -> Optional[str]:
+        with self._lock:
+            return self.writer.close()
+
+
+def export_competitor_results(scraping_job: Dict[str, Any], results: List[Dict[str, Any]]) -> Optional[str]:
+    """Write the competitor prices of a scraping job; returns the file path"""
+    if not export_enabled():
+        return None
+    names = {product.get("id"): product.get("name") for product in scraping_job.get("products", [])}
+    job_id = str(scraping_job.get("id", ""))
+    file_name = job_id or "job"
+    if scraping_job.get("shard"):
+        file_name += f"-shard{scraping_job['shard']['index']}"
+    scraped_at = datetime.now()
+    with ColumnarWriter(_export_path("competitors", file_name), COMPETITORS_SCHEMA) as writer:
+        for result in results:
+            scraping_result = result.get("scraping_result")
+            # (competitors, scheda url) on success, (message, False) otherwise
+            if not scraping_result or not scraping_result[1]:
+                continue
+            competitors, scheda_url = scraping_result
+            product_id = result.get("product_id")
+            for rank, competitor in enumerate(competitors, start=1):
+                writer.append(
+                    job_id=job_id,
+                    product_id=None if product_id in ("", None) else str(product_id),
+                    product_name=names.get(product_id),
+                    scheda_url=scheda_url,
+                    competitor=competitor.get("venditore"),
+                    rank=rank,
+                    price_cents=price_to_cents(competitor.get("prezzo")),
+                    scraped_at=scraped_at,
+                )
+        return writer.close()
@@ -0,0 +1,282 @@
+"""
+Executor for competitor scraping jobs (scrape_products_competitors).
+
+Products are scraped by a fixed number of workers (COMPETITOR_CONCURRENCY)
+on a dedicated thread pool, and their starts are spaced by
+COMPETITOR_START_INTERVAL, so the load on the site and the proxy does not
+grow with the size of the job. Each product has a timeout; a product that
+times out is cancelled before its next request. Results keep the order of
+the job's products.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .backend_client import BASE_API_URL, BackendClient, JobProgressReporter, create_session
+from .columnar_export import export_competitor_results, price_to_cents
+from .price_analytics import attach_price_analytics
+from .price_history import price_history
+from .rate_limiter import RateLimiter
+from .request_handler import page_flight
+from .scheda_index import is_product_page_url, normalize_title
+from .shard_planner import competitor_kind, latency_stats
+from .single_flight import SingleFlight
+from .url_scheda_prodotto import SchedaProdottoScraper
+
+COMPETITOR_CONCURRENCY = int(os.environ.get("COMPETITOR_CONCURRENCY", "8"))
+# Seconds a single product may take, variant and suggestion pages included
+COMPETITOR_TIMEOUT = float(os.environ.get("COMPETITOR_TIMEOUT", "180"))
+# Minimum seconds between the starts of two products
+COMPETITOR_START_INTERVAL = float(os.environ.get("COMPETITOR_START_INTERVAL", "0.5"))
+# Seconds kept free before the Lambda timeout to post the results
+COMPETITOR_DEADLINE_MARGIN = float(os.environ.get("COMPETITOR_DEADLINE_MARGIN", "60"))
+# Send the backend only products whose competitor prices changed
+COMPETITOR_DELTAS_ONLY = os.environ.get("COMPETITOR_DELTAS_ONLY", "0") == "1"
+
+
+def job_deadline(context) -> Optional[float]:
+    """time.monotonic() by which the job has to stop starting products"""
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return None
+    remaining = context.get_remaining_time_in_millis() / 1000
+    return time.monotonic() + remaining - COMPETITOR_DEADLINE_MARGIN
+
+
+def product_query_key(product: Dict[str, Any]) -> Tuple[str, ...]:
+    """Products with the same key are scraped once per job"""
+    scheda_prodotto = product.get("scheda_prodotto")
+    if is_product_page_url(scheda_prodotto):
+        return ("scheda", scheda_prodotto)
+    categoria_id = (product.get("category") or {}).get("id", "")
+    return ("search", normalize_title(product.get("name", "")), str(categoria_id))
+
+
+def scrape_competitor_product(
+    product: Dict[str, Any], cancel_event: Optional[threading.Event] = None
+):
+    """(competitors, scheda url) of one job product, shared with its duplicates"""
+    return product_flight.do(
+        product_query_key(product), _scrape_competitor_product, product, cancel_event
+    )
+
+
+def _scrape_competitor_product(
+    product: Dict[str, Any], cancel_event: Optional[threading.Event] = None
+):
+    """(competitors, scheda url) of one job product, or (message, False)"""
+    titolo_prodotto = product.get("name", "")
+    # make titolo url encoded %20
+    titolo_prodotto = titolo_prodotto.replace(" ", "%20")
+    categoria_id = (product.get("category") or {}).get("id", "")
+    scheda_prodotto = product.get("scheda_prodotto", None)
+    scraper = SchedaProdottoScraper(
+        titolo_prodotto, categoria_id, scheda_prodotto, cancel_event=cancel_event
+    )
+    if scheda_prodotto:
+        print(f"Scheda prodotto already scraped for {titolo_prodotto}")
+        return scraper.estrai_dati_competitor()
+    print(f"Scraping scheda prodotto for {titolo_prodotto}")
+    return scraper.cerca_scheda_prodotto_estrai_dati_competitor()
+
+
+def _result(product: Dict[str, Any], scraping_result, status: str) -> Dict[str, Any]:
+    # The scraper returns (exception, False) on errors, which is not JSON
+    if isinstance(scraping_result, tuple) and isinstance(scraping_result[0], Exception):
+        scraping_result = (str(scraping_result[0]), scraping_result[1])
+    # only keep id and result_data
+    return {
+        "product_id": product.get("id", ""),
+        "scraping_result": scraping_result,
+        "status": status,
+    }
+
+
+class CompetitorPool:
+    """
+    Worker threads, concurrency slots and start pacing of competitor
+    scraping. One pool can be shared by several jobs (batch invocations),
+    so that their products together stay within the limits.
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        start_interval: float = COMPETITOR_START_INTERVAL,
+    ):
+        self.concurrency = max(1, concurrency or COMPETITOR_CONCURRENCY)
+        self.limiter = RateLimiter(start_interval)
+        self.slots = asyncio.Semaphore(self.concurrency)
+        # A timed-out product keeps its thread until its current request
+        # returns, so the pool has room for one straggler per slot
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.concurrency * 2, thread_name_prefix="competitors"
+        )
+
+    def shutdown(self) -> None:
+        # Do not wait for stragglers: they stop at their next request
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_competitor_job(
+    products: List[Dict[str, Any]],
+    concurrency: Optional[int] = None,
+    timeout: float = COMPETITOR_TIMEOUT,
+    deadline: Optional[float] = None,
+    start_interval: float = COMPETITOR_START_INTERVAL,
+    on_result: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+    pool: Optional[CompetitorPool] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Scrape the competitors of every product, at most `concurrency` at a
+    time. Products not started by `deadline` (time.monotonic()) are
+    returned with status "skipped", so that the job can still report them.
+    on_result, when given, is awaited with each result as soon as it is ready.
+    With a shared pool, its limits apply and the caller owns its caches.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(products)
+    if not products:
+        return []
+
+    own_pool = pool is None
+    if own_pool:
+        # Nothing is shared across jobs: prices move between them
+        product_flight.reset()
+        page_flight.reset()
+        pool = CompetitorPool(concurrency, start_interval)
+    queue = asyncio.Queue()
+    for index, product in enumerate(products):
+        queue.put_nowait((index, product))
+
+    loop = asyncio.get_running_loop()
+
+    async def scrape(product: Dict[str, Any]) -> Dict[str, Any]:
+        cancel_event = threading.Event()
+        product_timeout = timeout
+        if deadline is not None:
+            product_timeout = max(1.0, min(timeout, deadline - time.monotonic()))
+        started = time.perf_counter()
+        try:
+            scraping_result = await asyncio.wait_for(
+                loop.run_in_executor(
+                    pool.executor, scrape_competitor_product, product, cancel_event
+                ),
+                product_timeout,
+            )
+        except asyncio.TimeoutError:
+            cancel_event.set()
+            print(f"⏱️ Product {product.get('id')} timed out after {product_timeout:.0f}s")
+            latency_stats.observe(competitor_kind(product), time.perf_counter() - started)
+            return _result(product, (f"Timeout after {product_timeout:.0f}s", False), "timeout")
+        except Exception as e:
+            print(f"❌ Product {product.get('id')} failed: {type(e).__name__}: {e}")
+            return _result(product, (str(e), False), "failed")
+        latency_stats.observe(competitor_kind(product), time.perf_counter() - started)
+        return _result(product, scraping_result, "completed")
+
+    async def worker():
+        while True:
+            try:
+                index, product = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            async with pool.slots:
+                await pool.limiter.acquire()
+                if deadline is not None and time.monotonic() >= deadline:
+                    results[index] = _result(product, ("Job deadline reached", False), "skipped")
+                else:
+                    results[index] = await scrape(product)
+            if on_result is not None:
+                await on_result(results[index])
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(pool.concurrency, len(products)))))
+    finally:
+        if own_pool:
+            pool.shutdown()
+
+    statuses: Dict[str, int] = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    print(
+        f"Competitor job summary: {statuses} (concurrency {pool.concurrency}, "
+        f"products {product_flight.stats()}, pages {page_flight.stats()})"
+    )
+    if own_pool:
+        product_flight.reset()
+        page_flight.reset()
+    return results
+
+
+def record_prices(result: Dict[str, Any]) -> None:
+    """Store a completed result in the price history and attach its price_changes"""
+    scraping_result = result.get("scraping_result")
+    if result["status"] != "completed" or result["product_id"] in ("", None):
+        return
+    if not scraping_result or not scraping_result[1]:
+        # (message, False): blocked, proxy error, 5xx... The product was not
+        # scraped and must stay due. A page without offers is ([], url) and
+        # is recorded below with no prices.
+        return
+    prices: Dict[str, int] = {}
+    for competitor in scraping_result[0]:
+        venditore = competitor.get("venditore")
+        cents = price_to_cents(competitor.get("prezzo"))
+        if venditore and cents is not None:
+            # Cheapest offer when a competitor is listed more than once
+            prices[venditore] = min(cents, prices.get(venditore, cents))
+    result["price_changes"] = price_history.record(result["product_id"], prices)
+
+
+def backend_view(result: Dict[str, Any]) -> Dict[str, Any]:
+    """What the backend receives for a result (with COMPETITOR_DELTAS_ONLY, no unchanged lists)"""
+    # price_changes is None when the history write failed: send the full list
+    if COMPETITOR_DELTAS_ONLY and result.get("price_changes") == []:
+        return {**result, "scraping_result": None, "status": "unchanged"}
+    return result
+
+
+async def process_scraping_job(
+    scraping_job: Dict[str, Any],
+    deadline: Optional[float] = None,
+    base_url: str = BASE_API_URL,
+    pool: Optional[CompetitorPool] = None,
+) -> Dict[str, Any]:
+    """
+    Scrape a competitor job, streaming results to the backend while it
+    runs, and post the completed job; returns the job's results and whether
+    the final update was accepted
+    """
+    products = scraping_job.get("products", [])
+    async with create_session() as session:
+        # job/update has always received plain JSON
+        client = BackendClient(session, base_url=base_url, gzip_requests=False)
+        async with JobProgressReporter(client, scraping_job) as reporter:
+
+            async def on_result(result: Dict[str, Any]) -> None:
+                # SQLite write, and an S3 pull every PRICE_HISTORY_REFRESH_SECONDS:
+                # not on the event loop
+                await asyncio.to_thread(record_prices, result)
+                reporter.add(backend_view(result))
+
+            results = await run_competitor_job(
+                products, deadline=deadline, on_result=on_result, pool=pool
+            )
+            try:
+                attach_price_analytics(scraping_job, results)
+            except Exception as e:
+                print(f"⚠️ Price analytics failed: {e}")
+            await asyncio.to_thread(latency_stats.save)
+            await asyncio.to_thread(price_history.sync)
+            try:
+                await asyncio.to_thread(export_competitor_results, scraping_job, results)
+            except Exception as e:
+                print(f"⚠️ Competitor export failed: {e}")
+            updated = await reporter.finish([backend_view(result) for result in results])
+    return {"results": results, "updated": updated, "failed_updates": reporter.failed_updates}
+
+
+# Results of the current job, by product query; failures are not kept
+product_flight = SingleFlight(remember=lambda result: bool(result) and bool(result[1]))
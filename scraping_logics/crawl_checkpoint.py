@@ -0,0 +1,269 @@
+"""
+Durable progress of product crawls, so that a merchant whose crawl is cut
+short by the Lambda timeout can be resumed from the first unscraped page.
+
+The plan (URL entries without their products) is stored when a crawl
+starts, and every page is marked once its products have been uploaded.
+Two stores are available:
+- "sqlite": a local file (CHECKPOINT_PATH), for local runs and warm containers
+- "s3": an S3-compatible bucket (CHECKPOINT_BUCKET); CHECKPOINT_S3_ENDPOINT
+  points it at a local stand-in such as MinIO
+
+The default is "s3" when CHECKPOINT_BUCKET is set, "sqlite" otherwise. The
+sqlite file lives in /tmp by default, which a Lambda cold start wipes: a
+resume that lands on another container finds no checkpoint there. Only the
+S3 store is durable (see checkpoints_durable()).
+"""
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+CHECKPOINT_PATH = os.environ.get("CHECKPOINT_PATH", "/tmp/trovaprezzi/checkpoints.sqlite3")
+CHECKPOINT_BUCKET = os.environ.get("CHECKPOINT_BUCKET", "")
+CHECKPOINT_BACKEND = os.environ.get(
+    "CHECKPOINT_BACKEND", "s3" if CHECKPOINT_BUCKET else "sqlite"
+)
+CHECKPOINT_PREFIX = os.environ.get("CHECKPOINT_PREFIX", "crawl-checkpoints/")
+CHECKPOINT_S3_ENDPOINT = os.environ.get("CHECKPOINT_S3_ENDPOINT") or None
+
+# Entry fields kept in the plan; products are uploaded, not checkpointed
+PLAN_FIELDS = (
+    "page_number",
+    "url",
+    "expected_products",
+    "category_id",
+    "category_name",
+)
+
+
+def _plan_entry(url_entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: url_entry[field] for field in PLAN_FIELDS if field in url_entry}
+
+
+def _apply_progress(
+    plan: List[Dict[str, Any]], scraped: Dict[str, int]
+) -> List[Dict[str, Any]]:
+    """Rebuild run_spider_locally URL entries from a plan and the scraped pages"""
+    urls = []
+    for entry in plan:
+        done = entry["url"] in scraped
+        urls.append(
+            {
+                **entry,
+                "scraped": done,
+                "scraped_products": scraped.get(entry["url"], 0),
+                "products": [],
+            }
+        )
+    return urls
+
+
+class SQLiteCheckpointStore:
+    """Crawl checkpoints in a local SQLite file"""
+
+    # Survives only as long as the container (and its /tmp)
+    durable = False
+
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS crawl_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    venditore TEXT NOT NULL,
+                    plan TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS crawl_pages (
+                    job_id TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    scraped_products INTEGER NOT NULL,
+                    PRIMARY KEY (job_id, url)
+                );
+                """
+            )
+        return self._connection
+
+    def start(self, job_id: str, venditore: str, urls: List[Dict[str, Any]]) -> None:
+        """Store a new crawl plan, dropping any previous progress of the job"""
+        plan = json.dumps([_plan_entry(entry) for entry in urls], ensure_ascii=False)
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("DELETE FROM crawl_pages WHERE job_id = ?", (job_id,))
+                connection.execute(
+                    "INSERT OR REPLACE INTO crawl_jobs VALUES (?, ?, ?, ?)",
+                    (job_id, venditore, plan, datetime.now().isoformat()),
+                )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO crawl_pages VALUES (?, ?, ?)",
+                    (
+                        (job_id, entry["url"], entry.get("scraped_products", 0))
+                        for entry in urls
+                        if entry.get("scraped")
+                    ),
+                )
+
+    def mark_scraped(self, job_id: str, pages: List[Dict[str, Any]]) -> None:
+        """Record pages whose products have been uploaded"""
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO crawl_pages VALUES (?, ?, ?)",
+                    ((job_id, page["url"], page.get("scraped_products", 0)) for page in pages),
+                )
+                connection.execute(
+                    "UPDATE crawl_jobs SET updated_at = ? WHERE job_id = ?",
+                    (datetime.now().isoformat(), job_id),
+                )
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """{"venditore", "urls"} of an unfinished crawl, or None"""
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT venditore, plan FROM crawl_jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if not row:
+                return None
+            scraped = dict(
+                connection.execute(
+                    "SELECT url, scraped_products FROM crawl_pages WHERE job_id = ?", (job_id,)
+                ).fetchall()
+            )
+        return {"venditore": row[0], "urls": _apply_progress(json.loads(row[1]), scraped)}
+
+    def finish(self, job_id: str) -> None:
+        """Forget a crawl that completed"""
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("DELETE FROM crawl_pages WHERE job_id = ?", (job_id,))
+                connection.execute("DELETE FROM crawl_jobs WHERE job_id = ?", (job_id,))
+
+
+class S3CheckpointStore:
+    """
+    Crawl checkpoints in an S3-compatible bucket: one plan object per job and
+    one small object per batch of uploaded pages, so a checkpoint never
+    rewrites what is already stored.
+    """
+
+    durable = True
+
+    def __init__(
+        self,
+        bucket: str = CHECKPOINT_BUCKET,
+        prefix: str = CHECKPOINT_PREFIX,
+        endpoint_url: Optional[str] = CHECKPOINT_S3_ENDPOINT,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("s3", endpoint_url=self.endpoint_url)
+        return self._client
+
+    def _key(self, job_id: str, name: str) -> str:
+        return f"{self.prefix}{job_id}/{name}"
+
+    def _put(self, key: str, data: Any) -> None:
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=json.dumps(data, ensure_ascii=False).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+    def _get(self, key: str) -> Any:
+        return json.loads(self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read())
+
+    def _list(self, prefix: str) -> List[str]:
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(item["Key"] for item in page.get("Contents", []))
+        return keys
+
+    def start(self, job_id: str, venditore: str, urls: List[Dict[str, Any]]) -> None:
+        """Store a new crawl plan, dropping any previous progress of the job"""
+        self.finish(job_id)
+        self._put(
+            self._key(job_id, "plan.json"),
+            {"venditore": venditore, "plan": [_plan_entry(entry) for entry in urls]},
+        )
+        already_scraped = [entry for entry in urls if entry.get("scraped")]
+        if already_scraped:
+            self.mark_scraped(job_id, already_scraped)
+
+    def mark_scraped(self, job_id: str, pages: List[Dict[str, Any]]) -> None:
+        """Record pages whose products have been uploaded"""
+        self._put(
+            self._key(job_id, f"pages/{uuid.uuid4().hex}.json"),
+            [
+                {"url": page["url"], "scraped_products": page.get("scraped_products", 0)}
+                for page in pages
+            ],
+        )
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """{"venditore", "urls"} of an unfinished crawl, or None"""
+        try:
+            job = self._get(self._key(job_id, "plan.json"))
+        except self.client.exceptions.NoSuchKey:
+            return None
+        scraped = {}
+        for key in self._list(self._key(job_id, "pages/")):
+            for page in self._get(key):
+                scraped[page["url"]] = page["scraped_products"]
+        return {"venditore": job["venditore"], "urls": _apply_progress(job["plan"], scraped)}
+
+    def finish(self, job_id: str) -> None:
+        """Forget a crawl that completed"""
+        keys = self._list(self._key(job_id, ""))
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in keys[start:start + 1000]]},
+            )
+
+
+def create_checkpoint_store(backend: str = CHECKPOINT_BACKEND):
+    """Checkpoint store for the configured backend, or None when disabled"""
+    if backend == "s3":
+        if not CHECKPOINT_BUCKET:
+            print("⚠️ CHECKPOINT_BACKEND=s3 without CHECKPOINT_BUCKET, checkpoints disabled")
+            return None
+        return S3CheckpointStore()
+    if backend == "sqlite":
+        return SQLiteCheckpointStore()
+    return None
+
+
+def checkpoints_durable() -> bool:
+    """True when a checkpoint can be resumed from any container"""
+    return bool(getattr(checkpoint_store, "durable", False))
+
+
+# Create a global instance
+checkpoint_store = create_checkpoint_store()
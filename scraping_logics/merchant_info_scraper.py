@@ -1,24 +1,36 @@
 from bs4 import BeautifulSoup
 import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 import os
 from .request_handler import tls_scraper
+from .page_schemas import MERCHANT_PAGE, CATEGORIES_PAGE, make_soup
 
 BASE_API_URL = os.environ.get("BASE_API_URL", "http://172.17.0.1:8000")
 print(f"BASE_API_URL: {BASE_API_URL}")
+# Merchants scraped at the same time by scrape_merchants_info()
+MERCHANT_CONCURRENCY = int(os.environ.get("MERCHANT_CONCURRENCY", "4"))
+# Default of _scrape()/_scrape_categories(): fetch the page (None is a failed fetch)
+NOT_FETCHED = object()
 
 
 class MerchantInfoScraper:
     """Scraper for merchant information from TrovaPrezzi"""
     
-    def __init__(self, venditore: str):
+    def __init__(self, venditore: str, session: Optional[requests.Session] = None):
         self.venditore = venditore
         self.base_url = f"https://www.trovaprezzi.it/negozi/{venditore}#top_page"
         self.merchant_all_categories_url = f"https://www.trovaprezzi.it/negozi/{venditore}/categorie"
         self.add_merchant_info_url = f"{BASE_API_URL}/businessManager/onboarding/add-merchant-info/"
         self.merchant_data = {}
+        self.merchant_categories = []
+        self.session = session or api_session
+        # Set when the categories page is no longer needed
+        self.categories_cancelled = threading.Event()
         print(f"Initializing merchant info scraper for: {venditore}")
     
     def extract_rating_info(self, soup: BeautifulSoup) -> Dict[str, Any]:
@@ -26,21 +38,21 @@ class MerchantInfoScraper:
         rating_data = {}
         
         try:
-            rating_wrapper = soup.select_one('div.last_year_rating_wrapper')
+            rating_wrapper = MERCHANT_PAGE.select_one('rating_wrapper', soup)
             if rating_wrapper:
                 # Get rating image info
-                rating_image = rating_wrapper.select_one('.rating_image')
+                rating_image = MERCHANT_PAGE.select_one('rating_image', rating_wrapper)
                 if rating_image:
                     rating_data['rating_title'] = rating_image.get('title', '')
                     rating_data['rating_value'] = rating_image.get_text(strip=True)
 
                 # Get rating number
-                rate_nr = rating_wrapper.select_one('.rate_nr')
+                rate_nr = MERCHANT_PAGE.select_one('rate_nr', rating_wrapper)
                 if rate_nr:
                     rating_data['rate_nr'] = rate_nr.get_text(strip=True)
 
                 # Get review counter
-                counter = rating_wrapper.select_one('.counter')
+                counter = MERCHANT_PAGE.select_one('review_counter', rating_wrapper)
                 if counter:
                     rating_data['review_counter'] = counter.get_text(strip=True)
             else:
@@ -61,19 +73,19 @@ class MerchantInfoScraper:
 
         try:
             # Extract website
-            website_link = soup.select_one('a[data-ga-action="website"]')
+            website_link = MERCHANT_PAGE.select_one('website_link', soup)
             if website_link:
                 merchant_info["indirizzo web"] = website_link.get('href', '')
 
             # Extract merchant data section
-            dati_mercante = soup.select_one('section.single_section_merchant')
+            dati_mercante = MERCHANT_PAGE.select_one('merchant_section', soup)
             if dati_mercante:
                 # Find all table rows
-                rows = dati_mercante.select('div.table_row')
+                rows = MERCHANT_PAGE.select('table_row', dati_mercante)
                 for row in rows:
                     # Find label cell and value cell in each row
-                    label_cell = row.select_one('div.label_cell')
-                    value_cell = row.select_one('div.info_cell')
+                    label_cell = MERCHANT_PAGE.select_one('label_cell', row)
+                    value_cell = MERCHANT_PAGE.select_one('info_cell', row)
                     if label_cell and value_cell:
                         label = label_cell.get_text(strip=True)
                         value = value_cell.get_text(strip=True)
@@ -88,25 +100,25 @@ class MerchantInfoScraper:
                         # You can add more labels to extract here
 
             # Extract contact info
-            contact_info = soup.select_one('div.merchant_contact_info')
+            contact_info = MERCHANT_PAGE.select_one('contact_info', soup)
             if contact_info:
                 # Phone
-                phone = contact_info.select_one('div.phone')
+                phone = MERCHANT_PAGE.select_one('phone', contact_info)
                 if phone:
                     merchant_info["telefono"] = phone.get_text(strip=True)
 
                 # Email
-                email = contact_info.select_one('div.email')
+                email = MERCHANT_PAGE.select_one('email', contact_info)
                 if email:
                     merchant_info["e-mail di riferimento"] = email.get_text(strip=True)
 
                 # Address
-                address = contact_info.select_one('div.address')
+                address = MERCHANT_PAGE.select_one('address', contact_info)
                 if address:
                     merchant_info["indirizzo postale"] = address.get_text(strip=True)
 
             # Extract description
-            description = soup.select_one('p.merchant_description_info')
+            description = MERCHANT_PAGE.select_one('description', soup)
             if description:
                 merchant_info["merchant_description_info"] = description.get_text(strip=True)
 
@@ -121,7 +133,7 @@ class MerchantInfoScraper:
         logo_data = {}
         
         try:
-            logo_img = soup.select_one('img.merchant_logo')
+            logo_img = MERCHANT_PAGE.select_one('logo', soup)
             if logo_img:
                 logo_data['logo'] = logo_img.get('src', '')
                 # Get additional attributes if they exist
@@ -147,7 +159,7 @@ class MerchantInfoScraper:
             }
 
         try:
-            response = requests.post(
+            response = self.session.post(
                 self.add_merchant_info_url,
                 json={
                     "business_name": self.venditore,
@@ -177,12 +189,12 @@ class MerchantInfoScraper:
     def extract_merchant_categories(self, soup: BeautifulSoup) -> List[Dict[str, Any]]:
         """Extract merchant categories from the page"""
         categories = []
-        category_list = soup.select("div.three_columns_list ul li")
+        category_list = CATEGORIES_PAGE.select("category_item", soup)
         
         for li in category_list:
-            link = li.find('a')
+            link = CATEGORIES_PAGE.select_one('category_link', li)
             if link:
-                results_span = li.select_one('span.results_number')
+                results_span = CATEGORIES_PAGE.select_one('results_number', li)
                 results_count = results_span.text.strip('()') if results_span else '0'
                 category_id = link.get('href', '').split('category_id=')[1]
                 
@@ -201,12 +213,44 @@ class MerchantInfoScraper:
         print("all categories: ", categories)
         return categories
 
+    def _fetch(self, url: str, cancel_event: Optional[threading.Event] = None):
+        """Fetch a page; None when it could not be fetched or was cancelled"""
+        try:
+            response = tls_scraper.get_page(url, max_retries=100, cancel_event=cancel_event)
+        except Exception as e:
+            print(f"❌ Error fetching {url}: {str(e)}")
+            return None
+        if not response or response.status != 200:
+            print(f"❌ Failed to get page. Status: {getattr(response, 'status', 'Unknown')}")
+            return None
+        return response
+
+    def fetch_pages(self) -> Tuple[Future, Future]:
+        """
+        Start fetching the merchant page and the categories page at the same
+        time; both only depend on the merchant name. Returns their futures,
+        parsing is left to the caller so fetch threads only fetch.
+        """
+        return (
+            page_fetcher.submit(self._fetch, self.base_url),
+            page_fetcher.submit(
+                self._fetch, self.merchant_all_categories_url, self.categories_cancelled
+            ),
+        )
+
     def scrape(self) -> Dict[str, Any]:
         """Main scraping method"""
-        scrape_result = self._scrape()
+        merchant_page, categories_page = self.fetch_pages()
+        # The merchant page is parsed while the categories page may still be loading
+        scrape_result = self._scrape(merchant_page.result())
+        if scrape_result['status'] != 'success':
+            # The categories are only sent with the merchant info: stop their
+            # fetch (queued, or before its next retry)
+            self.categories_cancelled.set()
+            categories_page.cancel()
         if scrape_result['status'] == 'success':
             # Send data to API
-            categories_result = self._scrape_categories()
+            categories_result = self._scrape_categories(categories_page.result())
             api_result = self.send_merchant_data()
 
             return {
@@ -217,22 +261,22 @@ class MerchantInfoScraper:
 
         return scrape_result
 
-    def _scrape(self) -> Dict[str, Any]:
-        """Internal scraping method"""
+    def _scrape(self, response=NOT_FETCHED) -> Dict[str, Any]:
+        """Internal scraping method; fetches the page unless its response is given"""
         print(f"\n{'='*70}")
         print(f"Starting merchant info scrape for: {self.venditore}")
         print(f"URL: {self.base_url}")
         
         try:
             # Get the page using TLS client
-            response = tls_scraper.get_page(self.base_url, max_retries=100)
-            
-            if not response or response.status != 200:
-                print(f"❌ Failed to get page. Status: {getattr(response, 'status', 'Unknown')}")
+            if response is NOT_FETCHED:
+                response = self._fetch(self.base_url)
+
+            if not response:
                 return {"status": "error", "message": "Failed to fetch page"}
 
             # Parse the page
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = make_soup(response.text)
             
             # Extract all information
             merchant_info = self.extract_merchant_info(soup)
@@ -259,22 +303,22 @@ class MerchantInfoScraper:
                 "message": error_msg
             }
         
-    def _scrape_categories(self) -> Dict[str, Any]:
-        """Internal scraping method"""
+    def _scrape_categories(self, response=NOT_FETCHED) -> Dict[str, Any]:
+        """Internal scraping method; fetches the page unless its response is given"""
         print(f"\n{'='*70}")
         print(f"Starting merchant categories scrape for: {self.venditore}")
         print(f"URL: {self.merchant_all_categories_url}")
         
         try:
             # Get the page using TLS client
-            response = tls_scraper.get_page(self.merchant_all_categories_url, max_retries=100)
-            
-            if not response or response.status != 200:
-                print(f"❌ Failed to get page. Status: {getattr(response, 'status', 'Unknown')}")
+            if response is NOT_FETCHED:
+                response = self._fetch(self.merchant_all_categories_url)
+
+            if not response:
                 return {"status": "error", "message": "Failed to fetch page"}
 
             # Parse the page
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = make_soup(response.text)
             
             # Extract all information
             merchant_categories = self.extract_merchant_categories(soup)
@@ -303,3 +347,36 @@ def scrape_merchant_info(venditore: str) -> Dict[str, Any]:
     """Convenience function to scrape merchant info"""
     scraper = MerchantInfoScraper(venditore)
     return scraper.scrape()
+
+
+def scrape_merchants_info(
+    venditori: List[str], concurrency: int = MERCHANT_CONCURRENCY
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Scrape and send the info of several merchants, `concurrency` at a time.
+    They share the TLS session, the page fetch threads and the API session.
+    """
+    def scrape_one(venditore: str) -> Dict[str, Any]:
+        try:
+            return scrape_merchant_info(venditore)
+        except Exception as e:
+            print(f"❌ Error scraping merchant {venditore}: {str(e)}")
+            return {"status": "error", "message": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = dict(zip(venditori, pool.map(scrape_one, venditori)))
+    succeeded = sum(1 for result in results.values() if result["status"] == "success")
+    print(f"Merchant info scraped for {succeeded}/{len(results)} merchants")
+    return results
+
+
+# Create the shared sessions: the add-merchant-info POSTs reuse their
+# connections, and every merchant's two page fetches run in page_fetcher
+api_session = requests.Session()
+api_session.mount(
+    "http://", HTTPAdapter(pool_maxsize=MERCHANT_CONCURRENCY)
+)
+api_session.mount(
+    "https://", HTTPAdapter(pool_maxsize=MERCHANT_CONCURRENCY)
+)
+page_fetcher = ThreadPoolExecutor(max_workers=2 * MERCHANT_CONCURRENCY)
@@ -0,0 +1,156 @@
+"""
+End-to-end merchant onboarding in one pipelined run.
+
+The merchant page and the categories page are fetched at the same time.
+As soon as the categories are parsed their counts are planned into offer
+page URLs (no pagination walk), and the pages go through the worker pool,
+where each page is parsed in its fetch thread while the other workers keep
+fetching, and the uploader streams the offers to the backend. The merchant
+info is posted while the crawl runs. The onboarding then takes about as
+long as its longest chain (categories page → crawl) instead of the sum of
+every step.
+"""
+import asyncio
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from .crawl_checkpoint import checkpoint_store
+from .merchant_info_scraper import MerchantInfoScraper
+from .request_handler import page_flight
+from .seller_products import (
+    INCREMENTAL_SCRAPE,
+    SCRAPER_CONCURRENCY,
+    build_category_plan,
+    finish_crawl,
+    process_urls_batch,
+)
+
+
+async def _onboard(
+    venditore: str,
+    concurrency: Optional[int],
+    incremental: bool,
+    job_id: str,
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    def elapsed() -> float:
+        return round(time.perf_counter() - started, 2)
+
+    scraper = MerchantInfoScraper(venditore)
+    merchant_page, categories_page = scraper.fetch_pages()
+
+    async def merchant_info() -> Dict[str, Any]:
+        # The crawl does not depend on the merchant info: its failure is a result
+        try:
+            response = await asyncio.wrap_future(merchant_page)
+            result = await asyncio.to_thread(scraper._scrape, response)
+        except Exception as e:
+            print(f"❌ Merchant info of {venditore} failed: {e}")
+            result = {"status": "error", "message": str(e)}
+        timings["merchant_page"] = elapsed()
+        return result
+
+    # The merchant page is not needed to plan the crawl: it runs alongside
+    info_task = asyncio.create_task(merchant_info())
+    crawl_task = None
+    try:
+        response = await asyncio.wrap_future(categories_page)
+        categories_result = await asyncio.to_thread(scraper._scrape_categories, response)
+        timings["categories_page"] = elapsed()
+        if categories_result["status"] != "success":
+            # Nothing to crawl, but the merchant info still goes to the backend
+            info_result = await info_task
+            if info_result["status"] == "success":
+                await asyncio.to_thread(scraper.send_merchant_data)
+                timings["merchant_info_sent"] = elapsed()
+            return {**categories_result, "timings": timings}
+
+        urls_array = build_category_plan(venditore, categories_result["data"])
+        if urls_array:
+            if checkpoint_store is not None:
+                try:
+                    checkpoint_store.start(job_id, venditore, urls_array)
+                except Exception as e:
+                    print(f"⚠️ Could not store the crawl checkpoint, continuing without: {e}")
+            crawl_task = asyncio.create_task(
+                process_urls_batch(urls_array, venditore, concurrency, incremental, job_id)
+            )
+
+        # Post the merchant info while the offer pages are being crawled
+        info_result = await info_task
+        if info_result["status"] == "success":
+            merchant_result = await asyncio.to_thread(scraper.send_merchant_data)
+            timings["merchant_info_sent"] = elapsed()
+        else:
+            merchant_result = info_result
+
+        if crawl_task is not None:
+            urls_array = await crawl_task
+        timings["crawl"] = elapsed()
+        return {
+            "status": "success",
+            "urls_array": urls_array,
+            "merchant_info": merchant_result,
+            "categories": len(categories_result["data"]),
+            "timings": timings,
+        }
+    finally:
+        # On an error, no task may outlive the loop: stop them and wait for them
+        pending = [task for task in (info_task, crawl_task) if task is not None and not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+def onboard_merchant(
+    venditore: str,
+    concurrency: Optional[int] = None,
+    incremental: Optional[bool] = None,
+    job_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Scrape a merchant's info, categories and offers in one run. The crawl is
+    checkpointed under job_id (default: the merchant name), so
+    resume_spider() can finish it if the invocation times out (from any
+    container only with CHECKPOINT_BUCKET, see crawl_checkpoint).
+    """
+    print(f"\n=== Onboarding {venditore} ===")
+    job_id = job_id or venditore
+    # Listing pages change between runs: no page is shared with a previous job
+    page_flight.reset()
+
+    # Page workers plus the merchant and categories parsing run in threads
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    executor = ThreadPoolExecutor(max_workers=(concurrency or SCRAPER_CONCURRENCY) + 2)
+    loop.set_default_executor(executor)
+    try:
+        onboarding = loop.run_until_complete(
+            _onboard(
+                venditore,
+                concurrency,
+                INCREMENTAL_SCRAPE if incremental is None else incremental,
+                job_id,
+            )
+        )
+    except Exception as e:
+        print(f"❌ Onboarding of {venditore} failed: {e}")
+        traceback.print_exc()
+        return {"status": "error", "message": str(e)}
+    finally:
+        loop.close()
+        executor.shutdown(wait=False)
+
+    if onboarding["status"] != "success":
+        print(f"❌ Could not read the categories of {venditore}: {onboarding['message']}")
+        return onboarding
+
+    result = finish_crawl(onboarding.pop("urls_array"), venditore, job_id)
+    result.update(onboarding)
+    print(f"Onboarding timings for {venditore} (seconds from start): {result['timings']}")
+    return result
@@ -0,0 +1,235 @@
+"""
+Local snapshot of the offers uploaded for each merchant, for incremental runs.
+
+Offers are keyed by the stable id in their /goto/<id> URL and stored with a
+64-bit hash of their price and title; listing pages are stored with a hash
+of their HTML. A re-scrape then uploads only new and changed offers, reports
+the ones that disappeared, and skips unchanged pages before parsing.
+
+The default OFFER_SNAPSHOT_PATH is in /tmp, which a Lambda cold start
+wipes: on a new container the snapshot is empty and an "incremental" run
+uploads every offer (correct, just not incremental). Point
+OFFER_SNAPSHOT_PATH at a mounted file system (EFS) to keep it across
+containers.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+OFFER_SNAPSHOT_PATH = os.environ.get(
+    "OFFER_SNAPSHOT_PATH", "/tmp/trovaprezzi/offer_snapshot.sqlite3"
+)
+
+GOTO_ID_RE = re.compile(r"/goto/(\d+)")
+# Tracking parameters that change on every request for the same content
+IMPRESSION_RE = re.compile(r"impression=[^&\"'\s>]*")
+
+
+def _hash64(data: bytes) -> int:
+    # Signed so that it fits an SQLite INTEGER
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big", signed=True)
+
+
+def offer_id(url) -> Optional[int]:
+    """Stable offer id from a /goto/<id> URL, or None"""
+    match = GOTO_ID_RE.search(url or "")
+    return int(match.group(1)) if match else None
+
+
+def price_hash(record) -> int:
+    """Hash of the offer fields whose change is worth an upload"""
+    key = "\x1f".join(str(value or "") for value in (record.price, record.name, record.image))
+    return _hash64(key.encode("utf-8"))
+
+
+def page_hash(html: str) -> int:
+    """Hash of a listing page, ignoring per-request impression tokens"""
+    return _hash64(IMPRESSION_RE.sub("", html or "").encode("utf-8"))
+
+
+class OfferSnapshot:
+    """SQLite store of offer id → (price hash, page) and page → content hash"""
+
+    def __init__(self, path: str = OFFER_SNAPSHOT_PATH):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS offers (
+                    business_name TEXT NOT NULL,
+                    offer_id INTEGER NOT NULL,
+                    price_hash INTEGER NOT NULL,
+                    page_url TEXT NOT NULL,
+                    PRIMARY KEY (business_name, offer_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS pages (
+                    business_name TEXT NOT NULL,
+                    page_url TEXT NOT NULL,
+                    content_hash INTEGER NOT NULL,
+                    PRIMARY KEY (business_name, page_url)
+                ) WITHOUT ROWID;
+                """
+            )
+        return self._connection
+
+    def load(self, business_name: str) -> Tuple[Dict[int, Tuple[int, str]], Dict[str, int]]:
+        """Offers and page hashes from the merchant's previous run"""
+        try:
+            with self._lock:
+                connection = self._connect()
+                offers = {
+                    row[0]: (row[1], row[2])
+                    for row in connection.execute(
+                        "SELECT offer_id, price_hash, page_url FROM offers WHERE business_name = ?",
+                        (business_name,),
+                    )
+                }
+                pages = dict(
+                    connection.execute(
+                        "SELECT page_url, content_hash FROM pages WHERE business_name = ?",
+                        (business_name,),
+                    ).fetchall()
+                )
+            return offers, pages
+        except sqlite3.Error as e:
+            print(f"⚠️ Offer snapshot load failed: {e}")
+            return {}, {}
+
+    def save(
+        self,
+        business_name: str,
+        offers: Dict[int, Tuple[int, str]],
+        pages: Dict[str, int],
+        removed: List[int],
+    ) -> bool:
+        """Merge a run into the snapshot and drop the offers that disappeared"""
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    connection.executemany(
+                        "DELETE FROM offers WHERE business_name = ? AND offer_id = ?",
+                        ((business_name, offer) for offer in removed),
+                    )
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO offers VALUES (?, ?, ?, ?)",
+                        (
+                            (business_name, offer, hashed, page_url)
+                            for offer, (hashed, page_url) in offers.items()
+                        ),
+                    )
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO pages VALUES (?, ?, ?)",
+                        ((business_name, page_url, hashed) for page_url, hashed in pages.items()),
+                    )
+            return True
+        except sqlite3.Error as e:
+            print(f"⚠️ Offer snapshot update failed: {e}")
+            return False
+
+
+class SnapshotDiff:
+    """
+    Compares one run of a merchant against its previous snapshot.
+    Pages are checked from worker threads, so the state is lock-protected.
+    """
+
+    def __init__(self, snapshot: OfferSnapshot, business_name: str):
+        self.snapshot = snapshot
+        self.business_name = business_name
+        self.previous_offers, self.previous_pages = snapshot.load(business_name)
+        self._offers_by_page: Dict[str, List[int]] = defaultdict(list)
+        for offer, (_, page_url) in self.previous_offers.items():
+            self._offers_by_page[page_url].append(offer)
+        self.offers: Dict[int, Tuple[int, str]] = {}
+        self.pages: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.skipped_pages = 0
+        self.new_offers = 0
+        self.changed_offers = 0
+        self.unchanged_offers = 0
+        print(
+            f"Loaded snapshot for {business_name}: {len(self.previous_offers)} offers, "
+            f"{len(self.previous_pages)} pages"
+        )
+
+    def carry_over(self, page_url: str, content_hash: int) -> Optional[int]:
+        """
+        If the page is unchanged since the last run, keep its offers and
+        return how many there are; None when the page has to be parsed
+        """
+        with self._lock:
+            if self.previous_pages.get(page_url) != content_hash:
+                return None
+            self.pages[page_url] = content_hash
+            carried = self._offers_by_page.get(page_url, [])
+            for offer in carried:
+                self.offers[offer] = self.previous_offers[offer]
+            self.skipped_pages += 1
+            return len(carried)
+
+    def filter_products(self, page_url: str, content_hash: int, records: List[Any]) -> List[Any]:
+        """Record a parsed page and return its new and changed offers (OfferRecord)"""
+        upload = []
+        with self._lock:
+            self.pages[page_url] = content_hash
+            for product in records:
+                offer = offer_id(product.url)
+                if offer is None:
+                    upload.append(product)
+                    continue
+                hashed = price_hash(product)
+                self.offers[offer] = (hashed, page_url)
+                previous = self.previous_offers.get(offer)
+                if previous is None:
+                    self.new_offers += 1
+                    upload.append(product)
+                elif previous[0] != hashed:
+                    self.changed_offers += 1
+                    upload.append(product)
+                else:
+                    self.unchanged_offers += 1
+        return upload
+
+    def removed_offers(self) -> List[int]:
+        """
+        Offers last seen on a page fetched in this run that are gone now.
+        Pages that were not fetched (failed, or outside this run's URLs)
+        keep their offers.
+        """
+        with self._lock:
+            return [
+                offer
+                for offer, (_, page_url) in self.previous_offers.items()
+                if page_url in self.pages and offer not in self.offers
+            ]
+
+    def commit(self) -> bool:
+        """Persist this run into the snapshot"""
+        return self.snapshot.save(
+            self.business_name, self.offers, self.pages, self.removed_offers()
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "skipped_pages": self.skipped_pages,
+            "new_offers": self.new_offers,
+            "changed_offers": self.changed_offers,
+            "unchanged_offers": self.unchanged_offers,
+        }
+
+
+# Create a global instance
+offer_snapshot = OfferSnapshot()
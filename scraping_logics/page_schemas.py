@@ -0,0 +1,192 @@
+"""
+Selector schemas for every TrovaPrezzi page type we parse.
+
+All CSS selectors live here so that a site redesign only touches this file.
+Selectors are compiled once at import time, and fields with several
+alternatives are tried in order, starting from the one that matched last.
+"""
+import os
+from typing import Dict, List, Optional
+
+import soupsieve
+from bs4 import BeautifulSoup, Tag
+
+# BeautifulSoup tree builder used for every page ("html.parser", "lxml", ...)
+HTML_PARSER = os.environ.get("HTML_PARSER", "html.parser")
+
+
+def make_soup(markup, parser: Optional[str] = None) -> BeautifulSoup:
+    """Parse a page with the configured parser backend"""
+    return BeautifulSoup(markup, parser or HTML_PARSER)
+
+
+class SelectorChain:
+    """Ordered fallback selectors for a single field, remembering the last hit"""
+
+    def __init__(self, *selectors: str, catch_all: Optional[str] = None):
+        self.selectors = selectors
+        self.catch_all = catch_all
+        self._compiled = [soupsieve.compile(selector) for selector in selectors]
+        self._compiled_catch_all = soupsieve.compile(catch_all) if catch_all else None
+        self._preferred = 0
+
+    def _order(self):
+        # The last matching selector first, then the others in declaration order
+        preferred = self._preferred
+        yield preferred
+        for index in range(len(self._compiled)):
+            if index != preferred:
+                yield index
+
+    def select(self, node) -> List:
+        """Return the matches of the first selector that finds anything"""
+        for index in self._order():
+            matches = self._compiled[index].select(node)
+            if matches:
+                self._preferred = index
+                return matches
+        # The catch-all is never remembered, it would shadow the specific selectors
+        if self._compiled_catch_all is not None:
+            return self._compiled_catch_all.select(node)
+        return []
+
+    def select_one(self, node):
+        """Return the first match of the first selector that finds anything"""
+        for index in self._order():
+            match = self._compiled[index].select_one(node)
+            if match is not None:
+                self._preferred = index
+                return match
+        if self._compiled_catch_all is not None:
+            return self._compiled_catch_all.select_one(node)
+        return None
+
+
+class PageSchema:
+    """Named selector chains for one page type"""
+
+    def __init__(self, page_type: str, version: str, fields: Dict[str, SelectorChain]):
+        self.page_type = page_type
+        self.version = version
+        self.fields = fields
+
+    def __getitem__(self, field: str) -> SelectorChain:
+        return self.fields[field]
+
+    def select(self, field: str, node) -> List:
+        return self.fields[field].select(node)
+
+    def select_one(self, field: str, node):
+        return self.fields[field].select_one(node)
+
+    def extract(self, node, fields) -> Dict[str, Optional[Tag]]:
+        """
+        First match of each field inside node only. Meant for repeated
+        items such as offer cards: every lookup stays within the item and
+        stops at its first hit, and a missing field stays None instead of
+        shifting the other items' values.
+        """
+        return {field: self.fields[field].select_one(node) for field in fields}
+
+
+# Merchant home page: /negozi/<venditore>
+MERCHANT_PAGE = PageSchema(
+    "merchant_page",
+    version="2025.04",
+    fields={
+        "website_link": SelectorChain('a[data-ga-action="website"]'),
+        "merchant_section": SelectorChain("section.single_section_merchant"),
+        "table_row": SelectorChain("div.table_row"),
+        "label_cell": SelectorChain("div.label_cell"),
+        "info_cell": SelectorChain("div.info_cell"),
+        "contact_info": SelectorChain("div.merchant_contact_info"),
+        "phone": SelectorChain("div.phone"),
+        "email": SelectorChain("div.email"),
+        "address": SelectorChain("div.address"),
+        "description": SelectorChain("p.merchant_description_info"),
+        "rating_wrapper": SelectorChain("div.last_year_rating_wrapper"),
+        "rating_image": SelectorChain(".rating_image"),
+        "rate_nr": SelectorChain(".rate_nr"),
+        "review_counter": SelectorChain(".counter"),
+        "logo": SelectorChain("img.merchant_logo"),
+    },
+)
+
+# Merchant categories page: /negozi/<venditore>/categorie
+CATEGORIES_PAGE = PageSchema(
+    "categories_page",
+    version="2025.04",
+    fields={
+        "category_item": SelectorChain("div.three_columns_list ul li"),
+        "category_link": SelectorChain("a"),
+        "results_number": SelectorChain("span.results_number"),
+    },
+)
+
+# Merchant offers listing: /negozi/<venditore>/offerte
+OFFERS_LISTING = PageSchema(
+    "offers_listing",
+    version="2025.04",
+    fields={
+        # One offer; the fields below are read from inside each card
+        "card": SelectorChain("li.listing_item"),
+        "name": SelectorChain("a.item_name"),
+        "price": SelectorChain("div.item_total_price"),
+        "image": SelectorChain("a.item_image img"),
+        "cta": SelectorChain("div.item_actions a.cta_button"),
+        "pagination_links": SelectorChain("div.pagination a"),
+        "current_page": SelectorChain(
+            "div.pagination span.current",
+            "div.pagination .active",
+            'div.pagination [aria-current="page"]',
+        ),
+        "results_count": SelectorChain(
+            "div.results_count strong",
+            "span.results_count",
+            "div.listing_header .results_number",
+        ),
+    },
+)
+
+# Product search results and product pages: /categoria.aspx, /prezzo_*
+PRODUCT_PAGE = PageSchema(
+    "product_page",
+    version="2025.04",
+    fields={
+        "variations_container": SelectorChain("div.variations_container"),
+        # Presente anche quando la scheda non ha offerte in questo momento
+        "product_container": SelectorChain(
+            "div.listing",
+            "section.listing",
+            "ul.listing",
+            "div.product_header",
+        ),
+        "variants": SelectorChain(
+            "a.variation",
+            "div.slick-slide a",
+            "div.variation a",
+            # Ultima chance: qualsiasi link nella container delle varianti
+            catch_all="a[href]",
+        ),
+        "price": SelectorChain("div.item_total_price"),
+        "merchant": SelectorChain("div.merchant_name_and_logo"),
+        "merchant_link": SelectorChain("a"),
+        "suggestions": SelectorChain(
+            "section.search_suggestions a.suggested_product",
+            "div.desktop_sidebar a.suggested_product",
+            "a.suggested_product.variant_with_versione",
+            # Ultima chance: qualsiasi link tra i prodotti correlati
+            catch_all="div.related_products a[href]",
+        ),
+    },
+)
+
+SCHEMAS = {
+    schema.page_type: schema
+    for schema in (MERCHANT_PAGE, CATEGORIES_PAGE, OFFERS_LISTING, PRODUCT_PAGE)
+}
+
+
+def get_schema(page_type: str) -> PageSchema:
+    """Return the selector schema registered for a page type"""
+    return SCHEMAS[page_type]
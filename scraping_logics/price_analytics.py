@@ -0,0 +1,173 @@
+"""
+Price positioning of a competitor scraping job, computed with NumPy.
+
+All competitor offers of a job are loaded into flat arrays in one pass
+(offer price, owning product), sorted once by (product, price), and every
+statistic is then computed per product with segment operations instead of
+per-product Python loops: our rank, the gap to the cheapest offer, the
+number of undercutting offers and price percentiles.
+
+Our own offer is left out of the competitors. Job products only carry the
+backend id of their business ("business": 10), while competitors are
+TrovaPrezzi merchant names, so the name comes from OWN_MERCHANTS, a JSON
+object mapping business ids to merchant names ('{"10": "negozio"}').
+"""
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .columnar_export import price_to_cents
+
+PERCENTILES = (("p25", 0.25), ("median", 0.5), ("p75", 0.75))
+# Backend business id → TrovaPrezzi merchant name of our own offers
+OWN_MERCHANTS: Dict[str, str] = {
+    str(business): name
+    for business, name in json.loads(os.environ.get("OWN_MERCHANTS") or "{}").items()
+}
+
+
+def our_price_cents(product: Dict[str, Any]) -> Optional[int]:
+    """The product's own price ("10.00" from the backend) in cents"""
+    price = product.get("price")
+    if price is None:
+        return None
+    try:
+        return int(round(float(price) * 100))
+    except (TypeError, ValueError):
+        return price_to_cents(price)
+
+
+def price_positions(
+    products: List[Dict[str, Any]],
+    results: List[Dict[str, Any]],
+    own_merchant: Optional[str] = None,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Positioning of every product against its competitors, aligned with
+    `results` (None for products without competitor prices). Offers of
+    own_merchant, when given, are left out.
+    """
+    count = len(results)
+    offer_prices: List[Optional[float]] = []
+    offers_per_result: List[int] = []
+    for result in results:
+        scraping_result = result.get("scraping_result")
+        loaded = len(offer_prices)
+        # (competitors, scheda url) on success, (message, False) otherwise
+        if scraping_result and scraping_result[1]:
+            offer_prices.extend(
+                [
+                    competitor.get("prezzo")
+                    for competitor in scraping_result[0]
+                    if competitor.get("venditore") != own_merchant
+                ]
+            )
+        offers_per_result.append(len(offer_prices) - loaded)
+
+    # Euros → cents; a missing price (None → NaN) drops the offer
+    prices = np.round(np.asarray(offer_prices, dtype=np.float64) * 100)
+    product_index = np.repeat(np.arange(count, dtype=np.int64), offers_per_result)
+    valid = ~np.isnan(prices)
+    prices, product_index = prices[valid], product_index[valid]
+    # Results are in the order of the job's products; None becomes NaN
+    ours = np.array(
+        [our_price_cents(product) for product in products[:count]], dtype=np.float64
+    )
+    if ours.size < count:
+        ours = np.concatenate((ours, np.full(count - ours.size, np.nan)))
+
+    # One sort groups the offers by product, cheapest first
+    order = np.lexsort((prices, product_index))
+    prices, product_index = prices[order], product_index[order]
+    offers = np.bincount(product_index, minlength=count)
+    starts = np.concatenate(([0], np.cumsum(offers)[:-1]))
+    has_offers = offers > 0
+    safe_starts = np.where(has_offers, starts, 0)
+
+    cheapest = np.full(count, np.nan)
+    if prices.size:
+        cheapest[has_offers] = prices[safe_starts[has_offers]]
+
+    columns = {}
+    for name, q in PERCENTILES:
+        values = np.full(count, np.nan)
+        if prices.size:
+            # Linear interpolation inside each product's sorted segment
+            position = safe_starts + q * np.maximum(offers - 1, 0)
+            low = np.floor(position).astype(np.int64)
+            high = np.ceil(position).astype(np.int64)
+            interpolated = prices[low] + (prices[high] - prices[low]) * (position - low)
+            values[has_offers] = interpolated[has_offers]
+        columns[name] = values
+
+    undercutting = np.bincount(
+        product_index, weights=prices < ours[product_index], minlength=count
+    ).astype(np.int64)
+    known = ~np.isnan(ours)
+    columns["our_price"] = ours
+    columns["cheapest"] = cheapest
+    columns["gap_to_cheapest"] = ours - cheapest
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gap_pct = np.round((ours - cheapest) / cheapest * 100, 2)
+
+    # Cents → euros for the whole job at once; NaN marks a missing value
+    euros = {name: np.round(values / 100, 2).tolist() for name, values in columns.items()}
+    euros["gap_to_cheapest_pct"] = gap_pct.tolist()
+    under_list = np.where(known, undercutting, -1).tolist()
+    positions: List[Optional[Dict[str, Any]]] = []
+    for index, offer_count in enumerate(offers.tolist()):
+        if not offer_count:
+            positions.append(None)
+            continue
+        position = {
+            name: (None if values[index] != values[index] else values[index])
+            for name, values in euros.items()
+        }
+        under = under_list[index]
+        position["competitors"] = offer_count
+        position["undercutting"] = under if under >= 0 else None
+        position["our_rank"] = under + 1 if under >= 0 else None
+        positions.append(position)
+    return positions
+
+
+def own_merchant(scraping_job: Dict[str, Any]) -> Optional[str]:
+    """TrovaPrezzi merchant name of the business whose products the job scrapes"""
+    if scraping_job.get("business_name"):
+        return scraping_job["business_name"]
+    names = set()
+    businesses = set()
+    for product in scraping_job.get("products", []):
+        business = product.get("business")
+        if isinstance(business, dict):
+            if business.get("business_name"):
+                names.add(business["business_name"])
+                continue
+            business = business.get("id")
+        if business is not None:
+            businesses.add(str(business))
+            if str(business) in OWN_MERCHANTS:
+                names.add(OWN_MERCHANTS[str(business)])
+    if len(names) == 1:
+        return names.pop()
+    if names:
+        print(f"⚠️ Job {scraping_job.get('id')} mixes merchants {sorted(names)}: not excluding any")
+    elif businesses:
+        print(
+            f"⚠️ No merchant name for business {sorted(businesses)} in OWN_MERCHANTS: "
+            "our own offers count as competitors"
+        )
+    return None
+
+
+def attach_price_analytics(
+    scraping_job: Dict[str, Any], results: List[Dict[str, Any]]
+) -> None:
+    """Add a "price_analytics" entry to each result of a job"""
+    positions = price_positions(
+        scraping_job.get("products", []), results, own_merchant(scraping_job)
+    )
+    for result, position in zip(results, positions):
+        result["price_analytics"] = position
@@ -0,0 +1,433 @@
+"""
+Local history of competitor prices, for delta uploads and trend queries.
+
+Observations of (product, competitor, price) are stored run-length
+encoded: consecutive observations of the same price extend one run
+(first_seen..last_seen) instead of adding rows, and a competitor that
+stops listing a product gets a run with a NULL price. Every run therefore
+is a change, and "what changed since T" is a range scan on first_seen.
+Every completed scrape of a product is also noted in product_scrapes, so
+products without competitors (or whose page gave no prices) still have a
+last scrape time for the refresh scheduler.
+
+The SQLite file lives in PRICE_HISTORY_PATH; with PRICE_HISTORY_BUCKET it
+is shared through an S3-compatible bucket, so the history survives Lambda
+containers. Whenever the bucket copy changed (new ETag, checked at most
+every PRICE_HISTORY_REFRESH_SECONDS) it is merged into the local file, and
+sync() uploads only if the bucket still holds the copy last merged
+(conditional PUT); otherwise it merges again and retries. Containers
+therefore add to each other's history instead of replacing it.
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+PRICE_HISTORY_PATH = os.environ.get(
+    "PRICE_HISTORY_PATH", "/tmp/trovaprezzi/price_history.sqlite3"
+)
+PRICE_HISTORY_BUCKET = os.environ.get("PRICE_HISTORY_BUCKET", "")
+PRICE_HISTORY_KEY = os.environ.get("PRICE_HISTORY_KEY", "price-history/price_history.sqlite3")
+PRICE_HISTORY_S3_ENDPOINT = os.environ.get("PRICE_HISTORY_S3_ENDPOINT") or None
+# Seconds between two checks for a newer copy in PRICE_HISTORY_BUCKET
+PRICE_HISTORY_REFRESH_SECONDS = float(os.environ.get("PRICE_HISTORY_REFRESH_SECONDS", "60"))
+# Conditional uploads retried when another container uploaded first
+PRICE_HISTORY_SYNC_ATTEMPTS = 3
+
+
+def _error_code(error: Exception) -> str:
+    """S3 error code of a botocore ClientError ("" for other errors)"""
+    return str(getattr(error, "response", {}).get("Error", {}).get("Code", ""))
+
+
+class PriceHistory:
+    """SQLite store of competitor price runs per product"""
+
+    def __init__(
+        self,
+        path: str = PRICE_HISTORY_PATH,
+        bucket: str = PRICE_HISTORY_BUCKET,
+        key: str = PRICE_HISTORY_KEY,
+    ):
+        self.path = path
+        self.bucket = bucket
+        self.key = key
+        self._connection = None
+        self._client = None
+        self._lock = threading.Lock()
+        # ETag of the bucket copy last merged into the local file
+        self._etag: Optional[str] = None
+        self._checked_at: Optional[float] = None
+
+    def _s3(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("s3", endpoint_url=PRICE_HISTORY_S3_ENDPOINT)
+        return self._client
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS price_runs (
+                    product_id TEXT NOT NULL,
+                    competitor TEXT NOT NULL,
+                    price_cents INTEGER,
+                    first_seen INTEGER NOT NULL,
+                    last_seen INTEGER NOT NULL,
+                    observations INTEGER NOT NULL,
+                    PRIMARY KEY (product_id, competitor, first_seen)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS price_runs_by_time
+                    ON price_runs (first_seen);
+                CREATE TABLE IF NOT EXISTS product_scrapes (
+                    product_id TEXT PRIMARY KEY,
+                    first_scraped INTEGER NOT NULL,
+                    last_scraped INTEGER NOT NULL,
+                    scrapes INTEGER NOT NULL
+                ) WITHOUT ROWID;
+                """
+            )
+        if self.bucket and (
+            self._checked_at is None
+            or time.monotonic() - self._checked_at >= PRICE_HISTORY_REFRESH_SECONDS
+        ):
+            self._pull()
+        return self._connection
+
+    def _pull(self) -> None:
+        """Merge the bucket copy into the local file if it changed since the last merge"""
+        self._checked_at = time.monotonic()
+        conditions = {"IfNoneMatch": self._etag} if self._etag else {}
+        try:
+            response = self._s3().get_object(Bucket=self.bucket, Key=self.key, **conditions)
+        except Exception as e:
+            if _error_code(e) in ("304", "NotModified"):
+                return
+            if _error_code(e) in ("404", "NoSuchKey"):
+                print("📈 No price history in the bucket yet")
+            else:
+                print(f"⚠️ Could not check the bucket price history: {e}")
+            return
+
+        remote_path = f"{self.path}.remote"
+        try:
+            with open(remote_path, "wb") as remote_file:
+                shutil.copyfileobj(response["Body"], remote_file)
+            self._merge(remote_path)
+            self._etag = response["ETag"]
+            print(f"📈 Merged price history from s3://{self.bucket}/{self.key}")
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ Could not merge the bucket price history: {e}")
+        finally:
+            if os.path.exists(remote_path):
+                os.remove(remote_path)
+
+    def _merge(self, remote_path: str) -> None:
+        """
+        Add another copy's runs and scrapes to the local file. A run both
+        copies extended keeps the later last_seen.
+        """
+        connection = self._connection
+        connection.execute("ATTACH DATABASE ? AS remote", (remote_path,))
+        try:
+            tables = {
+                row[0]
+                for row in connection.execute(
+                    "SELECT name FROM remote.sqlite_master WHERE type = 'table'"
+                )
+            }
+            with connection:
+                if "price_runs" in tables:
+                    connection.execute(
+                        """
+                        INSERT INTO price_runs SELECT * FROM remote.price_runs WHERE true
+                        ON CONFLICT (product_id, competitor, first_seen) DO UPDATE SET
+                            last_seen = MAX(last_seen, excluded.last_seen),
+                            observations = MAX(observations, excluded.observations)
+                        """
+                    )
+                if "product_scrapes" in tables:
+                    connection.execute(
+                        """
+                        INSERT INTO product_scrapes SELECT * FROM remote.product_scrapes WHERE true
+                        ON CONFLICT (product_id) DO UPDATE SET
+                            first_scraped = MIN(first_scraped, excluded.first_scraped),
+                            last_scraped = MAX(last_scraped, excluded.last_scraped),
+                            scrapes = MAX(scrapes, excluded.scrapes)
+                        """
+                    )
+        finally:
+            connection.execute("DETACH DATABASE remote")
+
+    def _current_runs(self, connection, product_id: str) -> Dict[str, tuple]:
+        """competitor → (price_cents, first_seen) of the latest run of each competitor"""
+        rows = connection.execute(
+            """
+            SELECT competitor, price_cents, MAX(first_seen)
+            FROM price_runs WHERE product_id = ? GROUP BY competitor
+            """,
+            (product_id,),
+        )
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def _mark_scraped(self, connection, product_id: str, observed_at: int) -> None:
+        connection.execute(
+            """
+            INSERT INTO product_scrapes VALUES (?, ?, ?, 1)
+            ON CONFLICT (product_id) DO UPDATE SET
+                last_scraped = MAX(last_scraped, excluded.last_scraped),
+                scrapes = scrapes + 1
+            """,
+            (product_id, observed_at, observed_at),
+        )
+
+    def mark_scraped(self, product_id, observed_at: Optional[int] = None) -> None:
+        """Note a completed scrape of a product that gave no prices to record"""
+        observed_at = int(observed_at if observed_at is not None else time.time())
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    self._mark_scraped(connection, str(product_id), observed_at)
+        except sqlite3.Error as e:
+            print(f"⚠️ Price history update failed: {e}")
+
+    def record(
+        self,
+        product_id,
+        prices: Dict[str, Optional[int]],
+        observed_at: Optional[int] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Record one scrape of a product (competitor → price in cents) and
+        return what changed: new competitors, new prices and competitors
+        that are gone (price_cents None). None when the history could not
+        be written, so a failure is never mistaken for "no changes".
+        """
+        product_id = str(product_id)
+        observed_at = int(observed_at if observed_at is not None else time.time())
+        changes = []
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    self._mark_scraped(connection, product_id, observed_at)
+                    current = self._current_runs(connection, product_id)
+                    gone = {
+                        competitor: None
+                        for competitor, (price, _) in current.items()
+                        if price is not None and competitor not in prices
+                    }
+                    for competitor, price in {**prices, **gone}.items():
+                        previous, first_seen = current.get(competitor, (None, None))
+                        if first_seen is not None and previous == price:
+                            # Same price as the last run: extend it
+                            connection.execute(
+                                """
+                                UPDATE price_runs
+                                SET last_seen = ?, observations = observations + 1
+                                WHERE product_id = ? AND competitor = ? AND first_seen = ?
+                                """,
+                                (observed_at, product_id, competitor, first_seen),
+                            )
+                            continue
+                        if first_seen is None and price is None:
+                            continue
+                        connection.execute(
+                            "INSERT OR REPLACE INTO price_runs VALUES (?, ?, ?, ?, ?, 1)",
+                            (product_id, competitor, price, observed_at, observed_at),
+                        )
+                        changes.append(
+                            {
+                                "competitor": competitor,
+                                "price_cents": price,
+                                "previous_cents": previous,
+                            }
+                        )
+        except sqlite3.Error as e:
+            print(f"⚠️ Price history update failed: {e}")
+            return None
+        return changes
+
+    def changes_since(
+        self, since: int, product_ids: Optional[Iterable[Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Price changes after `since` (unix seconds), oldest first"""
+        query = """
+            SELECT r.product_id, r.competitor, r.price_cents, r.first_seen, (
+                SELECT p.price_cents FROM price_runs p
+                WHERE p.product_id = r.product_id AND p.competitor = r.competitor
+                  AND p.first_seen < r.first_seen
+                ORDER BY p.first_seen DESC LIMIT 1
+            )
+            FROM price_runs r WHERE r.first_seen > ?
+        """
+        params: List[Any] = [int(since)]
+        if product_ids is not None:
+            ids = [str(product_id) for product_id in product_ids]
+            if not ids:
+                return []
+            query += f" AND r.product_id IN ({', '.join('?' * len(ids))})"
+            params.extend(ids)
+        query += " ORDER BY r.first_seen"
+        try:
+            with self._lock:
+                rows = self._connect().execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            print(f"⚠️ Price history query failed: {e}")
+            return []
+        return [
+            {
+                "product_id": row[0],
+                "competitor": row[1],
+                "price_cents": row[2],
+                "changed_at": row[3],
+                "previous_cents": row[4],
+            }
+            for row in rows
+            # Two merged copies can start the same price twice: not a change
+            if row[2] != row[4]
+        ]
+
+    def history(self, product_id, competitor: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Price runs of a product (optionally one competitor), oldest first"""
+        query = (
+            "SELECT competitor, price_cents, first_seen, last_seen, observations "
+            "FROM price_runs WHERE product_id = ?"
+        )
+        params: List[Any] = [str(product_id)]
+        if competitor is not None:
+            query += " AND competitor = ?"
+            params.append(competitor)
+        query += " ORDER BY first_seen"
+        with self._lock:
+            rows = self._connect().execute(query, params).fetchall()
+        return [
+            {
+                "competitor": row[0],
+                "price_cents": row[1],
+                "first_seen": row[2],
+                "last_seen": row[3],
+                "observations": row[4],
+            }
+            for row in rows
+        ]
+
+    def activity(self, product_ids: Iterable[Any]) -> Dict[str, Dict[str, int]]:
+        """
+        Per product ever scraped: price changes recorded (new runs after a
+        competitor's first one), the first and last observation times and
+        the last scrape time
+        """
+        ids = [str(product_id) for product_id in product_ids]
+        activity: Dict[str, Dict[str, int]] = {}
+        try:
+            with self._lock:
+                connection = self._connect()
+                # Chunked to stay under SQLite's bound parameter limit
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    rows = connection.execute(
+                        f"""
+                        SELECT product_id, COUNT(*) - COUNT(DISTINCT competitor),
+                               MIN(first_seen), MAX(last_seen)
+                        FROM price_runs WHERE product_id IN ({', '.join('?' * len(chunk))})
+                        GROUP BY product_id
+                        """,
+                        chunk,
+                    )
+                    for row in rows:
+                        activity[row[0]] = {
+                            "changes": row[1],
+                            "first_seen": row[2],
+                            "last_seen": row[3],
+                            # Runs recorded before product_scrapes existed
+                            "last_scraped": row[3],
+                        }
+                    rows = connection.execute(
+                        f"""
+                        SELECT product_id, first_scraped, last_scraped
+                        FROM product_scrapes WHERE product_id IN ({', '.join('?' * len(chunk))})
+                        """,
+                        chunk,
+                    )
+                    for product_id, first_scraped, last_scraped in rows:
+                        entry = activity.setdefault(
+                            product_id,
+                            {"changes": 0, "first_seen": first_scraped, "last_seen": last_scraped},
+                        )
+                        entry["first_seen"] = min(entry["first_seen"], first_scraped)
+                        entry["last_seen"] = max(entry["last_seen"], last_scraped)
+                        entry["last_scraped"] = max(entry.get("last_scraped", 0), last_scraped)
+        except sqlite3.Error as e:
+            print(f"⚠️ Price history query failed: {e}")
+        return activity
+
+    def prune(self, before: int) -> int:
+        """
+        Drop runs that ended before `before`, keeping the latest run of
+        every competitor; returns the number of runs removed
+        """
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    cursor = connection.execute(
+                        """
+                        DELETE FROM price_runs
+                        WHERE last_seen < ? AND first_seen < (
+                            SELECT MAX(l.first_seen) FROM price_runs l
+                            WHERE l.product_id = price_runs.product_id
+                              AND l.competitor = price_runs.competitor
+                        )
+                        """,
+                        (int(before),),
+                    )
+                return cursor.rowcount
+        except sqlite3.Error as e:
+            print(f"⚠️ Price history prune failed: {e}")
+            return 0
+
+    def sync(self) -> None:
+        """
+        Upload the history to PRICE_HISTORY_BUCKET, when configured. The
+        upload only replaces the copy last merged; if another container
+        uploaded in between, its copy is merged first.
+        """
+        if not self.bucket or self._connection is None:
+            return
+        try:
+            with self._lock:
+                s3 = self._s3()
+                for _ in range(PRICE_HISTORY_SYNC_ATTEMPTS):
+                    self._pull()
+                    with open(self.path, "rb") as local_file:
+                        body = local_file.read()
+                    conditions = {"IfMatch": self._etag} if self._etag else {"IfNoneMatch": "*"}
+                    try:
+                        response = s3.put_object(
+                            Bucket=self.bucket, Key=self.key, Body=body, **conditions
+                        )
+                    except Exception as e:
+                        if _error_code(e) in ("412", "PreconditionFailed", "409", "ConditionalRequestConflict"):
+                            print("📈 Price history changed in the bucket, merging again")
+                            continue
+                        raise
+                    self._etag = response["ETag"]
+                    print(f"📈 Saved price history to s3://{self.bucket}/{self.key}")
+                    return
+            print("⚠️ Price history not uploaded: the bucket copy kept changing")
+        except Exception as e:
+            print(f"⚠️ Could not upload price history: {e}")
+
+
+# Create a global instance
+price_history = PriceHistory()
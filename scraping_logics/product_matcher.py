@@ -0,0 +1,136 @@
+"""
+Scoring of candidate product links (variants, suggestions) against a query title.
+
+The query is tokenized once; every candidate is then scored with a set
+intersection instead of re-running regexes and substring scans per keyword.
+"""
+import re
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple
+from urllib.parse import unquote
+
+# Codici modello come 9B9R8EA o 55UQ75-006
+MODEL_CODE_RE = re.compile(r"[A-Z0-9]{5,}(?:\-[A-Z0-9]+)?")
+TOKEN_RE = re.compile(r"[^\W_]+")
+# Taglie e unità (128GB, 10000MAH, 65W): non sono codici modello
+SIZE_RE = re.compile(
+    r"\d+(?:[.,]\d+)?(?:gb|tb|mb|kb|mah|kwh|wh|kw|w|v|mm|cm|m|ml|cl|l|kg|mg|g|"
+    r"ghz|mhz|khz|hz|mp|pz|pcs)",
+    re.IGNORECASE,
+)
+
+
+def tokenize(text: str) -> FrozenSet[str]:
+    """Lowercase word tokens of a title"""
+    return frozenset(TOKEN_RE.findall(text.lower()))
+
+
+def is_model_code(code: str) -> bool:
+    """Letters and digits together, and not a size (brand names and 10000 are not codes)"""
+    return (
+        any(ch.isdigit() for ch in code)
+        and any(ch.isalpha() for ch in code)
+        and not SIZE_RE.fullmatch(code)
+    )
+
+
+def extract_model_codes(text: str) -> Tuple[str, ...]:
+    """Model codes found in a title, lowercased"""
+    return tuple(
+        dict.fromkeys(
+            code.lower() for code in MODEL_CODE_RE.findall(text) if is_model_code(code)
+        )
+    )
+
+
+def size_tokens(tokens: Iterable[str]) -> FrozenSet[str]:
+    """Sizes and units among a title's tokens (128gb, 500ml)"""
+    return frozenset(token for token in tokens if SIZE_RE.fullmatch(token))
+
+
+class ProductMatcher:
+    """Ranks candidate product links by similarity to one query title"""
+
+    MODEL_CODE_BOOST = 10
+    ACTIVE_BONUS = 0.5
+
+    def __init__(self, query: str):
+        # Titles arrive URL-encoded from the handler ("Named%20Tea%20Tree")
+        self.query = unquote(query or "")
+        self.keywords = tokenize(self.query)
+        self.model_codes = extract_model_codes(self.query)
+
+    def score(self, title: str, url: str = "", active: bool = False) -> float:
+        """Token overlap + Jaccard similarity, boosted by model code matches"""
+        title_tokens = tokenize(title)
+        overlap = len(self.keywords & title_tokens)
+        union = len(self.keywords | title_tokens)
+        score = overlap + (overlap / union if union else 0.0)
+
+        if self.model_codes:
+            haystack = f"{title} {url}".lower()
+            score += self.MODEL_CODE_BOOST * sum(
+                1 for code in self.model_codes if code in haystack
+            )
+        if active:
+            score += self.ACTIVE_BONUS
+        return score
+
+    def rank(self, candidates: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Score every candidate ({"title", "url", "active"}) and return them
+        best first, each with its "score" added. Ties keep page order.
+        """
+        ranked = []
+        for candidate in candidates:
+            if not candidate.get("title") or not candidate.get("url"):
+                continue
+            ranked.append(
+                {
+                    **candidate,
+                    "score": self.score(
+                        candidate["title"], candidate["url"], candidate.get("active", False)
+                    ),
+                }
+            )
+        ranked.sort(key=lambda candidate: candidate["score"], reverse=True)
+        return ranked
+
+    def same_product(self, title: str) -> bool:
+        """
+        True when title names the same model as the query: the same model
+        codes, at least one other word in common and no conflicting size
+        """
+        if not self.model_codes or set(extract_model_codes(title)) != set(self.model_codes):
+            return False
+        title_tokens = tokenize(title)
+        code_tokens = tokenize(" ".join(self.model_codes))
+        if not (self.keywords - code_tokens) & (title_tokens - code_tokens):
+            return False
+        query_sizes, title_sizes = size_tokens(self.keywords), size_tokens(title_tokens)
+        return not (query_sizes and title_sizes and query_sizes != title_sizes)
+
+    def best(self, candidates: Iterable[Dict[str, Any]]):
+        """Best candidate with a positive score, or None"""
+        ranked = self.rank(candidates)
+        if ranked and ranked[0]["score"] > 0:
+            return ranked[0]
+        return None
+
+
+def link_candidates(links, detect_active: bool = False) -> List[Dict[str, Any]]:
+    """Turn <a> tags into matcher candidates"""
+    candidates = []
+    for link in links:
+        active = False
+        if detect_active:
+            active = "active" in link.get("class", []) or bool(
+                link.parent and "active" in link.parent.get("class", [])
+            )
+        candidates.append(
+            {
+                "title": link.get("title") or link.text.strip(),
+                "url": link.get("href"),
+                "active": active,
+            }
+        )
+    return candidates
@@ -0,0 +1,39 @@
+"""
+Spacing of outgoing requests shared by threads and coroutines.
+
+A RateLimiter hands out start slots at least `interval` seconds apart.
+Reserving a slot never blocks; the caller then sleeps until its slot, with
+time.sleep() in a worker thread or asyncio.sleep() on the event loop.
+"""
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """Minimum interval between consecutive starts"""
+
+    def __init__(self, interval: float):
+        self.interval = max(0.0, interval)
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Book the next free slot; returns the seconds to wait for it"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+            return slot - now
+
+    def wait(self) -> None:
+        """Blocking wait, for worker threads"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire(self) -> None:
+        """Non-blocking wait, for coroutines"""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,102 @@
+"""
+Volatility-driven refresh scheduling for competitor monitoring.
+
+Each product's refresh interval follows how often its competitor prices
+actually changed in the price history: the expected number of changes
+between two refreshes is kept near REFRESH_TARGET_CHANGES, within
+[REFRESH_MIN_HOURS, REFRESH_MAX_HOURS]. Products never scraped are due at
+once. Due products are ordered by how overdue they are, and the next
+batch is cut to a budget of proxied requests. "Never scraped" means no
+successful scrape: a failed one leaves the product due, while a product
+page with no competitors counts as scraped.
+"""
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from .price_history import PriceHistory, price_history
+from .shard_planner import competitor_kind
+
+REFRESH_MIN_HOURS = float(os.environ.get("REFRESH_MIN_HOURS", "6"))
+REFRESH_MAX_HOURS = float(os.environ.get("REFRESH_MAX_HOURS", "336"))
+# Price changes we accept to miss between two refreshes of a product
+REFRESH_TARGET_CHANGES = float(os.environ.get("REFRESH_TARGET_CHANGES", "0.5"))
+# Prior for products with little history: one change per this many days
+REFRESH_PRIOR_DAYS = float(os.environ.get("REFRESH_PRIOR_DAYS", "7"))
+
+# Proxied requests per product: a known product page, or a search that
+# may follow variants and suggestions
+REQUEST_COST = {"competitor_direct": 1, "competitor_search": 3}
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+def change_rate(activity: Optional[Dict[str, int]]) -> float:
+    """Price changes per day, smoothed with a one-change prior"""
+    if not activity:
+        return 1 / REFRESH_PRIOR_DAYS
+    span_days = max(0, activity["last_seen"] - activity["first_seen"]) / DAY
+    return (activity["changes"] + 1) / (span_days + REFRESH_PRIOR_DAYS)
+
+
+def refresh_interval(rate: float) -> float:
+    """Seconds between refreshes for a change rate (per day)"""
+    hours = REFRESH_TARGET_CHANGES / max(rate, 1e-9) * 24
+    return min(REFRESH_MAX_HOURS, max(REFRESH_MIN_HOURS, hours)) * HOUR
+
+
+def plan_refresh(
+    products: List[Dict[str, Any]],
+    request_budget: int,
+    now: Optional[float] = None,
+    history: Optional[PriceHistory] = None,
+) -> Dict[str, Any]:
+    """
+    Pick the products to scrape next within request_budget requests.
+    Returns {"batch": products, "schedule": per product {"interval",
+    "next_due", "priority", "due"}, "requests": cost of the batch}.
+    """
+    history = history or price_history
+    now = time.time() if now is None else now
+    activity = history.activity(product.get("id") for product in products)
+
+    schedule: Dict[str, Dict[str, Any]] = {}
+    candidates = []
+    for position, product in enumerate(products):
+        product_id = str(product.get("id"))
+        product_activity = activity.get(product_id)
+        rate = change_rate(product_activity)
+        interval = refresh_interval(rate)
+        if product_activity is None:
+            # Never scraped: due now, ahead of everything else
+            next_due, priority = now, float("inf")
+        else:
+            next_due = product_activity["last_scraped"] + interval
+            priority = (now - product_activity["last_scraped"]) / interval
+        due = next_due <= now
+        schedule[product_id] = {
+            "interval_hours": round(interval / HOUR, 1),
+            "changes_per_day": round(rate, 3),
+            "next_due": int(next_due),
+            "priority": None if priority == float("inf") else round(priority, 3),
+            "due": due,
+        }
+        if due:
+            candidates.append((-priority, -rate, position, product))
+
+    # Most overdue first; among equals the more volatile, then job order
+    candidates.sort(key=lambda candidate: candidate[:3])
+    batch, spent = [], 0
+    for _, _, _, product in candidates:
+        cost = REQUEST_COST[competitor_kind(product)]
+        if spent + cost > request_budget:
+            continue
+        batch.append(product)
+        spent += cost
+
+    print(
+        f"Refresh plan: {len(candidates)}/{len(products)} due, "
+        f"{len(batch)} selected for {spent}/{request_budget} requests"
+    )
+    return {"batch": batch, "schedule": schedule, "requests": spent}
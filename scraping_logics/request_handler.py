@@ -10,6 +10,7 @@ from twisted.web.client import ResponseFailed
 import os
 import json
 import random
+import re
 import scrapy.spidermiddlewares.httperror
 from twisted.internet.task import deferLater  # NEW import
 import tls_client
@@ -27,6 +28,7 @@ import time
 import string
 from datetime import datetime, timedelta
 from urllib.parse import quote
+from .single_flight import SingleFlight
 # For handling responses from various libraries
 class CustomResponse:
     """A custom response wrapper for compatibility between different HTTP libraries"""
@@ -52,6 +54,45 @@ class ScraperResponse:
         self.body = text.encode("utf-8") if isinstance(text, str) else text
 
 
+# Anti-bot pages are recognised by their structure, never by words in the body:
+# a review or a script of a real product page may well say "captcha" or "blocked".
+# DataDome shows its challenge in an iframe from captcha-delivery.com,
+# Cloudflare in a form with id "challenge-form" under a "Just a moment..." title.
+CAPTCHA_FRAME_RE = re.compile(
+    r"<iframe\b[^>]*\bsrc=[\"'][^\"']*captcha-delivery\.com", re.IGNORECASE
+)
+CAPTCHA_FORM_RE = re.compile(
+    r"<form\b[^>]*\bid=[\"'](?:challenge-form|captcha-form)[\"']", re.IGNORECASE
+)
+PAGE_TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+# The whole title has to be one of these: a product may be called "Blocked ..."
+CAPTCHA_TITLE_RE = re.compile(r"\s*(?:just a moment(?:\.*|…)|captcha)\s*", re.IGNORECASE)
+BLOCKED_TITLE_RE = re.compile(
+    r"\s*(?:access denied|accesso negato|(?:403 )?forbidden|blocked"
+    r"|you have been blocked|attention required!?(?: \| cloudflare)?)\s*",
+    re.IGNORECASE,
+)
+
+
+def is_blocked_page(response_text):
+    """
+    Return why a page looks like an anti-bot page ("captcha" or "blocked"),
+    or None if it looks like regular content
+    """
+    if not response_text:
+        return None
+    if CAPTCHA_FRAME_RE.search(response_text) or CAPTCHA_FORM_RE.search(response_text):
+        return "captcha"
+    title = PAGE_TITLE_RE.search(response_text)
+    if title:
+        title_text = title.group(1)
+        if CAPTCHA_TITLE_RE.fullmatch(title_text):
+            return "captcha"
+        if BLOCKED_TITLE_RE.fullmatch(title_text):
+            return "blocked"
+    return None
+
+
 def generate_browser_fingerprint():
     """
     Generates a highly realistic browser fingerprint that closely matches real Chrome browser behavior
@@ -622,7 +663,7 @@ class TLS_Scraper:
         self.clear_cache()
         print("Client completely reset for fresh requests")
 
-    def get_page(self, url, page_number=None, max_retries=100):
+    def get_page(self, url, page_number=None, max_retries=100, cancel_event=None):
         """
         Get a page with retry mechanism for 403 statuses.
 
@@ -630,6 +671,7 @@ class TLS_Scraper:
             url: URL to fetch
             page_number: Optional page number for pagination
             max_retries: Maximum number of retries before giving up (default: 10)
+            cancel_event: Optional threading.Event; once set, no further attempt is made
 
         Returns:
             ScraperResponse object or None if failed
@@ -638,6 +680,9 @@ class TLS_Scraper:
         last_response = None
         # self.update_proxies_with_proxybroker()
         while retries <= max_retries:
+            if cancel_event is not None and cancel_event.is_set():
+                print(f"🛑 TLS_Scraper: Fetch cancelled after {retries} attempts: {url}")
+                return None
             if retries > 0:
                 print(f"\n{'='*70}")
                 print(f"🔄 RETRY ATTEMPT {retries}/{max_retries} FOR 403 FORBIDDEN")
@@ -811,7 +856,8 @@ class TLS_Scraper:
                         response_text = ""
 
                     # Check for CAPTCHA or blocking
-                    if "captcha" in response_text.lower():
+                    block_reason = is_blocked_page(response_text)
+                    if block_reason == "captcha":
                         print("⚠️ CAPTCHA detected in response!")
                         # If captcha detected and we have retries left, try again with new proxy
                         if retries < max_retries:
@@ -831,10 +877,7 @@ class TLS_Scraper:
                             last_response = response
                             continue
 
-                    if (
-                        "blocked" in response_text.lower()
-                        or "banned" in response_text.lower()
-                    ):
+                    if block_reason == "blocked":
                         print("⚠️ IP possibly blocked!")
                         # If blocking detected and we have retries left, try again with new proxy
                         if retries < max_retries:
@@ -964,6 +1007,33 @@ class TLS_Scraper:
 # Create a global instance
 tls_scraper = TLS_Scraper()
 
+# Pages fetched successfully during the current job, shared by concurrent
+# requests for the same URL (competitor jobs reset it when they start)
+PAGE_FLIGHT_CACHE = int(os.environ.get("PAGE_FLIGHT_CACHE", "32"))
+page_flight = SingleFlight(
+    max_results=PAGE_FLIGHT_CACHE,
+    remember=lambda response: bool(response) and response.status == 200,
+)
+
+
+class _FetchCancelled:
+    """Result of a shared fetch given up because its caller was cancelled"""
+
+    def __bool__(self):
+        return False
+
+
+FETCH_CANCELLED = _FetchCancelled()
+
+
+def _get_page(url, page_number, max_retries, cancel_event):
+    response = tls_scraper.get_page(
+        url, page_number, max_retries=max_retries, cancel_event=cancel_event
+    )
+    if response is None and cancel_event is not None and cancel_event.is_set():
+        return FETCH_CANCELLED
+    return response
+
 
 # Legacy code below
 class CustomRetryMiddleware(RetryMiddleware):
@@ -1165,6 +1235,7 @@ def get_page_content(
     callback=None,
     is_first_request=True,
     max_retries=100,
+    cancel_event=None,
 ):
     """
     Function to get a page content using TLS client or Scrapy
@@ -1177,6 +1248,7 @@ def get_page_content(
         callback: Callback function to process response (optional)
         is_first_request: Whether this is the first request in a sequence (optional)
         max_retries: Maximum number of retries for 403 errors (default 10)
+        cancel_event: Optional threading.Event; once set, the fetch stops retrying
 
     Returns:
         bool: Success status
@@ -1194,7 +1266,17 @@ def get_page_content(
     # Use the TLS client approach instead of Scrapy
     try:
         # Get the page using TLS client
-        response = tls_scraper.get_page(url, page_number, max_retries=max_retries)
+        # Identical URLs requested concurrently share one fetch
+        response = page_flight.do(
+            url, _get_page, url, page_number, max_retries, cancel_event
+        )
+        # The shared fetch was given up by another caller: fetch it again
+        while response is FETCH_CANCELLED and not (
+            cancel_event is not None and cancel_event.is_set()
+        ):
+            response = page_flight.do(
+                url, _get_page, url, page_number, max_retries, cancel_event
+            )
 
         if response:
             # Print response summary with highlighted status code
@@ -0,0 +1,151 @@
+"""
+Local index of resolved TrovaPrezzi product pages (schede prodotto).
+
+Maps a normalized product title, or a model code, plus the category id to
+the product page URL that a previous search resolved to, so repeat jobs can
+skip the free-text search and the variant/suggestion hops. A model code hit
+is only used when ProductMatcher confirms that the title it was recorded
+for names the same product.
+
+The default SCHEDA_INDEX_PATH is in /tmp, which a Lambda cold start wipes:
+the index then only lasts as long as a warm container, and a new container
+starts empty and falls back to searching. Point SCHEDA_INDEX_PATH at a
+mounted file system (EFS) for an index shared across containers.
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional
+from urllib.parse import unquote
+
+from .product_matcher import ProductMatcher, extract_model_codes, tokenize
+
+SCHEDA_INDEX_PATH = os.environ.get(
+    "SCHEDA_INDEX_PATH", "/tmp/trovaprezzi/scheda_index.sqlite3"
+)
+
+
+def normalize_title(titolo_prodotto: str) -> str:
+    """Order-insensitive key for a product title"""
+    return " ".join(sorted(tokenize(unquote(titolo_prodotto or ""))))
+
+
+def is_product_page_url(url) -> bool:
+    """True for resolved product pages, False for free-text search URLs"""
+    return bool(url) and isinstance(url, str) and "libera=" not in url
+
+
+class SchedaIndex:
+    """SQLite-backed title/model code → product page URL index"""
+
+    def __init__(self, path: str = SCHEDA_INDEX_PATH):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS scheda_by_title (
+                    title_key TEXT NOT NULL,
+                    category_id TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (title_key, category_id)
+                );
+                CREATE TABLE IF NOT EXISTS scheda_by_model (
+                    model_code TEXT NOT NULL,
+                    category_id TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (model_code, category_id)
+                );
+                """
+            )
+            columns = [
+                row[1] for row in self._connection.execute("PRAGMA table_info(scheda_by_model)")
+            ]
+            if "title" not in columns:
+                # Title the code was recorded for; rows from before have none and never match
+                self._connection.execute("ALTER TABLE scheda_by_model ADD COLUMN title TEXT")
+        return self._connection
+
+    def lookup(self, titolo_prodotto: str, categoria_id=None) -> Optional[str]:
+        """Return the indexed product page URL for a title, or None"""
+        title_key = normalize_title(titolo_prodotto)
+        if not title_key:
+            return None
+        category = str(categoria_id or "")
+        try:
+            with self._lock:
+                connection = self._connect()
+                row = connection.execute(
+                    "SELECT url FROM scheda_by_title WHERE title_key = ? AND category_id = ?",
+                    (title_key, category),
+                ).fetchone()
+                if row:
+                    return row[0]
+
+                # Same model code in the same category, confirmed on the titles
+                matcher = ProductMatcher(titolo_prodotto)
+                for model_code in matcher.model_codes:
+                    row = connection.execute(
+                        "SELECT url, title FROM scheda_by_model "
+                        "WHERE model_code = ? AND category_id = ?",
+                        (model_code, category),
+                    ).fetchone()
+                    if row and row[1] and matcher.same_product(row[1]):
+                        return row[0]
+        except sqlite3.Error as e:
+            print(f"⚠️ Scheda index lookup failed: {e}")
+        return None
+
+    def record(self, titolo_prodotto: str, categoria_id, url: str) -> bool:
+        """Remember the product page a title resolved to"""
+        title_key = normalize_title(titolo_prodotto)
+        if not title_key or not is_product_page_url(url):
+            return False
+        category = str(categoria_id or "")
+        now = datetime.now().isoformat()
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO scheda_by_title VALUES (?, ?, ?, ?)",
+                        (title_key, category, url, now),
+                    )
+                    title = unquote(titolo_prodotto)
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO scheda_by_model "
+                        "(model_code, category_id, url, updated_at, title) VALUES (?, ?, ?, ?, ?)",
+                        [
+                            (model_code, category, url, now, title)
+                            for model_code in extract_model_codes(title)
+                        ],
+                    )
+            return True
+        except sqlite3.Error as e:
+            print(f"⚠️ Scheda index update failed: {e}")
+            return False
+
+    def forget(self, url: str) -> None:
+        """Drop every entry pointing at a product page that no longer resolves"""
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    connection.execute("DELETE FROM scheda_by_title WHERE url = ?", (url,))
+                    connection.execute("DELETE FROM scheda_by_model WHERE url = ?", (url,))
+        except sqlite3.Error as e:
+            print(f"⚠️ Scheda index cleanup failed: {e}")
+
+
+# Create a global instance
+scheda_index = SchedaIndex()
@@ -4,82 +4,153 @@ import json
 import requests
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
 import traceback
+import re
+import sys
 import time
 import random
 import asyncio
 import aiohttp
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional
 import os
-from .request_handler import get_page_content, tls_scraper
+from .request_handler import get_page_content, page_flight, tls_scraper
+from .page_schemas import OFFERS_LISTING, make_soup
+from .backend_client import BackendClient, ProductUploader, create_session
+from .offer_snapshot import SnapshotDiff, offer_snapshot, page_hash
+from .crawl_checkpoint import checkpoint_store, checkpoints_durable
+from .shard_planner import latency_stats
+from .columnar_export import OfferExporter, export_enabled
 BASE_API_URL = os.environ.get("BASE_API_URL", "http://172.17.0.1:8000")
 print(f"BASE_API_URL: {BASE_API_URL}")
+# Number of offer pages fetched at the same time
+SCRAPER_CONCURRENCY = int(os.environ.get("SCRAPER_CONCURRENCY", "20"))
+# Offers shown on each listing page
+OFFERS_PER_PAGE = 20
+# Safety cap for last page discovery
+MAX_LISTING_PAGES = int(os.environ.get("MAX_LISTING_PAGES", "5000"))
+# Upload only new/changed offers compared with the previous run
+INCREMENTAL_SCRAPE = os.environ.get("INCREMENTAL_SCRAPE", "0") == "1"
 # Try both import styles to ensure compatibility
 
 
 
+# Prezzo come "1.234,56" dentro "Tot. 1.234,56 € incl. sped."
+PRICE_RE = re.compile(r"((?:\d+\.)*\d+,\d+)")
+CARD_FIELDS = ("name", "price", "image", "cta")
+
+
+class OfferRecord:
+    """
+    One scraped offer. Merchant and category strings are interned and the
+    timestamp is shared by every offer of a page, so a record costs little
+    more than its own name, price and URLs.
+    """
+
+    __slots__ = (
+        "name", "price", "url", "image", "page", "merchant", "category", "category_name", "scraped_at"
+    )
+
+    def __init__(self, name, price, url, image, page, merchant, category, scraped_at, category_name=None):
+        self.name = name
+        self.price = price
+        self.url = url
+        self.image = image
+        self.page = page
+        self.merchant = merchant
+        self.category = category
+        self.category_name = category_name
+        self.scraped_at = scraped_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The product as the backend's add-products endpoint expects it"""
+        product = {
+            "Nome Prodotto": self.name,
+            "Prezzo Totale": self.price,
+            "Nome venditore": self.merchant,
+            "URL": self.url,
+            "Image URL": self.image,
+            "Data Scraping": self.scraped_at,
+            "Pagina": self.page,
+        }
+        if self.category:
+            product["nome categoria"] = self.category_name or self.category
+            product["id categoria"] = self.category
+        return product
+
+
 class TrovaPrezziScraper:
-    def __init__(self, venditore, categoria=None):
-        self.venditore = venditore
-        self.categoria = categoria
-        self.products = []
+    def __init__(self, venditore, categoria=None, nome_categoria=None):
+        self.venditore = sys.intern(venditore)
+        self.categoria = sys.intern(str(categoria)) if categoria else None
+        self.nome_categoria = sys.intern(nome_categoria) if nome_categoria else None
+        # Offers of the last parsed page only; pages are streamed, not accumulated
+        self.products: List[OfferRecord] = []
         self.total_products = 0
+        # Cards missing one of CARD_FIELDS (they used to shift the zipped lists)
+        self.incomplete_cards = 0
         self.pages_scraped = 0
         self.total_pages = 0
         print(f"Initializing scraper for vendor: {venditore}, category: {categoria}")
 
-    def parse_products(self, response):
+    def iter_products(self, response) -> Iterator[OfferRecord]:
+        """Yield the offers of a listing page as compact records"""
         print(f"\nParsing response from: {response.url}")
         print(f"Response status: {response.status}")
 
-        soup = BeautifulSoup(response.text, "html.parser")
-        product_names = soup.select("a.item_name")
-        product_prices = soup.select("div.item_total_price")
-        product_images = soup.select("a.item_image img")
-        product_redirect_urls = soup.select("div.item_actions a.cta_button")
+        soup = make_soup(response.text)
+        cards = OFFERS_LISTING.select("card", soup)
         current_page = response.meta.get("page_number", 1)
         print(f"Processing page {current_page}")
         self.pages_scraped += 1
 
-        if not product_names or not product_prices:
+        if not cards:
             print(f"No products found on page {current_page}")
             return
 
-        print(f"Found {len(product_names)} products on page {current_page}")
+        print(f"Found {len(cards)} products on page {current_page}")
 
+        # Every field is read from inside its own card, so a missing image
+        # or button only affects that offer
+        scraped_at = datetime.now().isoformat()
         products_on_page = 0
-        for name, price, image, redirect_url in zip(product_names, product_prices, product_images, product_redirect_urls):
-            product_name = name.get_text(strip=True)
+        for card in cards:
+            fields = OFFERS_LISTING.extract(card, CARD_FIELDS)
+            name, price = fields["name"], fields["price"]
+            if not all(fields.values()):
+                self.incomplete_cards += 1
+            if name is None or price is None:
+                print(f"⚠️ Skipping an offer card without name or price on page {current_page}")
+                continue
+
             price_raw = price.get_text(" ", strip=True)
-            image_url = image.get("src") if image else None
-            redirect_url = redirect_url.get("href") if redirect_url else None
-            import re
-
-            match = re.search(r"((?:\d+\.)*\d+,\d+)", price_raw)
-            price_total = match.group(1) if match else price_raw
-
-            product = {
-                "Nome Prodotto": product_name,
-                "Prezzo Totale": price_total,
-                "Nome venditore": self.venditore,
-                "URL": redirect_url,
-                "Image URL": image_url,
-                "Data Scraping": datetime.now().isoformat(),
-                "Pagina": current_page,
-            }
-
-            if self.categoria:
-                product["nome categoria"] = self.categoria
-                product["id categoria"] = self.categoria
-
-            self.products.append(product)
+            match = PRICE_RE.search(price_raw)
+            yield OfferRecord(
+                name=name.get_text(strip=True),
+                price=match.group(1) if match else price_raw,
+                url=fields["cta"].get("href") if fields["cta"] else None,
+                image=fields["image"].get("src") if fields["image"] else None,
+                page=current_page,
+                merchant=self.venditore,
+                category=self.categoria,
+                category_name=self.nome_categoria,
+                scraped_at=scraped_at,
+            )
             products_on_page += 1
 
         self.total_products += products_on_page
         print(f"Page {current_page} completed: {products_on_page} products found")
+        if self.incomplete_cards:
+            print(f"⚠️ {self.incomplete_cards} offer cards with missing fields so far")
         print(
             f"Total products so far: {self.total_products} from {self.pages_scraped} pages"
         )
+
+    def parse_products(self, response):
+        """get_page_content() callback: keep the current page's records"""
+        self.products = list(self.iter_products(response))
+        if not self.products:
+            return
         return True
         # Look for the "next" (successivo) button
         # next_button = soup.select_one('div.pagination a[rel="next"]')
@@ -117,45 +188,76 @@ class TrovaPrezziScraper:
 
 
 async def process_url(
-    session: aiohttp.ClientSession, url_entry: Dict[str, Any], venditore: str
+    uploader: ProductUploader,
+    url_entry: Dict[str, Any],
+    venditore: str,
+    diff: Optional[SnapshotDiff] = None,
+    exporter: Optional[OfferExporter] = None,
 ) -> Dict[str, Any]:
     """
-    Process a single URL asynchronously
+    Process a single URL asynchronously. With a snapshot diff, unchanged
+    pages are not parsed and only new or changed offers are uploaded.
+    With an exporter, every offer is also written to the columnar export,
+    so unchanged pages are still parsed (but not uploaded) in that case.
     """
     if url_entry["scraped"]:
         print(f"\nSkipping already scraped URL: {url_entry['url']}")
         return url_entry
-    scraper = TrovaPrezziScraper(venditore)
+    scraper = TrovaPrezziScraper(
+        venditore, url_entry.get("category_id"), url_entry.get("category_name")
+    )
+    page_state = {"hash": None, "carried": None}
+
+    def parse(response):
+        if diff is not None:
+            page_state["hash"] = page_hash(response.text)
+            page_state["carried"] = diff.carry_over(url_entry["url"], page_state["hash"])
+            if page_state["carried"] is not None:
+                print(f"Page {url_entry['page_number']} unchanged since the last run, not parsing")
+                if exporter is None:
+                    return True
+                scraper.parse_products(response)
+                return True
+        return scraper.parse_products(response)
 
     print(f"\nProcessing URL: {url_entry['url']}")
     print(f"Page number: {url_entry['page_number']}")
 
     try:
         # Start scraping from the current URL
+        started = time.perf_counter()
         success = await asyncio.to_thread(
             get_page_content,
             url=url_entry["url"],
             venditore=venditore,
             page_number=url_entry["page_number"],
-            callback=scraper.parse_products,
+            callback=parse,
             is_first_request=True,
         )
+        latency_stats.observe("offers_page", time.perf_counter() - started)
 
         if not success:
             print(f"\n=== Error: Could not access URL: {url_entry['url']} ===")
             return url_entry
 
-        # Update the URL entry with scraped data
+        # Update the URL entry with scraped data; the records go straight to
+        # the uploader and are not kept on the entry
+        records = scraper.products
+        scraper.products = []
         url_entry["scraped"] = True
-        url_entry["scraped_products"] = len(scraper.products)
-        url_entry["products"] = scraper.products
-        # add the products to the database onboarding/add-products/
-        print(f"Adding products to the database: {url_entry}")
-        print(f"BASE_API_URL: {BASE_API_URL}")
-        requests.post(
-            f"{BASE_API_URL}/businessManager/onboarding/add-products/",
-            json={"business_name": venditore, "products": url_entry},
-        )
+        url_entry["scraped_products"] = len(records)
+        if exporter is not None:
+            # Writes Parquet row groups: keep it off the event loop
+            await asyncio.to_thread(exporter.add_records, records)
+        if diff is not None:
+            if page_state["carried"] is not None:
+                url_entry["scraped_products"] = page_state["carried"]
+                records = []
+            elif page_state["hash"] is not None:
+                records = diff.filter_products(url_entry["url"], page_state["hash"], records)
+        # queue the products for the database onboarding/add-products/
+        print(f"Queueing {len(records)} products for upload")
+        await uploader.add_page(url_entry, records)
         print(f"\n=== Page {url_entry['page_number']} Complete ===")
         print(f"Products found: {url_entry['scraped_products']}")
 
@@ -167,29 +269,137 @@ async def process_url(
 
 
 async def process_urls_batch(
-    urls: List[Dict[str, Any]], venditore: str, batch_size: int = 20
+    urls: List[Dict[str, Any]],
+    venditore: str,
+    concurrency: Optional[int] = None,
+    incremental: bool = False,
+    job_id: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """
-    Process URLs in batches with concurrency control
+    Process URLs with a fixed pool of workers pulling from a shared queue,
+    so a slow page only holds up its own worker instead of a whole batch.
+    With a job_id, every page is checkpointed once its products are uploaded.
     """
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for i in range(0, len(urls), batch_size):
-            batch = urls[i : i + batch_size]
-            batch_tasks = [
-                process_url(session, url_entry, venditore) for url_entry in batch
-            ]
-            batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
-            for result in batch_results:
-                if isinstance(result, Exception):
-                    print("❌ One of the scraping tasks failed:", result)
-                else:
-                    urls[i : i + batch_size][batch_results.index(result)] = result
+    diff = None
+    if incremental:
+        diff = await asyncio.to_thread(SnapshotDiff, offer_snapshot, venditore)
+
+    concurrency = max(1, min(concurrency or SCRAPER_CONCURRENCY, len(urls)))
+    queue = asyncio.Queue()
+    for index, url_entry in enumerate(urls):
+        queue.put_nowait((index, url_entry))
+
+    async def worker(uploader: ProductUploader):
+        while True:
+            try:
+                index, url_entry = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                urls[index] = await process_url(uploader, url_entry, venditore, diff, exporter)
+            except Exception as e:
+                print("❌ One of the scraping tasks failed:", e)
+
+    exporter = OfferExporter(job_id or venditore) if export_enabled() else None
+
+    on_uploaded = None
+    if job_id and checkpoint_store is not None:
+        async def on_uploaded(pages: List[Dict[str, Any]]) -> None:
+            await asyncio.to_thread(checkpoint_store.mark_scraped, job_id, pages)
+
+    async with create_session() as session:
+        async with ProductUploader(
+            BackendClient(session), venditore, on_uploaded=on_uploaded
+        ) as uploader:
+            await asyncio.gather(*(worker(uploader) for _ in range(concurrency)))
+            if diff is not None:
+                await uploader.remove_offers(diff.removed_offers())
+        print(f"Upload summary for {venditore}: {uploader.stats()}")
+
+    if exporter is not None:
+        await asyncio.to_thread(exporter.close)
+
+    if diff is not None:
+        print(f"Incremental summary for {venditore}: {diff.stats()}")
+        # A failed upload leaves the snapshot untouched, so the next run re-sends the diff
+        if uploader.failed_batches:
+            print("⚠️ Some uploads failed, keeping the previous offer snapshot")
+        else:
+            await asyncio.to_thread(diff.commit)
+
+    return urls
+
+
+def finish_crawl(urls_array: List[Dict[str, Any]], venditore: str, job_id: str) -> Dict[str, Any]:
+    """
+    Wrap up a crawl: summary, checkpoint cleanup, completeness check and
+    the business scraping status update
+    """
+    latency_stats.save()
+
+    # Print final summary
+    total_products = sum(entry["scraped_products"] for entry in urls_array)
+    scraped_pages = sum(1 for entry in urls_array if entry["scraped"])
 
-        return urls
+    print("\n=== Scraping Complete ===")
+    print(f"Total pages processed: {scraped_pages}/{len(urls_array)}")
+    print(f"Total products found: {total_products}")
+
+    resumable = checkpoint_store is not None and scraped_pages < len(urls_array)
+    if resumable and not checkpoints_durable():
+        print(
+            "⚠️ Crawl checkpoint kept in this container only: a resume on a new "
+            "container will not find it (set CHECKPOINT_BUCKET)"
+        )
 
+    if checkpoint_store is not None and scraped_pages == len(urls_array):
+        try:
+            checkpoint_store.finish(job_id)
+        except Exception as e:
+            print(f"⚠️ Could not clear the crawl checkpoint: {e}")
 
-def run_spider_locally(urls_array: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Pages planned from category counts know how many offers to expect
+    completeness = check_completeness(urls_array)
+    if completeness["expected_products"]:
+        print(
+            f"Completeness: {completeness['scraped_products']}/"
+            f"{completeness['expected_products']} expected offers"
+        )
+
+    # Update business scraping status
+    try:
+        response = requests.post(
+            f"{BASE_API_URL}/businessManager/update-scraping-status/",
+            json={"business_name": venditore}
+        )
+        if response.status_code == 200:
+            print(f"Successfully updated scraping status for {venditore}")
+        else:
+            print(f"Failed to update scraping status: {response.status_code}")
+    except Exception as e:
+        print(f"Error updating scraping status: {str(e)}")
+    
+    return {
+        "status": "success",
+        "total_products": total_products,
+        "venditore": venditore,
+        "pages_scraped": scraped_pages,
+        "job_id": job_id,
+        "resumable": resumable,
+        # False: only a resume served by this warm container can continue
+        "checkpoint_durable": checkpoints_durable(),
+        "completeness": completeness,
+        "urls_data": urls_array,
+    }
+
+
+def run_spider_locally(
+    urls_array: List[Dict[str, Any]],
+    concurrency: Optional[int] = None,
+    incremental: Optional[bool] = None,
+    job_id: Optional[str] = None,
+    resume: bool = False,
+) -> Dict[str, Any]:
     """
     Function to run the spider locally on an array of URLs
     Each URL in the array should be a dict with:
@@ -199,9 +409,17 @@ def run_spider_locally(urls_array: List[Dict[str, Any]]) -> Dict[str, Any]:
         "scraped": bool,
         "scraped_products": int,
         "category_id": str,
-        "category_name": str,
-        "products": list
+        "category_name": str
     }
+    Entries built by build_category_plan() also carry "expected_products",
+    which is checked once the run completes.
+    In incremental mode (incremental=True, or INCREMENTAL_SCRAPE=1 when not
+    given) only the offers that are new or changed since the previous run
+    are uploaded.
+    Progress is checkpointed under job_id (default: the merchant name) so
+    that resume_spider() can finish a crawl cut short by the Lambda timeout.
+    Without CHECKPOINT_BUCKET the checkpoint lives in this container's /tmp,
+    so only a resume served by the same warm container finds it.
     """
     print("\n=== Starting Spider ===")
     print(f"Total URLs to process: {len(urls_array)}")
@@ -210,42 +428,37 @@ def run_spider_locally(urls_array: List[Dict[str, Any]]) -> Dict[str, Any]:
         # Initialize scraper with the first URL's vendor name
         first_url = urls_array[0]["url"]
         venditore = first_url.split("/negozi/")[1].split("/")[0]
-
-        # Run the async processing
+        job_id = job_id or venditore
+        # Listing pages change between runs: no page is shared with a previous job
+        page_flight.reset()
+
+        if checkpoint_store is not None and not resume:
+            try:
+                checkpoint_store.start(job_id, venditore, urls_array)
+            except Exception as e:
+                print(f"⚠️ Could not store the crawl checkpoint, continuing without: {e}")
+
+        # Run the async processing; page fetches run in threads, so the
+        # executor has to be as wide as the worker pool
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        urls_array = loop.run_until_complete(process_urls_batch(urls_array, venditore))
-        loop.close()
-
-        # Print final summary
-        total_products = sum(entry["scraped_products"] for entry in urls_array)
-        scraped_pages = sum(1 for entry in urls_array if entry["scraped"])
-
-        print("\n=== Scraping Complete ===")
-        print(f"Total pages processed: {scraped_pages}/{len(urls_array)}")
-        print(f"Total products found: {total_products}")
-        
-        # Update business scraping status
+        executor = ThreadPoolExecutor(max_workers=concurrency or SCRAPER_CONCURRENCY)
+        loop.set_default_executor(executor)
         try:
-            response = requests.post(
-                f"{BASE_API_URL}/businessManager/update-scraping-status/",
-                json={"business_name": venditore}
+            urls_array = loop.run_until_complete(
+                process_urls_batch(
+                    urls_array,
+                    venditore,
+                    concurrency,
+                    INCREMENTAL_SCRAPE if incremental is None else incremental,
+                    job_id,
+                )
             )
-            if response.status_code == 200:
-                print(f"Successfully updated scraping status for {venditore}")
-            else:
-                print(f"Failed to update scraping status: {response.status_code}")
-        except Exception as e:
-            print(f"Error updating scraping status: {str(e)}")
-        
-        return {
-            "status": "success",
-            "total_products": total_products,
-            "venditore": venditore,
-            "pages_scraped": scraped_pages,
-            "urls_data": urls_array,
-        }
+        finally:
+            loop.close()
+            executor.shutdown(wait=False)
 
+        return finish_crawl(urls_array, venditore, job_id)
 
     except Exception as e:
         print("\n=== Error ===")
@@ -254,72 +467,221 @@ def run_spider_locally(urls_array: List[Dict[str, Any]]) -> Dict[str, Any]:
         return {"status": "error", "message": str(e), "urls_data": urls_array}
 
 
-def get_pagination_urls(negozio):
+def resume_spider(
+    job_id: str, concurrency: Optional[int] = None, incremental: Optional[bool] = None
+) -> Dict[str, Any]:
     """
-    Iteratively follows the pagination's 'next' button until no next page is available,
-    and returns the highest page number found.
+    Continue a checkpointed crawl from its first unscraped page; pages whose
+    products were already uploaded are skipped
     """
-    last_page = 1
-    page_count = 0
-    is_last_page = False
-    current_url = f"https://www.trovaprezzi.it/negozi/{negozio}/offerte#top_page"
-    try:
-        while not is_last_page:
-            page_count += 1
-            print(f"\n{'='*70}")
-            print(f"Fetching page {page_count} for last page detection: {current_url}")
-
-            # Use our TLS scraper instead of requests
-            response = tls_scraper.get_page(
-                current_url, page_number=page_count, max_retries=100
-            )
+    if checkpoint_store is None:
+        return {"status": "error", "message": "Crawl checkpoints are disabled"}
+    checkpoint = checkpoint_store.load(job_id)
+    if not checkpoint:
+        message = f"No checkpoint found for job {job_id}"
+        if not checkpoints_durable():
+            message += " (checkpoints are local to the container that ran the crawl)"
+        return {"status": "not_found", "message": message}
+
+    urls_array = checkpoint["urls"]
+    remaining = sum(1 for entry in urls_array if not entry["scraped"])
+    print(f"Resuming job {job_id}: {remaining}/{len(urls_array)} pages left")
+    return run_spider_locally(
+        urls_array, concurrency, incremental, job_id=job_id, resume=True
+    )
 
-            if not response:
-                print("Failed to fetch page, stopping pagination check")
-                break
 
-            soup = BeautifulSoup(response.text, "html.parser")
+def build_pagination_plan(negozio: str, last_page: int) -> List[Dict[str, Any]]:
+    """URL entries for pages 1..last_page of a merchant's offers listing"""
+    return [
+        {
+            "page_number": page,
+            "url": f"https://www.trovaprezzi.it/negozi/{negozio}/offerte?page={page}",
+            "scraped": False,
+            "scraped_products": 0,
+            "products": [],
+        }
+        for page in range(1, max(1, last_page) + 1)
+    ]
+
 
-            # Extract all numeric pagination links
-            pagination_links = soup.select("div.pagination a")
-            page_numbers = [
-                int(link.get_text().strip())
-                for link in pagination_links
-                if link.get_text().strip().isdigit()
+def build_category_plan(negozio: str, categories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    URL entries for every page of every category, straight from the
+    merchant categories result (no pagination walk). Each entry carries the
+    number of offers expected on it, and categories are interleaved so the
+    worker pool spreads over all of them at once.
+    """
+    per_category = []
+    for category in categories:
+        count = int(category.get("count") or 0)
+        category_id = category.get("category_id")
+        if not count or not category_id:
+            continue
+        pages = -(-count // OFFERS_PER_PAGE)
+        per_category.append(
+            [
+                {
+                    "page_number": page,
+                    "url": (
+                        f"https://www.trovaprezzi.it/negozi/{negozio}/offerte"
+                        f"?category_id={category_id}&page={page}"
+                    ),
+                    "scraped": False,
+                    "scraped_products": 0,
+                    "expected_products": min(OFFERS_PER_PAGE, count - (page - 1) * OFFERS_PER_PAGE),
+                    "category_id": category_id,
+                    "category_name": category.get("title", ""),
+                    "products": [],
+                }
+                for page in range(1, pages + 1)
             ]
-            if page_numbers:
-                last_page = max(page_numbers) + 1
-                print(f"Found page numbers: {page_numbers}, current max: {last_page}")
-            else:
-                print("No numeric pagination found, assuming current page is last")
-                break
+        )
 
-            # Look for the 'next' button (with innertext "Successive")
-            pagination_div = soup.find("div", class_="pagination")
-            next_button = (
-                pagination_div.find("a", string="Successive")
-                if pagination_div
-                else None
+    plan = []
+    for round_entries in zip_longest(*per_category):
+        plan.extend(entry for entry in round_entries if entry is not None)
+    print(f"Planned {len(plan)} pages over {len(per_category)} categories for {negozio}")
+    return plan
+
+
+def check_completeness(urls: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compare scraped offers with the expected counts, per category"""
+    categories = {}
+    for entry in urls:
+        if entry.get("expected_products") is None:
+            continue
+        category = categories.setdefault(
+            str(entry.get("category_id")),
+            {
+                "category_name": entry.get("category_name", ""),
+                "expected": 0,
+                "scraped": 0,
+                "incomplete_pages": [],
+            },
+        )
+        category["expected"] += entry["expected_products"]
+        category["scraped"] += entry.get("scraped_products", 0)
+        if not entry.get("scraped") or entry.get("scraped_products", 0) < entry["expected_products"]:
+            category["incomplete_pages"].append(entry["page_number"])
+
+    incomplete = {
+        category_id: category
+        for category_id, category in categories.items()
+        if category["incomplete_pages"]
+    }
+    for category_id, category in incomplete.items():
+        print(
+            f"⚠️ Category {category_id} ({category['category_name']}): "
+            f"{category['scraped']}/{category['expected']} offers, "
+            f"incomplete pages {category['incomplete_pages']}"
+        )
+    return {
+        "expected_products": sum(category["expected"] for category in categories.values()),
+        "scraped_products": sum(category["scraped"] for category in categories.values()),
+        "complete": not incomplete,
+        "incomplete_categories": incomplete,
+    }
+
+
+def extract_listing_info(soup) -> Dict[str, Any]:
+    """Offers on the page, total results count and highest visible page number"""
+    results_count = None
+    results_tag = OFFERS_LISTING.select_one("results_count", soup)
+    if results_tag:
+        digits = "".join(ch for ch in results_tag.get_text() if ch.isdigit())
+        results_count = int(digits) if digits else None
+
+    page_numbers = [
+        int(link.get_text().strip())
+        for link in OFFERS_LISTING.select("pagination_links", soup)
+        if link.get_text().strip().isdigit()
+    ]
+    current_tag = OFFERS_LISTING.select_one("current_page", soup)
+    current_text = current_tag.get_text().strip() if current_tag else ""
+
+    return {
+        "offers": len(OFFERS_LISTING.select("name", soup)),
+        "results_count": results_count,
+        "max_visible_page": max(page_numbers) if page_numbers else None,
+        "current_page": int(current_text) if current_text.isdigit() else None,
+    }
+
+
+def _probe_listing_page(negozio: str, page_number: int) -> Optional[Dict[str, Any]]:
+    """Fetch one offers page; None when the page could not be fetched"""
+    url = f"https://www.trovaprezzi.it/negozi/{negozio}/offerte?page={page_number}"
+    print(f"Probing page {page_number} for last page detection: {url}")
+    response = tls_scraper.get_page(url, page_number=page_number, max_retries=100)
+    if not response or response.status != 200:
+        return None
+    return extract_listing_info(make_soup(response.text))
+
+
+def _page_exists(info: Optional[Dict[str, Any]], page_number: int) -> bool:
+    if not info or not info["offers"]:
+        return False
+    # Past the end the site may serve another page instead of an empty one
+    if info["current_page"] is not None and info["current_page"] != page_number:
+        return False
+    return True
+
+
+def get_pagination_urls(negozio: str, max_pages: int = MAX_LISTING_PAGES) -> List[Dict[str, Any]]:
+    """
+    Find the last offers page in O(log pages) requests and return the URL plan.
+
+    Page 1's total results count gives the answer directly when shown.
+    Otherwise the probe gallops (visible max, x2, x4, ...) until a page
+    has no offers, then binary-searches between the last page that exists
+    and the first that does not. Always returns a list; on errors it covers
+    the pages known to exist.
+    """
+    last_page = 1
+    requests_made = 0
+    try:
+        print(f"\n{'='*70}")
+        first_page = _probe_listing_page(negozio, 1)
+        requests_made += 1
+        if not first_page:
+            print("Failed to fetch page 1, returning a single page plan")
+            return build_pagination_plan(negozio, 1)
+
+        if first_page["results_count"] is not None:
+            last_page = max(1, -(-first_page["results_count"] // OFFERS_PER_PAGE))
+            print(
+                f"Total results: {first_page['results_count']} → {last_page} pages (1 request)"
             )
-            if next_button and next_button.get("href"):
-                next_url = f"https://www.trovaprezzi.it/negozi/{negozio}/offerte?page={last_page}"
-                current_url = next_url
-                print(f"Found next page button, will check: {next_url}")
+            return build_pagination_plan(negozio, min(last_page, max_pages))
+
+        if not first_page["max_visible_page"]:
+            print("No numeric pagination found, assuming page 1 is the last")
+            return build_pagination_plan(negozio, 1)
+
+        # Gallop: the highest visible page exists, double until a page is missing
+        last_page = min(first_page["max_visible_page"], max_pages)
+        missing_page = None
+        probe = last_page
+        while probe < max_pages:
+            probe = min(probe * 2, max_pages)
+            requests_made += 1
+            if _page_exists(_probe_listing_page(negozio, probe), probe):
+                last_page = probe
             else:
-                print("No next button found, reached last page")
-                # create array of objects with the page number and the url
-                pagination_array = []
-                for page in range(1, last_page + 1):
-                    pagination_array.append(
-                        {
-                            "page_number": page,
-                            "url": f"https://www.trovaprezzi.it/negozi/{negozio}/offerte?page={page}",
-                            "scraped": False,
-                            "scraped_products": 0,
-                            "products": [],
-                        }
-                    )
-                return pagination_array
+                missing_page = probe
+                break
+
+        # Binary search between the last existing page and the first missing one
+        if missing_page is not None:
+            low, high = last_page, missing_page
+            while high - low > 1:
+                middle = (low + high) // 2
+                requests_made += 1
+                if _page_exists(_probe_listing_page(negozio, middle), middle):
+                    low = middle
+                else:
+                    high = middle
+            last_page = low
 
     except Exception as e:
         print(f"\n{'='*70}")
@@ -330,9 +692,9 @@ def get_pagination_urls(negozio):
         print(f"{'='*70}")
 
     print(f"\n{'='*50}")
-    print(f"Last page number detected: {last_page}")
+    print(f"Last page number detected: {last_page} ({requests_made} requests)")
     print(f"{'='*50}")
-    return last_page
+    return build_pagination_plan(negozio, last_page)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,308 @@
+"""
+Splits scraping jobs into shards that fit one Lambda invocation.
+
+The cost of a work item (an offers page, a competitor product) comes from
+the per-item latency measured by previous runs. A job is cut into shards
+whose estimated wall time stays under SHARD_TIME_BUDGET and whose items
+serialize to at most SHARD_MAX_BYTES, and every shard is emitted as a
+handler event, ready for a fan-out: an SQS queue, a Step Functions map
+state, or run_shards_locally() for testing.
+
+Competitor jobs are not split unless COMPETITOR_SHARDING is on: every shard
+posts its own job/update with only its products, which is only correct
+once the backend merges the updates of a job.
+"""
+import copy
+import json
+import math
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+# Seconds a shard may take; the rest of the 900 s timeout is safety margin
+SHARD_TIME_BUDGET = float(os.environ.get("SHARD_TIME_BUDGET", "600"))
+# Fixed cost of an invocation: cold start, backend updates
+SHARD_OVERHEAD_SECONDS = float(os.environ.get("SHARD_OVERHEAD_SECONDS", "30"))
+SHARD_QUEUE_URL = os.environ.get("SHARD_QUEUE_URL", "")
+# Serialized items per shard; an SQS message holds 256 KiB including the event around them
+SHARD_MAX_BYTES = int(os.environ.get("SHARD_MAX_BYTES", "200000"))
+# Bucket for shard events too large for one message: the message then points at the object
+SHARD_PAYLOAD_BUCKET = os.environ.get("SHARD_PAYLOAD_BUCKET", "")
+# Off until the backend merges the job/update of every shard of a competitor job
+COMPETITOR_SHARDING = os.environ.get("COMPETITOR_SHARDING", "0") == "1"
+# SQS limits: bytes per message and per send_message_batch call, entries per call
+SQS_MAX_BYTES = 256 * 1024
+SQS_BATCH_MAX_ENTRIES = 10
+LATENCY_STATS_PATH = os.environ.get(
+    "LATENCY_STATS_PATH", "/tmp/trovaprezzi/latency_stats.json"
+)
+# Items of a shard processed at the same time
+OFFERS_WORKERS = int(os.environ.get("SCRAPER_CONCURRENCY", "20"))
+# Same setting as the competitor job executor
+COMPETITOR_WORKERS = int(os.environ.get("COMPETITOR_CONCURRENCY", "8"))
+
+# Seconds per item until a run has measured them (proxied requests with retries)
+DEFAULT_LATENCY = {
+    "offers_page": 3.0,
+    "competitor_direct": 4.0,
+    "competitor_search": 10.0,
+}
+
+
+class LatencyStats:
+    """Moving average and deviation of the latency of each kind of work item"""
+
+    ALPHA = 0.2
+
+    def __init__(self, path: str = LATENCY_STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                self._stats = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def observe(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            stats = self._stats.get(kind)
+            if stats is None:
+                self._stats[kind] = {"mean": seconds, "deviation": seconds / 2, "samples": 1}
+                return
+            error = seconds - stats["mean"]
+            stats["mean"] += self.ALPHA * error
+            stats["deviation"] += self.ALPHA * (abs(error) - stats["deviation"])
+            stats["samples"] += 1
+
+    def estimate(self, kind: str) -> float:
+        """Conservative seconds per item: mean plus two deviations"""
+        with self._lock:
+            stats = self._stats.get(kind)
+            if not stats:
+                return DEFAULT_LATENCY.get(kind, 5.0)
+            return stats["mean"] + 2 * stats["deviation"]
+
+    def save(self) -> None:
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._lock:
+                data = json.dumps(self._stats)
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(data)
+        except OSError as e:
+            print(f"⚠️ Could not save latency stats: {e}")
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return copy.deepcopy(self._stats)
+
+
+def serialized_size(item: Any) -> int:
+    """Bytes an item takes in a JSON shard event, separator included"""
+    return len(json.dumps(item, ensure_ascii=False).encode("utf-8")) + 2
+
+
+def split_by_cost(
+    items: List[Any],
+    costs: List[float],
+    workers: int,
+    budget: float = SHARD_TIME_BUDGET,
+    max_bytes: int = SHARD_MAX_BYTES,
+) -> List[List[Any]]:
+    """
+    Split items, in order, into the fewest shards whose estimated wall time
+    (overhead + cost / workers) fits the budget and whose serialized items
+    fit max_bytes, balancing the shards' costs
+    """
+    if not items:
+        return []
+    sizes = [serialized_size(item) for item in items]
+    capacity = max(1e-6, (budget - SHARD_OVERHEAD_SECONDS) * max(1, workers))
+    shard_count = max(
+        1, math.ceil(sum(costs) / capacity), math.ceil(sum(sizes) / max(1, max_bytes))
+    )
+    target = sum(costs) / shard_count
+
+    shards, current, current_cost, current_bytes = [], [], 0.0, 0
+    for item, cost, size in zip(items, costs, sizes):
+        if current and (
+            current_cost + cost > capacity
+            or current_bytes + size > max_bytes
+            or (current_cost >= target and len(shards) < shard_count - 1)
+        ):
+            shards.append(current)
+            current, current_cost, current_bytes = [], 0.0, 0
+        current.append(item)
+        current_cost += cost
+        current_bytes += size
+    shards.append(current)
+    return shards
+
+
+def estimate_shard_seconds(cost: float, workers: int) -> float:
+    return round(SHARD_OVERHEAD_SECONDS + cost / max(1, workers), 1)
+
+
+def plan_product_shards(
+    venditore: str,
+    urls: List[Dict[str, Any]],
+    stats: Optional[LatencyStats] = None,
+    budget: float = SHARD_TIME_BUDGET,
+) -> List[Dict[str, Any]]:
+    """Handler events for scrape_seller_products_by_category, one per shard"""
+    stats = stats or latency_stats
+    pending = [entry for entry in urls if not entry.get("scraped")]
+    page_cost = stats.estimate("offers_page")
+    shards = split_by_cost(pending, [page_cost] * len(pending), OFFERS_WORKERS, budget)
+
+    plan_id = uuid.uuid4().hex[:8]
+    events = []
+    for index, shard in enumerate(shards):
+        events.append(
+            {
+                "queryStringParameters": {
+                    "action": "scrape_seller_products_by_category",
+                    "venditore": venditore,
+                    # Shards must not share a checkpoint
+                    "job_id": f"{venditore}-{plan_id}-{index}",
+                },
+                "body": shard,
+                "shard": {
+                    "index": index,
+                    "count": len(shards),
+                    "items": len(shard),
+                    "estimated_seconds": estimate_shard_seconds(
+                        page_cost * len(shard), OFFERS_WORKERS
+                    ),
+                },
+            }
+        )
+    return events
+
+
+def competitor_kind(product: Dict[str, Any]) -> str:
+    """A known product page is one request; a search costs several"""
+    return "competitor_direct" if product.get("scheda_prodotto") else "competitor_search"
+
+
+def plan_competitor_shards(
+    scraping_job: Dict[str, Any],
+    stats: Optional[LatencyStats] = None,
+    budget: float = SHARD_TIME_BUDGET,
+) -> List[Dict[str, Any]]:
+    """Handler events for scrape_products_competitors, one per shard"""
+    stats = stats or latency_stats
+    products = scraping_job.get("products", [])
+    costs = [stats.estimate(competitor_kind(product)) for product in products]
+    if COMPETITOR_SHARDING:
+        shards = split_by_cost(products, costs, COMPETITOR_WORKERS, budget)
+    else:
+        # One job, one job/update: the run stops starting products near the timeout
+        shards = [products]
+
+    events = []
+    position = 0
+    for index, shard in enumerate(shards):
+        shard_cost = sum(costs[position:position + len(shard)])
+        position += len(shard)
+        shard_info = {"index": index, "count": len(shards), "items": len(shard)}
+        events.append(
+            {
+                "queryStringParameters": {"action": "scrape_products_competitors"},
+                "body": {
+                    "scraping_job": {**scraping_job, "products": shard, "shard": shard_info},
+                },
+                "shard": {
+                    **shard_info,
+                    "estimated_seconds": estimate_shard_seconds(shard_cost, COMPETITOR_WORKERS),
+                },
+            }
+        )
+    return events
+
+
+def _message_body(event: Dict[str, Any], bucket: str) -> Optional[str]:
+    """JSON message for a shard event; too large events go to S3 behind a pointer"""
+    body = json.dumps(event, ensure_ascii=False)
+    size = len(body.encode("utf-8"))
+    if size <= SQS_MAX_BYTES:
+        return body
+    if not bucket:
+        print(f"❌ Shard event of {size} bytes is too large for SQS and no SHARD_PAYLOAD_BUCKET is set")
+        return None
+    import boto3
+
+    key = f"shard-events/{uuid.uuid4().hex}.json"
+    boto3.client("s3").put_object(Bucket=bucket, Key=key, Body=body.encode("utf-8"))
+    return json.dumps({"s3_payload": {"bucket": bucket, "key": key}})
+
+
+def load_shard_event(message: Dict[str, Any]) -> Dict[str, Any]:
+    """The handler event of a queued message, fetched from S3 when it points there"""
+    pointer = message.get("s3_payload")
+    if not isinstance(pointer, dict):
+        return message
+    import boto3
+
+    response = boto3.client("s3").get_object(Bucket=pointer["bucket"], Key=pointer["key"])
+    return json.loads(response["Body"].read())
+
+
+def dispatch_to_sqs(
+    events: List[Dict[str, Any]],
+    queue_url: str = SHARD_QUEUE_URL,
+    bucket: str = SHARD_PAYLOAD_BUCKET,
+) -> int:
+    """Send shard events to an SQS queue consumed by the scraper; returns the number sent"""
+    import boto3
+
+    sqs = boto3.client("sqs")
+    sent = 0
+
+    def send(entries: List[Dict[str, str]]) -> None:
+        nonlocal sent
+        response = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+        sent += len(response.get("Successful", []))
+        for failure in response.get("Failed", []):
+            print(f"❌ Could not queue shard {failure['Id']}: {failure.get('Message')}")
+
+    # A call takes up to 10 messages and 256 KiB in total
+    entries: List[Dict[str, str]] = []
+    entries_bytes = 0
+    for index, event in enumerate(events):
+        body = _message_body(event, bucket)
+        if body is None:
+            continue
+        size = len(body.encode("utf-8"))
+        if entries and (
+            len(entries) == SQS_BATCH_MAX_ENTRIES or entries_bytes + size > SQS_MAX_BYTES
+        ):
+            send(entries)
+            entries, entries_bytes = [], 0
+        entries.append({"Id": str(index), "MessageBody": body})
+        entries_bytes += size
+    if entries:
+        send(entries)
+    print(f"Queued {sent}/{len(events)} shards on {queue_url}")
+    return sent
+
+
+def _invoke_handler(event: Dict[str, Any]) -> Dict[str, Any]:
+    from main import handler
+
+    return handler(event, None)
+
+
+def run_shards_locally(events: List[Dict[str, Any]], workers: int = 4) -> List[Dict[str, Any]]:
+    """Run shard events in parallel processes, like a fan-out would"""
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(_invoke_handler, events))
+
+
+# Create a global instance
+latency_stats = LatencyStats()
@@ -0,0 +1,87 @@
+"""
+Request coalescing for worker threads.
+
+Concurrent calls with the same key share one execution: the first caller
+runs the function, the others wait for it and get the same result (or
+exception). Successful results can also be remembered until reset(), so
+that a key is fetched at most once per job.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    max_results bounds the remembered results (least recently used are
+    dropped; 0 shares only in-flight calls, None keeps everything), and
+    remember(result) decides which results are worth keeping.
+    """
+
+    def __init__(
+        self,
+        max_results: Optional[int] = None,
+        remember: Callable[[Any], bool] = bool,
+    ):
+        self.max_results = max_results
+        self.remember = remember
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._results: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.shared += 1
+                return self._results[key]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None and self.max_results != 0 and self.remember(call.result):
+                    self._results[key] = call.result
+                    if self.max_results is not None and len(self._results) > self.max_results:
+                        self._results.popitem(last=False)
+            call.done.set()
+        return call.result
+
+    def reset(self) -> None:
+        """Forget remembered results (calls in flight are still shared)"""
+        with self._lock:
+            self._results.clear()
+            self.calls = 0
+            self.shared = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared}
@@ -11,32 +11,128 @@ import asyncio
 import aiohttp
 from typing import List, Dict, Any
 import os
-from .request_handler import get_page_content, tls_scraper
+from urllib.parse import urljoin
+from .request_handler import get_page_content, is_blocked_page, tls_scraper
+from .page_schemas import PRODUCT_PAGE, make_soup
+from .product_matcher import ProductMatcher, link_candidates
+from .scheda_index import scheda_index, is_product_page_url
+from .rate_limiter import RateLimiter
 
 BASE_API_URL = os.environ.get("BASE_API_URL", "http://172.17.0.1:8000")
 print(f"BASE_API_URL: {BASE_API_URL}")
+# Scarica in parallelo varianti e suggerimenti invece che uno dopo l'altro.
+# Disattivato di default: fino a 2*SPECULATIVE_TOP_K richieste proxy per ricerca
+SPECULATIVE_FETCH = os.environ.get("SPECULATIVE_FETCH", "0") == "1"
+# Quante varianti e quanti suggerimenti scaricare per prodotto
+SPECULATIVE_TOP_K = int(os.environ.get("SPECULATIVE_TOP_K", "2"))
+# Secondi minimi tra due richieste di varianti/suggerimenti (tutti i thread)
+FOLLOWUP_FETCH_INTERVAL = float(os.environ.get("FOLLOWUP_FETCH_INTERVAL", "0.25"))
+FOLLOWUP_WORKERS = int(os.environ.get("FOLLOWUP_WORKERS", "16"))
+# Risposte che indicano una scheda rimossa, non un errore temporaneo
+SCHEDA_GONE_STATUSES = (404, 410)
 # Try both import styles to ensure compatibility
 
 
+class ScrapingCancelled(Exception):
+    """Il job ha annullato lo scraping del prodotto (timeout o scadenza)"""
+
+
 class SchedaProdottoScraper:
-    def __init__(self, titolo_prodotto, categoria_id=None, scheda_prodotto=None):
+    def __init__(self, titolo_prodotto, categoria_id=None, scheda_prodotto=None, cancel_event=None):
         self.titolo_prodotto = titolo_prodotto
         self.categoria_id = categoria_id
         self.scheda_prodotto = scheda_prodotto
+        # threading.Event impostato dal job quando il prodotto va abbandonato
+        self.cancel_event = cancel_event
         self.url = self.get_start_url()
+        self.matcher = ProductMatcher(titolo_prodotto)
         self.products = []
         self.total_products = 0
         self.pages_scraped = 0
+        # Impostato da estrai_da_scheda quando la scheda è sicuramente non più valida
+        self.scheda_non_valida = False
 
     def get_start_url(self):
         if self.categoria_id == "1":
             self.categoria_id = "-1"
         return f"https://www.trovaprezzi.it/categoria.aspx?id={-1}&libera={self.titolo_prodotto}"
 
+    def fetch(self, url):
+        """
+        get_page_content, a meno che il job non abbia annullato il prodotto.
+        L'annullamento interrompe anche i tentativi della richiesta in corso.
+        """
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ScrapingCancelled(f"Scraping annullato prima di {url}")
+        response = get_page_content(
+            url, "trovaprezzi", callback=lambda r: r, cancel_event=self.cancel_event
+        )
+        if not response and self.cancel_event is not None and self.cancel_event.is_set():
+            raise ScrapingCancelled(f"Scraping annullato durante {url}")
+        return response
+
+    def fetch_paced(self, url):
+        """fetch() di una pagina successiva alla prima, distanziata dal rate limiter"""
+        followup_rate_limiter.wait()
+        return self.fetch(url)
+
+    def rank_variants(self, soup):
+        """Varianti della pagina ordinate per somiglianza con il titolo cercato"""
+        container = PRODUCT_PAGE.select_one("variations_container", soup)
+        if not container:
+            return []
+        variants = PRODUCT_PAGE.select("variants", container)
+        return self.matcher.rank(link_candidates(variants, detect_active=True))
+
+    def rank_suggestions(self, soup):
+        """Prodotti suggeriti ordinati per somiglianza con il titolo cercato"""
+        if not self.titolo_prodotto:
+            return []
+        suggestions = PRODUCT_PAGE.select("suggestions", soup)
+        return self.matcher.rank(link_candidates(suggestions))
+
+    def estrai_competitors(self, soup):
+        """Estrae la lista di {"prezzo", "venditore"} dalle offerte della pagina"""
+        competitors = []
+        elementi_prezzo = PRODUCT_PAGE.select("price", soup)
+        elementi_venditore = PRODUCT_PAGE.select("merchant", soup)
+
+        for prezzo, venditore in zip(elementi_prezzo, elementi_venditore):
+            try:
+                prezzo_text = (
+                    prezzo.text.strip()
+                    .replace("€", "")
+                    .replace("Tot", "")
+                    .replace(".", "")
+                    .replace(",", ".")
+                    .strip()
+                )
+                venditore_text = PRODUCT_PAGE.select_one("merchant_link", venditore)[
+                    "href"
+                ].split("/")[-1]
+                competitors.append(
+                    {"prezzo": float(prezzo_text), "venditore": venditore_text}
+                )
+            except Exception as e:
+                print(f"Errore nel parsing del prezzo: {e}")
+                continue
+        return competitors
+
     def cerca_scheda_prodotto_estrai_dati_competitor(self):
         """Estrae prezzi e venditori con una sola richiesta HTTP, gestendo le varianti di prodotto"""
-        prezzi = []
-        venditori = []
+        # Scheda già risolta in un job precedente: una sola richiesta
+        indexed_url = scheda_index.lookup(self.titolo_prodotto, self.categoria_id)
+        if indexed_url:
+            print(f"Scheda prodotto trovata nell'indice locale: {indexed_url}")
+            competitors, url_utilizzato = self.estrai_da_scheda(indexed_url)
+            if url_utilizzato:
+                return competitors, url_utilizzato
+            if not self.scheda_non_valida:
+                # Errore temporaneo (proxy, 5xx): la scheda resta nell'indice
+                return competitors, url_utilizzato
+            print("Scheda indicizzata non più valida, ripeto la ricerca")
+            scheda_index.forget(indexed_url)
+
         url = self.url
         url_utilizzato = url
         competitors = []
@@ -47,7 +143,7 @@ class SchedaProdottoScraper:
             from urllib.parse import urlparse
 
             # Use get_page_content instead of direct requests
-            response = get_page_content(url, "trovaprezzi", callback=lambda r: r)
+            response = self.fetch(url)
             print("V ->> returned response", response)
             if not response:
                 print("Failed to get page content")
@@ -63,309 +159,266 @@ class SchedaProdottoScraper:
                 print(f"Errore nella richiesta: {response.status}")
                 return "Errore nella richiesta", False
 
-            soup = BeautifulSoup(response.text, "html.parser")
+            soup = make_soup(response.text)
 
-            # Verifica se siamo in una pagina con varianti
-            variations_container = soup.select_one("div.variations_container")
-            if variations_container and self.titolo_prodotto:
-                print(f"Pagina con varianti rilevata per '{self.titolo_prodotto}'")
-
-                # Estrai codici modello dal nome del prodotto (come 9B9R8EA nell'esempio)
-                model_matches = re.findall(
-                    r"[A-Z0-9]{5,}(?:\-[A-Z0-9]+)?", self.titolo_prodotto
+            if SPECULATIVE_FETCH:
+                competitors, url_utilizzato = self.segui_candidati_in_parallelo(
+                    soup, final_url, url_utilizzato
+                )
+            else:
+                competitors, url_utilizzato = self.segui_candidati_in_serie(
+                    soup, final_url, url_utilizzato
                 )
-                model_numbers = [m.strip() for m in model_matches]
-                print(f"Codici modello estratti: {model_numbers}")
-
-                # Modifica il metodo di selezione delle varianti
-                variants = variations_container.select("a.variation")
-                if not variants:
-                    variants = variations_container.select("div.slick-slide a")
-                if not variants:
-                    variants = variations_container.select("div.variation a")
-                if not variants:
-                    # Ultima chance: qualsiasi link nella container delle varianti
-                    variants = variations_container.select("a[href]")
-
-                print(f"Trovati {len(variants)} link di varianti")
-
-                # Analizza ogni link di variante
-                best_match = None
-                best_score = -1
-                best_url = None
-
-                for variant in variants:
-                    variant_url = variant.get("href")
-                    # Ottieni il testo o il titolo della variante
-                    variant_title = variant.get("title") or variant.text.strip()
-
-                    # Debug per vedere tutte le varianti disponibili
-                    print(f"Variante disponibile: {variant_title} → {variant_url}")
-
-                    if not variant_url or not variant_title:
-                        continue
-
-                    # Calcola punteggio di corrispondenza
-                    score = 0
-
-                    # Bonus maggiore per corrispondenza esatta di codice modello
-                    for model in model_numbers:
-                        if (
-                            model.lower() in variant_title.lower()
-                            or model.lower() in variant_url.lower()
-                        ):
-                            score += 10
-                            print(
-                                f"Match di codice modello '{model}' in variante '{variant_title}'"
-                            )
 
-                    # Conta quante parole chiave corrispondono
-                    keywords = re.sub(
-                        r"[^\w\s]", " ", self.titolo_prodotto.lower()
-                    ).split()
-                    keyword_matches = sum(
-                        1 for keyword in keywords if keyword in variant_title.lower()
-                    )
-                    score += keyword_matches
-
-                    # Bonus per variante attualmente selezionata
-                    if (
-                        "active" in variant.get("class", [])
-                        or variant.parent
-                        and "active" in variant.parent.get("class", [])
-                    ):
-                        score += 0.5
-
-                    print(f"Variante: '{variant_title}' - Score: {score}")
-
-                    # Aggiorna la migliore corrispondenza
-                    if score > best_score:
-                        best_score = score
-                        best_match = variant_title
-                        best_url = variant_url
-
-                # Se abbiamo trovato una variante migliore, usa quell'URL
-                if best_url and best_score > 0:
-                    print(
-                        f"→ Selezionata variante: '{best_match}' (score {best_score})"
-                    )
+            # Salva nella cache
+            if competitors:
+                scheda_index.record(self.titolo_prodotto, self.categoria_id, url_utilizzato)
+            print(f"Primi 10 competitors estratti: {competitors[:10]}")
+            print(f"URL utilizzato per scraping: {url_utilizzato}")
+            return competitors[:10], url_utilizzato
 
-                    # Converti URL relativo in assoluto se necessario
-                    if best_url.startswith("/"):
-                        parsed_url = urlparse(final_url)  # Usa final_url, non url
-                        best_url = (
-                            f"{parsed_url.scheme}://{parsed_url.netloc}{best_url}"
-                        )
+        except ScrapingCancelled:
+            # Il job ha abbandonato il prodotto: non è un errore della scheda
+            raise
+        except Exception as e:
+            print(f"Errore: {e}")
+            return e, False
 
-                    print(f"→ Nuovo URL variante completo: {best_url}")
-                    url_utilizzato = best_url
+    def segui_candidati_in_serie(self, soup, final_url, url_utilizzato):
+        """
+        Segue in sequenza la variante migliore e poi il suggerimento migliore.
+        Ritorna (competitors, url_utilizzato)
+        """
+        prezzi = []
+        venditori = []
+        competitors = []
+        from urllib.parse import urlparse
 
-                    # Nuova richiesta per la variante specifica
-                    time.sleep(random.uniform(1, 2))
-                    response = get_page_content(
-                        best_url, "trovaprezzi", callback=lambda r: r
-                    )
-                    if response.status == 200:
-                        soup = BeautifulSoup(response.text, "html.parser")
-                        print("Caricata pagina della variante con successo")
-                    else:
-                        logging.warning(
-                            f"Errore accedendo alla variante: {response.status}"
-                        )
+        # Verifica se siamo in una pagina con varianti
+        variations_container = PRODUCT_PAGE.select_one("variations_container", soup)
+        if variations_container and self.titolo_prodotto:
+            print(f"Pagina con varianti rilevata per '{self.titolo_prodotto}'")
 
-            # Estrazione prezzi
-            elementi_prezzo = soup.select("div.item_total_price")
-            elementi_venditore = soup.select("div.merchant_name_and_logo")
-
-            for prezzo, venditore in zip(elementi_prezzo, elementi_venditore):
-                try:
-                    prezzo_text = (
-                        prezzo.text.strip()
-                        .replace("€", "")
-                        .replace("Tot", "")
-                        .replace(".", "")
-                        .replace(",", ".")
-                        .strip()
-                    )
-                    venditore_text = venditore.select_one("a")["href"].split("/")[-1]
-                    competitors.append(
-                        {"prezzo": float(prezzo_text), "venditore": venditore_text}
-                    )
-                except Exception as e:
-                    print(f"Errore nel parsing del prezzo: {e}")
-                    continue
+            print(f"Codici modello estratti: {list(self.matcher.model_codes)}")
 
-            # Estrazione venditori
-            print(f"Trovati {len(competitors)} competitors")
+            # Analizza e ordina ogni link di variante
+            ranked_variants = self.rank_variants(soup)
+            print(f"Trovati {len(ranked_variants)} link di varianti")
+            for variant in ranked_variants:
+                print(
+                    f"Variante: '{variant['title']}' → {variant['url']} - Score: {variant['score']}"
+                )
 
-            # Aggiungere questo codice dopo l'estrazione dei venditori ma prima del salvataggio nella cache
-            # Intorno alla riga 335-340 della funzione estrai_dati_pagina
+            best_variant = ranked_variants[0] if ranked_variants else None
+            best_url = best_variant["url"] if best_variant else None
+            best_score = best_variant["score"] if best_variant else -1
+            best_match = best_variant["title"] if best_variant else None
 
-            # Verifica se abbiamo trovato meno di 4 risultati, prova con i suggerimenti
-            if len(prezzi) < 4 or len(venditori) < 4:
+            # Se abbiamo trovato una variante migliore, usa quell'URL
+            if best_url and best_score > 0:
                 print(
-                    f"Trovati solo {len(prezzi)} prezzi e {len(venditori)} venditori - Cerco nei suggerimenti"
+                    f"→ Selezionata variante: '{best_match}' (score {best_score})"
                 )
 
-                # Cerca suggerimenti nella sidebar
-                suggestions = (
-                    soup.select("section.search_suggestions a.suggested_product")
-                    or soup.select("div.desktop_sidebar a.suggested_product")
-                    or soup.select("a.suggested_product.variant_with_versione")
-                    or soup.select("div.related_products a[href]")
-                )
+                # Converti URL relativo in assoluto se necessario
+                if best_url.startswith("/"):
+                    parsed_url = urlparse(final_url)  # Usa final_url, non url
+                    best_url = (
+                        f"{parsed_url.scheme}://{parsed_url.netloc}{best_url}"
+                    )
 
-                if suggestions:
-                    print(f"Trovati {len(suggestions)} prodotti suggeriti")
+                print(f"→ Nuovo URL variante completo: {best_url}")
+                url_utilizzato = best_url
+
+                # Nuova richiesta per la variante specifica
+                response = self.fetch_paced(best_url)
+                if response and response.status == 200:
+                    soup = make_soup(response.text)
+                    print("Caricata pagina della variante con successo")
+                else:
+                    logging.warning(
+                        f"Errore accedendo alla variante: {getattr(response, 'status', None)}"
+                    )
 
-                    best_suggestion = None
-                    best_suggestion_score = -1
-                    best_suggestion_url = None
-                    best_suggestion_title = None
+        # Estrazione prezzi
+        competitors.extend(self.estrai_competitors(soup))
 
-                    for suggestion in suggestions:
-                        suggestion_url = suggestion.get("href")
-                        suggestion_title = (
-                            suggestion.get("title") or suggestion.text.strip()
-                        )
+        # Estrazione venditori
+        print(f"Trovati {len(competitors)} competitors")
 
-                        # Skip se mancano informazioni essenziali
-                        if not suggestion_url or not suggestion_title:
-                            continue
+        # Aggiungere questo codice dopo l'estrazione dei venditori ma prima del salvataggio nella cache
+        # Intorno alla riga 335-340 della funzione estrai_dati_pagina
 
-                        # Debug
-                        print(f"Suggerimento: '{suggestion_title}' → {suggestion_url}")
+        # Verifica se abbiamo trovato meno di 4 risultati, prova con i suggerimenti
+        if len(prezzi) < 4 or len(venditori) < 4:
+            print(
+                f"Trovati solo {len(prezzi)} prezzi e {len(venditori)} venditori - Cerco nei suggerimenti"
+            )
 
-                        # Calcola punteggio di corrispondenza, simile alle varianti
-                        score = 0
+            # Cerca suggerimenti nella sidebar
+            suggestions = PRODUCT_PAGE.select("suggestions", soup)
 
-                        # Se c'è un codice modello, verifica corrispondenza
-                        if self.titolo_prodotto:
-                            model_matches = re.findall(
-                                r"[A-Z0-9]{5,}(?:\-[A-Z0-9]+)?", self.titolo_prodotto
-                            )
-                            for model in model_matches:
-                                if (
-                                    model.lower() in suggestion_title.lower()
-                                    or model.lower() in suggestion_url.lower()
-                                ):
-                                    score += 10
-                                    print(
-                                        f"Match di codice modello '{model}' in suggerimento '{suggestion_title}'"
-                                    )
-
-                            # Conta parole chiave corrispondenti
-                            keywords = re.sub(
-                                r"[^\w\s]", " ", self.titolo_prodotto.lower()
-                            ).split()
-                            keyword_matches = sum(
-                                1
-                                for keyword in keywords
-                                if keyword in suggestion_title.lower()
-                            )
-                            score += keyword_matches
+            if suggestions:
+                print(f"Trovati {len(suggestions)} prodotti suggeriti")
 
-                        print(f"Suggerimento: '{suggestion_title}' - Score: {score}")
+                ranked_suggestions = self.rank_suggestions(soup)
+                for suggestion in ranked_suggestions:
+                    print(
+                        f"Suggerimento: '{suggestion['title']}' → {suggestion['url']} - Score: {suggestion['score']}"
+                    )
 
-                        # Aggiorna miglior suggerimento
-                        if score > best_suggestion_score:
-                            best_suggestion_score = score
-                            best_suggestion = suggestion
-                            best_suggestion_url = suggestion_url
-                            best_suggestion_title = suggestion_title
+                best_suggestion = ranked_suggestions[0] if ranked_suggestions else None
+                best_suggestion_url = best_suggestion["url"] if best_suggestion else None
+                best_suggestion_score = best_suggestion["score"] if best_suggestion else -1
+                best_suggestion_title = best_suggestion["title"] if best_suggestion else None
 
-                    # Se troviamo un buon suggerimento, fai una nuova richiesta
-                    if best_suggestion_url and best_suggestion_score > 0:
-                        print(
-                            f"→ Selezionato suggerimento: '{best_suggestion_title}' (score {best_suggestion_score})"
-                        )
+                # Se troviamo un buon suggerimento, fai una nuova richiesta
+                if best_suggestion_url and best_suggestion_score > 0:
+                    print(
+                        f"→ Selezionato suggerimento: '{best_suggestion_title}' (score {best_suggestion_score})"
+                    )
 
-                        # Converti URL relativo in assoluto se necessario
-                        if best_suggestion_url.startswith("/"):
-                            parsed_url = urlparse(final_url)
-                            best_suggestion_url = f"{parsed_url.scheme}://{parsed_url.netloc}{best_suggestion_url}"
+                    # Converti URL relativo in assoluto se necessario
+                    if best_suggestion_url.startswith("/"):
+                        parsed_url = urlparse(final_url)
+                        best_suggestion_url = f"{parsed_url.scheme}://{parsed_url.netloc}{best_suggestion_url}"
 
-                        print(f"→ Nuovo URL suggerimento: {best_suggestion_url}")
+                    print(f"→ Nuovo URL suggerimento: {best_suggestion_url}")
 
-                        # Nuova richiesta per il prodotto suggerito
-                        suggestion_response = get_page_content(
-                            best_suggestion_url, "trovaprezzi", callback=lambda r: r
-                        )
+                    # Nuova richiesta per il prodotto suggerito
+                    suggestion_response = self.fetch_paced(best_suggestion_url)
 
-                        if suggestion_response.status == 200:
-                            suggestion_soup = BeautifulSoup(
-                                suggestion_response.text, "html.parser"
-                            )
-                            print("Caricata pagina del prodotto suggerito con successo")
+                    if suggestion_response and suggestion_response.status == 200:
+                        suggestion_soup = make_soup(suggestion_response.text)
+                        print("Caricata pagina del prodotto suggerito con successo")
 
-                            # Estrai prezzi e venditori aggiuntivi
-                            suggestion_prezzi = []
-                            suggestion_venditori = []
+                        # Estrai prezzi e venditori aggiuntivi
+                        suggestion_prezzi = []
+                        suggestion_venditori = []
 
-                            # Estrazione prezzi dal suggerimento
-                            suggestion_elementi_prezzo = suggestion_soup.select(
-                                "div.item_total_price"
-                            )
-                    
-                            # Estrazione venditori dal suggerimento
-                            suggestion_elementi_venditore = suggestion_soup.select(
-                                "div.merchant_name_and_logo"
-                            )
-                            for prezzo, venditore in zip(
-                                suggestion_elementi_prezzo, suggestion_elementi_venditore
-                            ):
-                                try:
-                                    prezzo_text = (
-                                        prezzo.text.strip()
-                                        .replace("€", "")
-                                        .replace("Tot", "")
-                                        .replace(".", "")
-                                        .replace(",", ".")
-                                        .strip()
-                                    )
-                                    venditore_text = venditore.select_one("a")[
-                                        "href"
-                                    ].split("/")[-1]
-                                    competitors.append(
-                                        {
-                                            "prezzo": float(prezzo_text),
-                                            "venditore": venditore_text,
-                                        }
-                                    )
-                                except Exception as e:
-                                    print(f"Errore nel parsing del prezzo: {e}")
-                                    continue
+                        # Estrazione prezzi e venditori dal suggerimento
+                        competitors.extend(self.estrai_competitors(suggestion_soup))
 
-                            print(
-                                f"Trovati {len(suggestion_prezzi)} prezzi aggiuntivi e {len(suggestion_venditori)} venditori aggiuntivi"
-                            )
+                        print(
+                            f"Trovati {len(suggestion_prezzi)} prezzi aggiuntivi e {len(suggestion_venditori)} venditori aggiuntivi"
+                        )
 
-                            # Ricorda l'URL utilizzato
-                            if suggestion_prezzi or suggestion_venditori:
-                                url_utilizzato = best_suggestion_url
+                        # Ricorda l'URL utilizzato
+                        if suggestion_prezzi or suggestion_venditori:
+                            url_utilizzato = best_suggestion_url
 
-                                print(
-                                    f"Risultati combinati: {len(prezzi)} prezzi, {len(venditori)} venditori"
-                                )
-                        else:
-                            logging.warning(
-                                f"Errore accedendo al suggerimento: {suggestion_response.status}"
+                            print(
+                                f"Risultati combinati: {len(prezzi)} prezzi, {len(venditori)} venditori"
                             )
+                    else:
+                        logging.warning(
+                            f"Errore accedendo al suggerimento: {getattr(suggestion_response, 'status', None)}"
+                        )
 
-            # Salva nella cache
-            print(f"Primi 10 competitors estratti: {competitors[:10]}")
-            print(f"URL utilizzato per scraping: {url_utilizzato}")
-            return competitors[:10], url_utilizzato
-
-        except Exception as e:
-            print(f"Errore: {e}")
-            return e, False
-
-    def estrai_dati_competitor(self):
-        """Estrae prezzi e venditori con una sola richiesta HTTP, gestendo le varianti di prodotto"""
+        return competitors, url_utilizzato
+
+    def segui_candidati_in_parallelo(self, soup, final_url, url_utilizzato):
+        """
+        Scarica insieme le migliori SPECULATIVE_TOP_K varianti e i migliori
+        suggerimenti della prima pagina, e per ciascun tipo tiene la pagina
+        col punteggio più alto che restituisce dei competitors.
+        Ritorna (competitors, url_utilizzato)
+        """
+        varianti = []
+        if self.titolo_prodotto and PRODUCT_PAGE.select_one("variations_container", soup):
+            print(f"Pagina con varianti rilevata per '{self.titolo_prodotto}'")
+            varianti = [v for v in self.rank_variants(soup) if v["score"] > 0]
+        suggerimenti = [s for s in self.rank_suggestions(soup) if s["score"] > 0]
+        varianti = varianti[:SPECULATIVE_TOP_K]
+        suggerimenti = suggerimenti[:SPECULATIVE_TOP_K]
+        candidati = varianti + suggerimenti
+        for candidato in candidati:
+            print(
+                f"Candidato: '{candidato['title']}' → {candidato['url']} - Score: {candidato['score']}"
+            )
+
+        # Converti gli URL relativi in assoluti rispetto a final_url
+        urls = [urljoin(final_url, candidato["url"]) for candidato in candidati]
+        futures = [followup_executor.submit(self.fetch_paced, url) for url in urls]
+        pagine = []
+        for url, future in zip(urls, futures):
+            try:
+                response = future.result()
+            except ScrapingCancelled:
+                raise
+            except Exception as e:
+                print(f"Errore accedendo a {url}: {e}")
+                response = None
+            if response and response.status == 200:
+                pagine.append(self.estrai_competitors(make_soup(response.text)))
+            else:
+                pagine.append(None)
+
+        # La variante migliore che risponde sostituisce la pagina di partenza
+        competitors = None
+        for candidato, url, trovati in zip(varianti, urls, pagine):
+            if trovati:
+                print(f"→ Selezionata variante: '{candidato['title']}' (score {candidato['score']})")
+                competitors, url_utilizzato = list(trovati), url
+                break
+        if competitors is None:
+            competitors = self.estrai_competitors(soup)
+        print(f"Trovati {len(competitors)} competitors")
+
+        # Il suggerimento migliore che risponde aggiunge i suoi prezzi
+        for candidato, trovati in zip(suggerimenti, pagine[len(varianti):]):
+            if trovati:
+                print(f"→ Selezionato suggerimento: '{candidato['title']}' (score {candidato['score']})")
+                competitors.extend(trovati)
+                break
+        return competitors, url_utilizzato
+
+    def get_scheda_url(self):
+        """URL assoluto della scheda prodotto già nota, se presente"""
+        if not self.scheda_prodotto or not isinstance(self.scheda_prodotto, str):
+            return None
+        # Un URL di ricerca salvato come scheda non evita la ricerca
+        if not is_product_page_url(self.scheda_prodotto):
+            return None
+        return urljoin("https://www.trovaprezzi.it/", self.scheda_prodotto)
+
+    def estrai_dati_competitor(self, url=None):
+        """
+        Scarica direttamente la scheda prodotto nota (scheda_prodotto o URL passato).
+        Solo se la scheda non è più valida (404/410, rimanda alla ricerca o
+        non ha il contenitore del prodotto) la dimentica e ripiega sulla
+        ricerca testuale. Errori temporanei e schede senza offerte non la
+        invalidano, e nemmeno un prodotto annullato (ScrapingCancelled).
+        """
+        url = url or self.get_scheda_url()
+        if not url:
+            print("Nessuna scheda prodotto nota, eseguo la ricerca")
+            return self.cerca_scheda_prodotto_estrai_dati_competitor()
+
+        competitors, url_utilizzato = self.estrai_da_scheda(url)
+        if url_utilizzato:
+            scheda_index.record(self.titolo_prodotto, self.categoria_id, url_utilizzato)
+            return competitors, url_utilizzato
+        if not self.scheda_non_valida:
+            print(f"Errore temporaneo sulla scheda {url}, la scheda resta valida")
+            return competitors, url_utilizzato
+
+        print(f"Scheda prodotto non più valida: {url} - ripiego sulla ricerca")
+        scheda_index.forget(url)
+        return self.cerca_scheda_prodotto_estrai_dati_competitor()
+
+    def estrai_da_scheda(self, url):
+        """
+        Estrae prezzi e venditori da una scheda prodotto con una sola richiesta HTTP.
+        Ritorna (competitors, url_utilizzato), con url_utilizzato=False se la
+        scheda non risponde o rimanda alla ricerca; una scheda valida senza
+        offerte ritorna ([], url). self.scheda_non_valida distingue una
+        scheda rimossa da un errore temporaneo. ScrapingCancelled passa al
+        chiamante, senza toccare l'indice.
+        """
+        self.scheda_non_valida = False
         prezzi = []
         venditori = []
-        url = self.url
         url_utilizzato = url
         competitors = []
         print(f"Inizio scraping URL: {url}")
@@ -375,7 +428,7 @@ class SchedaProdottoScraper:
             from urllib.parse import urlparse
 
             # Use get_page_content instead of direct requests
-            response = get_page_content(url, "trovaprezzi", callback=lambda r: r)
+            response = self.fetch(url)
             print("V ->> returned response", response)
             if not response:
                 print("Failed to get page content")
@@ -389,31 +442,27 @@ class SchedaProdottoScraper:
 
             if not str(response.status).startswith('2'):
                 print(f"Errore nella richiesta: {response.status}")
+                self.scheda_non_valida = response.status in SCHEDA_GONE_STATUSES
                 return "Errore nella richiesta", False
 
-            soup = BeautifulSoup(response.text, "html.parser")
+            if not is_product_page_url(final_url):
+                print(f"La scheda rimanda alla ricerca: {final_url}")
+                self.scheda_non_valida = True
+                return "Scheda prodotto non valida", False
+
+            if is_blocked_page(response.text):
+                # Pagina anti-bot sopravvissuta ai tentativi: errore temporaneo
+                print(f"Pagina bloccata al posto della scheda: {final_url}")
+                return "Pagina bloccata", False
+
+            soup = make_soup(response.text)
+            if not PRODUCT_PAGE.select_one("product_container", soup):
+                print(f"La pagina non contiene una scheda prodotto: {final_url}")
+                self.scheda_non_valida = True
+                return "Scheda prodotto non valida", False
 
             # Estrazione prezzi
-            elementi_prezzo = soup.select("div.item_total_price")
-            elementi_venditore = soup.select("div.merchant_name_and_logo")
-
-            for prezzo, venditore in zip(elementi_prezzo, elementi_venditore):
-                try:
-                    prezzo_text = (
-                        prezzo.text.strip()
-                        .replace("€", "")
-                        .replace("Tot", "")
-                        .replace(".", "")
-                        .replace(",", ".")
-                        .strip()
-                    )
-                    venditore_text = venditore.select_one("a")["href"].split("/")[-1]
-                    competitors.append(
-                        {"prezzo": float(prezzo_text), "venditore": venditore_text}
-                    )
-                except Exception as e:
-                    print(f"Errore nel parsing del prezzo: {e}")
-                    continue
+            competitors.extend(self.estrai_competitors(soup))
 
             # Estrazione venditori
             print(f"Trovati {len(competitors)} competitors")
@@ -424,6 +473,16 @@ class SchedaProdottoScraper:
             print(f"URL utilizzato per scraping: {url_utilizzato}")
             return competitors[:10], url_utilizzato
 
+        except ScrapingCancelled:
+            # Il job ha abbandonato il prodotto: non è un errore della scheda
+            raise
         except Exception as e:
             print(f"Errore: {e}")
-            return e, False
\ No newline at end of file
+            return e, False
+
+
+# Create a global instance
+followup_rate_limiter = RateLimiter(FOLLOWUP_FETCH_INTERVAL)
+followup_executor = ThreadPoolExecutor(
+    max_workers=FOLLOWUP_WORKERS, thread_name_prefix="followups"
+)
@@ -0,0 +1,201 @@
+import asyncio
+import json
+
+import aiohttp
+import pytest
+
+from scraping_logics import backend_client
+from scraping_logics.backend_client import (
+    ADD_PRODUCTS_PATH,
+    JOB_UPDATE_PATH,
+    BackendClient,
+    JobProgressReporter,
+    ProductUploader,
+)
+
+# no_backoff replaces asyncio.sleep; the reporter tests still need to yield
+yield_to_loop = asyncio.sleep
+
+
+class FakeResponse:
+    def __init__(self, status):
+        self.status = status
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class ConnectionRefused(aiohttp.ClientConnectorError):
+    def __init__(self):
+        pass
+
+    def __str__(self):
+        return "Connection refused"
+
+
+class FakeSession:
+    """Answers each POST with the next outcome: a status code or an exception"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.requests = []
+
+    def post(self, url, data=None, headers=None):
+        self.requests.append({"url": url, "data": data, "headers": headers})
+        outcome = self.outcomes.pop(0) if self.outcomes else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    async def sleep(seconds):
+        return None
+
+    monkeypatch.setattr(backend_client.asyncio, "sleep", sleep)
+
+
+def post(session, replay_safe=False, dedupes=False, key="run-0"):
+    client = BackendClient(
+        session, base_url="http://backend", max_retries=3, dedupes_idempotency_key=dedupes
+    )
+    return asyncio.run(client.post_json("/path/", {"a": 1}, key, replay_safe=replay_safe))
+
+
+def test_add_products_is_not_replayed_after_a_timeout_or_5xx():
+    session = FakeSession(asyncio.TimeoutError())
+    assert post(session) is False
+    assert len(session.requests) == 1
+    assert "Idempotency-Key" not in session.requests[0]["headers"]
+
+    session = FakeSession(503)
+    assert post(session) is False
+    assert len(session.requests) == 1
+
+
+def test_requests_that_never_reached_the_backend_are_retried():
+    session = FakeSession(ConnectionRefused(), 429, 200)
+    assert post(session) is True
+    assert len(session.requests) == 3
+
+
+def test_client_errors_are_not_retried():
+    session = FakeSession(409, 200)
+    assert post(session) is False
+    assert len(session.requests) == 1
+
+
+def test_deduplicating_backend_gets_the_key_and_retries():
+    session = FakeSession(503, asyncio.TimeoutError(), 200)
+    assert post(session, dedupes=True) is True
+    assert len(session.requests) == 3
+    assert {request["headers"]["Idempotency-Key"] for request in session.requests} == {"run-0"}
+
+
+def test_replay_safe_requests_are_retried():
+    session = FakeSession(500, 200)
+    assert post(session, replay_safe=True) is True
+    assert len(session.requests) == 2
+
+
+def test_gives_up_after_max_retries():
+    session = FakeSession(*[429] * 10)
+    assert post(session) is False
+    assert len(session.requests) == 4
+
+
+def test_uploader_batches_and_acknowledges_pages_in_order():
+    session = FakeSession()
+    acknowledged = []
+
+    async def on_uploaded(pages):
+        acknowledged.extend(page["page_number"] for page in pages)
+
+    async def upload():
+        client = BackendClient(session, base_url="http://backend", gzip_requests=False)
+        async with ProductUploader(
+            client, "shop", max_products=3, on_uploaded=on_uploaded
+        ) as uploader:
+            for page_number in range(1, 4):
+                await uploader.add_page(
+                    {"page_number": page_number, "url": f"/p{page_number}"},
+                    [{"id": f"{page_number}-{index}"} for index in range(2)],
+                )
+            await uploader.add_page({"page_number": 4, "url": "/p4"}, [])
+        return uploader
+
+    uploader = asyncio.run(upload())
+    assert uploader.stats() == {"uploaded_products": 6, "uploaded_batches": 2, "failed_batches": 0}
+    assert sorted(acknowledged) == [1, 2, 3, 4]
+    assert all(request["url"] == f"http://backend{ADD_PRODUCTS_PATH}" for request in session.requests)
+
+
+def test_pages_of_a_failed_batch_are_not_acknowledged():
+    session = FakeSession(400)
+    acknowledged = []
+
+    async def on_uploaded(pages):
+        acknowledged.extend(page["page_number"] for page in pages)
+
+    async def upload():
+        client = BackendClient(session, base_url="http://backend", gzip_requests=False)
+        async with ProductUploader(
+            client, "shop", max_products=2, senders=1, on_uploaded=on_uploaded
+        ) as uploader:
+            await uploader.add_page({"page_number": 1}, [{"id": 1}, {"id": 2}])
+            await uploader.add_page({"page_number": 2}, [{"id": 3}])
+        return uploader
+
+    uploader = asyncio.run(upload())
+    assert uploader.failed_batches == 1
+    assert acknowledged == [2]
+
+
+def report(session, results, max_results=2):
+    """Stream `results` through a JobProgressReporter and finish the job"""
+    job = {"id": 9, "products": [{"id": index} for index in range(len(results))]}
+
+    async def run():
+        client = BackendClient(session, base_url="http://backend", gzip_requests=False)
+        reporter = JobProgressReporter(client, job, max_results=max_results, max_delay=60)
+        reporter.start()
+        for result in results:
+            reporter.add(result)
+            # Let the report loop pick up a full batch
+            for _ in range(10):
+                await yield_to_loop(0)
+        accepted = await reporter.finish(results)
+        return reporter, accepted
+
+    reporter, accepted = asyncio.run(run())
+    updates = [json.loads(request["data"]) for request in session.requests]
+    return reporter, accepted, updates
+
+
+def test_progress_is_streamed_in_batches_then_posted_whole():
+    results = [{"product_id": index} for index in range(5)]
+    session = FakeSession()
+    reporter, accepted, updates = report(session, results)
+
+    assert accepted is True
+    assert all(request["url"] == f"http://backend{JOB_UPDATE_PATH}" for request in session.requests)
+    partial, final = updates[:-1], updates[-1]
+    assert [len(update["result_data"]) for update in partial] == [2, 2]
+    assert all("products" not in update and update["update"]["final"] is False for update in partial)
+    assert [update["update"]["sequence"] for update in updates] == [1, 2, 3]
+    assert partial[-1]["update"]["completed"] == 4
+    assert final["update"] == {"sequence": 3, "final": True, "completed": 5, "total": 5}
+    assert final["result_data"] == results
+    assert len(final["products"]) == 5
+
+
+def test_failed_partial_updates_do_not_stop_the_job():
+    results = [{"product_id": index} for index in range(2)]
+    reporter, accepted, updates = report(FakeSession(400), results)
+    assert reporter.failed_updates == 1
+    assert accepted is True
+    assert updates[-1]["result_data"] == results
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import main
+from scraping_logics.batch_jobs import is_sqs_event, jobs_from_sqs, run_batch
+
+PAGE = "https://www.trovaprezzi.it/negozi/shop/offerte?page={}"
+
+
+def crawl_event(pages=2):
+    return {
+        "queryStringParameters": {"action": "scrape_seller_products_by_category", "job_id": "shop-0"},
+        "body": [{"page_number": page, "url": PAGE.format(page)} for page in range(1, pages + 1)],
+    }
+
+
+def sqs_event(*events):
+    return {
+        "Records": [
+            {"eventSource": "aws:sqs", "messageId": f"m{index}", "body": json.dumps(event)}
+            for index, event in enumerate(events)
+        ]
+    }
+
+
+def crawl_result(urls, scraped):
+    return {
+        "status": "success",
+        "total_products": 20 * scraped,
+        "pages_scraped": scraped,
+        "resumable": scraped < len(urls),
+        "checkpoint_durable": False,
+        "urls_data": urls,
+    }
+
+
+@pytest.fixture
+def crawls(monkeypatch):
+    """run_spider_locally stand-in: outcome per job_id"""
+    outcomes = {}
+
+    def run_spider_locally(urls, incremental=None, job_id=None):
+        outcome = outcomes.get(job_id, "complete")
+        if outcome == "error":
+            return {"status": "error", "message": "proxy down", "urls_data": urls}
+        return crawl_result(urls, len(urls) if outcome == "complete" else len(urls) - 1)
+
+    monkeypatch.setattr(main, "run_spider_locally", run_spider_locally)
+    return outcomes
+
+
+def test_sqs_events_are_recognised():
+    assert is_sqs_event(sqs_event({}))
+    assert not is_sqs_event({"queryStringParameters": {}})
+    jobs = jobs_from_sqs({"Records": [{"eventSource": "aws:sqs", "messageId": "x", "body": "{"}]})
+    assert jobs == [{"id": "x", "event": None}]
+
+
+def test_complete_crawl_succeeds(crawls):
+    response = main.scrape_seller_products_by_category_action(
+        crawl_event()["queryStringParameters"], crawl_event()["body"], None
+    )
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["pages_left"] == 0
+
+
+def test_failed_or_partial_crawls_are_redelivered(crawls):
+    crawls["shop-error"] = "error"
+    crawls["shop-partial"] = "partial"
+    events = []
+    for job_id in ("shop-0", "shop-error", "shop-partial"):
+        event = crawl_event()
+        event["queryStringParameters"]["job_id"] = job_id
+        events.append(event)
+
+    response = main.handler(sqs_event(*events), None)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "m1"}, {"itemIdentifier": "m2"}]}
+
+
+def test_action_without_a_response_is_a_failure():
+    def run_action(event, context):
+        return event.get("response")
+
+    jobs = [
+        {"id": 0, "event": {"queryStringParameters": {"action": "a"}, "response": {"statusCode": 200}}},
+        {"id": 1, "event": {"queryStringParameters": {"action": "a"}, "response": None}},
+        {"id": 2, "event": {"queryStringParameters": {"action": "a"}, "response": {"statusCode": 400}}},
+        {"id": 3, "event": None},
+    ]
+    outcomes = asyncio.run(run_batch(jobs, run_action))
+    assert [outcome["status"] for outcome in outcomes] == ["success", "error", "error", "error"]
+    assert outcomes[2]["statusCode"] == 400
+
+
+def test_jobs_not_started_before_the_deadline_fail():
+    jobs = [{"id": 0, "event": {"queryStringParameters": {"action": "a"}}}]
+    outcomes = asyncio.run(
+        run_batch(jobs, lambda event, context: {"statusCode": 200}, deadline=time.monotonic() - 1)
+    )
+    assert outcomes[0]["status"] == "error"
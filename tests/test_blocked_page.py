@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from scraping_logics.request_handler import is_blocked_page
+
+GOLDEN_PAGES = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "golden_pages")
+
+
+def golden_page(name):
+    with open(os.path.join(GOLDEN_PAGES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_challenge_pages_are_recognised():
+    assert is_blocked_page(golden_page("blocked_captcha.html")) == "captcha"
+    assert is_blocked_page(golden_page("blocked_ip.html")) == "blocked"
+
+
+@pytest.mark.parametrize(
+    "title, reason",
+    [
+        ("Just a moment...", "captcha"),
+        ("Attention Required! | Cloudflare", "blocked"),
+        ("403 Forbidden", "blocked"),
+    ],
+)
+def test_challenge_titles(title, reason):
+    assert is_blocked_page(f"<html><head><title>{title}</title></head></html>") == reason
+
+
+def test_cloudflare_challenge_form():
+    page = '<html><body><form id="challenge-form" action="/"></form></body></html>'
+    assert is_blocked_page(page) == "captcha"
+
+
+def test_product_page_mentioning_the_markers_is_not_blocked():
+    page = golden_page("product_search_variants.html").replace(
+        "</body>",
+        "<div class=\"review\">Ho dovuto risolvere un captcha, il mio ordine era blocked"
+        " e l'account banned per un giorno.</div>"
+        "<script>window.captchaEnabled = false; var blocked = [];</script></body>",
+    )
+    assert "</body>" in golden_page("product_search_variants.html")
+    assert is_blocked_page(page) is None
+    assert is_blocked_page("<title>Blocked Drain Opener | Trovaprezzi.it</title>") is None
+    assert is_blocked_page("") is None
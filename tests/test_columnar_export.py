@@ -0,0 +1,83 @@
+from datetime import datetime
+
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+from scraping_logics import columnar_export
+from scraping_logics.columnar_export import OfferExporter, export_competitor_results, price_to_cents
+from scraping_logics.seller_products import OfferRecord
+
+SCRAPED_AT = "2026-10-19T10:00:00"
+
+
+@pytest.fixture
+def export_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar_export, "EXPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(columnar_export, "EXPORT_BUCKET", "")
+    return tmp_path
+
+
+def test_price_to_cents():
+    assert price_to_cents("1.234,56 €") == 123456
+    assert price_to_cents("9,9") == 990
+    assert price_to_cents(12.5) == 1250
+    assert price_to_cents("n.d.") is None
+    assert price_to_cents(None) is None
+
+
+def test_offers_round_trip(export_dir):
+    exporter = OfferExporter("shop")
+    exporter.add_records(
+        [
+            OfferRecord("Tea Tree", "9,90 €", "https://www.trovaprezzi.it/goto/123", "img", 1,
+                        "shop", "42", SCRAPED_AT, category_name="Cosmetici"),
+            OfferRecord("No id", None, "https://example/offer", None, 2, "shop", None, SCRAPED_AT),
+        ]
+    )
+    path = exporter.close()
+
+    rows = pq.read_table(path).to_pylist()
+    assert rows[0] == {
+        "offer_id": 123,
+        "merchant": "shop",
+        "category": "Cosmetici",
+        "page": 1,
+        "name": "Tea Tree",
+        "price_cents": 990,
+        "url": "https://www.trovaprezzi.it/goto/123",
+        "image_url": "img",
+        "scraped_at": datetime.fromisoformat(SCRAPED_AT),
+    }
+    assert rows[1]["offer_id"] is None
+    assert rows[1]["category"] is None
+    assert rows[1]["price_cents"] is None
+
+
+def test_competitor_results_keep_any_product_id(export_dir):
+    job = {
+        "id": 7,
+        "products": [{"id": 1, "name": "Numeric"}, {"id": "sku-9", "name": "Text"}],
+    }
+    results = [
+        {"product_id": 1, "scraping_result": ([{"venditore": "a", "prezzo": 10.0}], "/s1")},
+        {"product_id": "sku-9", "scraping_result": (
+            [{"venditore": "b", "prezzo": 5.0}, {"venditore": "c", "prezzo": 6.5}], "/s2"
+        )},
+        {"product_id": 3, "scraping_result": ("Errore", False)},
+    ]
+    path = export_competitor_results(job, results)
+
+    rows = pq.read_table(path).to_pylist()
+    assert [(row["product_id"], row["product_name"], row["competitor"], row["rank"],
+             row["price_cents"]) for row in rows] == [
+        ("1", "Numeric", "a", 1, 1000),
+        ("sku-9", "Text", "b", 1, 500),
+        ("sku-9", "Text", "c", 2, 650),
+    ]
+    assert {row["job_id"] for row in rows} == {"7"}
+
+
+def test_nothing_is_written_without_export_dir(monkeypatch):
+    monkeypatch.setattr(columnar_export, "EXPORT_DIR", "")
+    assert export_competitor_results({"products": []}, []) is None
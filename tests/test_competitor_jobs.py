@@ -0,0 +1,190 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scraping_logics import competitor_jobs, request_handler
+from scraping_logics.competitor_jobs import record_prices, run_competitor_job
+from scraping_logics.request_handler import ScraperResponse, get_page_content
+from scraping_logics.shard_planner import LatencyStats
+from scraping_logics.price_history import PriceHistory
+
+SCHEDA_URL = "https://www.trovaprezzi.it/notebook/prezzi-scheda-prodotto/hp_15"
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    history = PriceHistory(path=str(tmp_path / "price_history.sqlite3"), bucket="")
+    monkeypatch.setattr(competitor_jobs, "price_history", history)
+    return history
+
+
+def completed(product_id, scraping_result):
+    return {"product_id": product_id, "scraping_result": scraping_result, "status": "completed"}
+
+
+def test_prices_are_recorded_cheapest_offer_per_competitor(history):
+    result = completed(
+        "1",
+        (
+            [
+                {"venditore": "a", "prezzo": "10,50 €"},
+                {"venditore": "a", "prezzo": "9,90 €"},
+                {"venditore": "b", "prezzo": None},
+            ],
+            SCHEDA_URL,
+        ),
+    )
+    record_prices(result)
+    assert result["price_changes"] == [
+        {"competitor": "a", "price_cents": 990, "previous_cents": None}
+    ]
+
+
+def test_page_without_offers_counts_as_a_scrape(history):
+    result = completed("1", ([], SCHEDA_URL))
+    record_prices(result)
+    assert result["price_changes"] == []
+    assert history.activity(["1"])["1"]["last_scraped"] > 0
+
+
+@pytest.mark.parametrize(
+    "result",
+    [
+        completed("1", ("Pagina bloccata", False)),
+        completed("1", ("Errore HTTP 503", False)),
+        completed("1", None),
+        {"product_id": "1", "scraping_result": ("Timeout after 180s", False), "status": "timeout"},
+    ],
+)
+def test_failed_scrapes_leave_the_product_due(history, result):
+    record_prices(result)
+    assert "price_changes" not in result
+    assert history.activity(["1"]) == {}
+
+
+class StuckFetcher:
+    """get_page that keeps retrying until its cancel_event is set"""
+
+    def __init__(self):
+        self.attempts = 0
+        self.stopped = threading.Event()
+
+    def __call__(self, url, page_number=None, max_retries=100, cancel_event=None):
+        while not (cancel_event is not None and cancel_event.is_set()):
+            self.attempts += 1
+            time.sleep(0.01)
+        self.stopped.set()
+        return None
+
+
+def test_timeout_stops_the_fetch_in_progress(monkeypatch):
+    fetcher = StuckFetcher()
+    monkeypatch.setattr(request_handler.tls_scraper, "get_page", fetcher)
+    product = {"id": 1, "name": "Named Tea Tree", "scheda_prodotto": SCHEDA_URL}
+
+    results = asyncio.run(run_competitor_job([product], timeout=0.2, start_interval=0))
+
+    assert results[0]["status"] == "timeout"
+    assert results[0]["scraping_result"][1] is False
+    # The retry loop ends with the job instead of holding its thread
+    assert fetcher.stopped.wait(2)
+
+
+def test_deadline_skips_products_not_started(monkeypatch):
+    products = [{"id": index, "name": "x", "scheda_prodotto": SCHEDA_URL} for index in range(3)]
+    results = asyncio.run(
+        run_competitor_job(products, deadline=time.monotonic() - 1, start_interval=0)
+    )
+    assert [result["status"] for result in results] == ["skipped"] * 3
+    assert [result["product_id"] for result in results] == [0, 1, 2]
+
+
+def test_a_cancelled_shared_fetch_is_redone_for_the_other_callers(monkeypatch):
+    started = threading.Event()
+    calls = []
+
+    def get_page(url, page_number=None, max_retries=100, cancel_event=None):
+        calls.append(cancel_event)
+        if len(calls) == 1:
+            started.set()
+            while not cancel_event.is_set():
+                time.sleep(0.01)
+            return None
+        return ScraperResponse(url, "ok", 200)
+
+    monkeypatch.setattr(request_handler.tls_scraper, "get_page", get_page)
+    request_handler.page_flight.reset()
+    leader_cancel, follower_cancel = threading.Event(), threading.Event()
+    url = "https://www.trovaprezzi.it/shared"
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(
+            get_page_content, url, "t", callback=lambda r: r, cancel_event=leader_cancel
+        )
+        started.wait(2)
+        follower = executor.submit(
+            get_page_content, url, "t", callback=lambda r: r, cancel_event=follower_cancel
+        )
+        time.sleep(0.1)
+        leader_cancel.set()
+        assert leader.result(2) is False
+        assert follower.result(2).status == 200
+    request_handler.page_flight.reset()
+
+
+class BackendSession:
+    """aiohttp session stand-in that accepts every POST"""
+
+    def __init__(self):
+        self.bodies = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def post(self, url, data=None, headers=None):
+        self.bodies.append(json.loads(data))
+        return self
+
+    @property
+    def status(self):
+        return 200
+
+
+def test_price_history_is_written_off_the_event_loop(history, monkeypatch, tmp_path):
+    session = BackendSession()
+    monkeypatch.setattr(competitor_jobs, "create_session", lambda: session)
+    monkeypatch.setattr(
+        competitor_jobs, "latency_stats", LatencyStats(path=str(tmp_path / "latency.json"))
+    )
+    monkeypatch.setattr(
+        competitor_jobs,
+        "scrape_competitor_product",
+        lambda product, cancel_event=None: ([{"venditore": "a", "prezzo": 9.9}], SCHEDA_URL),
+    )
+    writer_threads = []
+    record = competitor_jobs.record_prices
+
+    def recording(result):
+        writer_threads.append(threading.current_thread())
+        record(result)
+
+    monkeypatch.setattr(competitor_jobs, "record_prices", recording)
+    job = {"id": 3, "products": [{"id": "1", "name": "x"}, {"id": "2", "name": "y"}]}
+
+    outcome = asyncio.run(competitor_jobs.process_scraping_job(job, base_url="http://backend"))
+
+    assert outcome["updated"] is True
+    assert len(writer_threads) == 2
+    assert threading.main_thread() not in writer_threads
+    final = session.bodies[-1]
+    assert final["update"]["final"] is True
+    assert [result["price_changes"] for result in final["result_data"]] == [
+        [{"competitor": "a", "price_cents": 990, "previous_cents": None}]
+    ] * 2
@@ -0,0 +1,93 @@
+import pytest
+
+from scraping_logics import crawl_checkpoint
+from scraping_logics.crawl_checkpoint import (
+    S3CheckpointStore,
+    SQLiteCheckpointStore,
+    create_checkpoint_store,
+)
+
+BUCKET = "checkpoints"
+
+
+@pytest.fixture
+def local_s3(monkeypatch):
+    """In-process stand-in for the S3 bucket"""
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        yield
+
+
+@pytest.fixture(params=["sqlite", "s3"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteCheckpointStore(path=str(tmp_path / "checkpoints.sqlite3"))
+    request.getfixturevalue("local_s3")
+    return S3CheckpointStore(bucket=BUCKET, prefix="crawl-checkpoints/", endpoint_url=None)
+
+
+def plan(pages):
+    return [
+        {
+            "page_number": page,
+            "url": f"https://www.trovaprezzi.it/negozi/shop/offerte?page={page}",
+            "expected_products": 20,
+            "category_id": "7",
+            "scraped": False,
+            "products": [{"name": "not checkpointed"}],
+        }
+        for page in range(1, pages + 1)
+    ]
+
+
+def test_unknown_job_has_no_checkpoint(store):
+    assert store.load("missing") is None
+
+
+def test_resume_from_the_first_unscraped_page(store):
+    urls = plan(4)
+    store.start("job-1", "shop", urls)
+    store.mark_scraped("job-1", [{**urls[0], "scraped_products": 20}])
+    store.mark_scraped("job-1", [{**urls[1], "scraped_products": 18}])
+
+    checkpoint = store.load("job-1")
+    assert checkpoint["venditore"] == "shop"
+    assert [entry["scraped"] for entry in checkpoint["urls"]] == [True, True, False, False]
+    assert [entry["scraped_products"] for entry in checkpoint["urls"]] == [20, 18, 0, 0]
+    assert all(entry["products"] == [] for entry in checkpoint["urls"])
+    assert checkpoint["urls"][0]["category_id"] == "7"
+
+
+def test_start_keeps_pages_already_scraped_and_drops_old_progress(store):
+    urls = plan(3)
+    store.start("job-1", "shop", urls)
+    store.mark_scraped("job-1", [{**urls[2], "scraped_products": 5}])
+
+    store.start("job-1", "shop", [{**urls[0], "scraped": True, "scraped_products": 20}] + urls[1:])
+    scraped = [entry["scraped"] for entry in store.load("job-1")["urls"]]
+    assert scraped == [True, False, False]
+
+
+def test_finished_crawls_are_forgotten(store):
+    store.start("job-1", "shop", plan(2))
+    store.start("job-2", "other", plan(1))
+    store.finish("job-1")
+    assert store.load("job-1") is None
+    assert store.load("job-2")["venditore"] == "other"
+
+
+def test_only_the_s3_store_is_durable(monkeypatch, tmp_path):
+    assert SQLiteCheckpointStore.durable is False
+    assert S3CheckpointStore.durable is True
+
+    monkeypatch.setattr(crawl_checkpoint, "CHECKPOINT_BUCKET", "")
+    assert create_checkpoint_store("s3") is None
+    assert create_checkpoint_store("off") is None
+    monkeypatch.setattr(crawl_checkpoint, "checkpoint_store", None)
+    assert crawl_checkpoint.checkpoints_durable() is False
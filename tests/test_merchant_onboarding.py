@@ -0,0 +1,106 @@
+import asyncio
+from concurrent.futures import Future
+
+import pytest
+
+from scraping_logics import merchant_onboarding
+
+
+def done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class FakeMerchantScraper:
+    merchant_error = None
+
+    def __init__(self, venditore):
+        self.venditore = venditore
+        self.sent = False
+
+    def fetch_pages(self):
+        return done("merchant page"), done("categories page")
+
+    def _scrape(self, response):
+        if self.merchant_error:
+            raise self.merchant_error
+        return {"status": "success"}
+
+    def _scrape_categories(self, response):
+        return {"status": "success", "data": [{"category_id": "42", "title": "Cosmetici", "count": 40}]}
+
+    def send_merchant_data(self):
+        self.sent = True
+        return {"status": "success"}
+
+
+@pytest.fixture
+def crawl(monkeypatch):
+    state = {"finished": False, "cancelled": False, "error": None}
+
+    async def process_urls_batch(urls_array, venditore, concurrency, incremental, job_id):
+        try:
+            await asyncio.sleep(0.1)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+        if state["error"]:
+            raise state["error"]
+        state["finished"] = True
+        return [{**entry, "scraped": True} for entry in urls_array]
+
+    monkeypatch.setattr(merchant_onboarding, "MerchantInfoScraper", FakeMerchantScraper)
+    monkeypatch.setattr(merchant_onboarding, "process_urls_batch", process_urls_batch)
+    monkeypatch.setattr(merchant_onboarding, "checkpoint_store", None)
+    monkeypatch.setattr(FakeMerchantScraper, "merchant_error", None)
+    return state
+
+
+def onboard():
+    return asyncio.run(merchant_onboarding._onboard("shop", None, False, "shop"))
+
+
+def test_crawl_runs_alongside_the_merchant_info(crawl):
+    result = onboard()
+    assert crawl["finished"]
+    assert result["status"] == "success"
+    assert result["merchant_info"] == {"status": "success"}
+    assert all(entry["scraped"] for entry in result["urls_array"])
+
+
+def test_merchant_info_failure_lets_the_crawl_finish(crawl, monkeypatch):
+    monkeypatch.setattr(FakeMerchantScraper, "merchant_error", RuntimeError("parse error"))
+    result = onboard()
+    assert crawl["finished"]
+    assert result["status"] == "success"
+    assert result["merchant_info"] == {"status": "error", "message": "parse error"}
+
+
+def test_crawl_failure_leaves_no_task_behind(crawl, monkeypatch):
+    crawl["error"] = RuntimeError("crawl failed")
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await merchant_onboarding._onboard("shop", None, False, "shop")
+        current = asyncio.current_task()
+        return [task for task in asyncio.all_tasks() if task is not current]
+
+    assert asyncio.run(run()) == []
+
+
+def test_error_before_the_crawl_ends_cancels_it(crawl, monkeypatch):
+    def send_merchant_data(self):
+        raise RuntimeError("backend down")
+
+    monkeypatch.setattr(FakeMerchantScraper, "send_merchant_data", send_merchant_data)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await merchant_onboarding._onboard("shop", None, False, "shop")
+        current = asyncio.current_task()
+        return [task for task in asyncio.all_tasks() if task is not current]
+
+    assert asyncio.run(run()) == []
+    assert crawl["cancelled"]
+    assert not crawl["finished"]
@@ -0,0 +1,76 @@
+import pytest
+
+from scraping_logics.offer_snapshot import OfferSnapshot, SnapshotDiff, offer_id, page_hash
+from scraping_logics.seller_products import OfferRecord
+
+PAGE_1 = "https://www.trovaprezzi.it/negozi/shop/offerte?page=1"
+PAGE_2 = "https://www.trovaprezzi.it/negozi/shop/offerte?page=2"
+
+
+def offer(goto_id, price, name="Prodotto"):
+    url = f"https://www.trovaprezzi.it/goto/{goto_id}?impression=abc" if goto_id else "/x"
+    return OfferRecord(name, price, url, "img.jpg", 1, "shop", None, "2025-01-01")
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    return OfferSnapshot(path=str(tmp_path / "offer_snapshot.sqlite3"))
+
+
+def first_run(snapshot):
+    diff = SnapshotDiff(snapshot, "shop")
+    diff.filter_products(PAGE_1, 11, [offer(1, "10,00"), offer(2, "5,00")])
+    diff.filter_products(PAGE_2, 22, [offer(3, "7,00")])
+    assert diff.commit()
+    return diff
+
+
+def test_offer_id_and_page_hash():
+    assert offer_id("https://www.trovaprezzi.it/goto/123456?impression=x") == 123456
+    assert offer_id("https://www.trovaprezzi.it/prezzo_x.aspx") is None
+    assert offer_id(None) is None
+    # Impression tokens change on every request for the same page
+    assert page_hash('<a href="/goto/1?impression=aaa">') == page_hash('<a href="/goto/1?impression=bbb">')
+    assert page_hash("<p>10,00</p>") != page_hash("<p>9,00</p>")
+
+
+def test_first_run_uploads_every_offer(snapshot):
+    diff = first_run(snapshot)
+    assert diff.stats() == {
+        "skipped_pages": 0, "new_offers": 3, "changed_offers": 0, "unchanged_offers": 0,
+    }
+
+
+def test_rescrape_uploads_only_new_and_changed_offers(snapshot):
+    first_run(snapshot)
+    diff = SnapshotDiff(snapshot, "shop")
+    upload = diff.filter_products(
+        PAGE_1, 12, [offer(1, "10,00"), offer(2, "4,50"), offer(4, "1,00"), offer(None, "2,00")]
+    )
+    assert [record.price for record in upload] == ["4,50", "1,00", "2,00"]
+    assert diff.stats()["unchanged_offers"] == 1
+    assert diff.stats()["changed_offers"] == 1
+    assert diff.stats()["new_offers"] == 1
+
+
+def test_unchanged_pages_carry_their_offers_over(snapshot):
+    first_run(snapshot)
+    diff = SnapshotDiff(snapshot, "shop")
+    assert diff.carry_over(PAGE_2, 22) == 1
+    assert diff.carry_over(PAGE_1, 99) is None
+    assert diff.stats()["skipped_pages"] == 1
+    assert 3 in diff.offers
+
+
+def test_only_offers_of_fetched_pages_are_removed(snapshot):
+    first_run(snapshot)
+    diff = SnapshotDiff(snapshot, "shop")
+    # Offer 2 is gone from page 1; page 2 was not fetched, so offer 3 stays
+    diff.filter_products(PAGE_1, 13, [offer(1, "10,00")])
+    assert diff.removed_offers() == [2]
+    assert diff.commit()
+
+    offers, pages = snapshot.load("shop")
+    assert sorted(offers) == [1, 3]
+    assert pages == {PAGE_1: 13, PAGE_2: 22}
+    assert snapshot.load("other") == ({}, {})
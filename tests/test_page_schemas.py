@@ -0,0 +1,28 @@
+from scraping_logics.page_schemas import PRODUCT_PAGE, SelectorChain, make_soup
+
+RELATED_ONLY = """
+<div class="related_products"><a href="/prezzo_related.aspx">Correlato</a></div>
+"""
+SIDEBAR_AND_RELATED = """
+<div class="desktop_sidebar"><a class="suggested_product" href="/prezzo_sidebar.aspx">Sidebar</a></div>
+<div class="related_products"><a href="/prezzo_related.aspx">Correlato</a></div>
+"""
+
+
+def test_chain_remembers_the_last_specific_hit():
+    chain = SelectorChain("a.first", "a.second")
+    assert chain.select_one(make_soup('<a class="second">x</a>')).text == "x"
+    assert chain._preferred == 1
+
+
+def test_suggestions_catch_all_is_never_remembered():
+    chain = PRODUCT_PAGE["suggestions"]
+    chain._preferred = 0
+
+    matches = chain.select(make_soup(RELATED_ONLY))
+    assert [link["href"] for link in matches] == ["/prezzo_related.aspx"]
+    assert chain._preferred == 0
+
+    # A later page with a specific match is not shadowed by the generic links
+    matches = chain.select(make_soup(SIDEBAR_AND_RELATED))
+    assert [link["href"] for link in matches] == ["/prezzo_sidebar.aspx"]
@@ -0,0 +1,85 @@
+import pytest
+
+from scraping_logics import seller_products
+from scraping_logics.seller_products import get_pagination_urls
+
+
+class FakeListing:
+    """Offers listing of a merchant with `last_page` pages, counting the probes"""
+
+    def __init__(self, last_page, visible_pages=5, results_count=None, past_end="empty"):
+        self.last_page = last_page
+        self.visible_pages = visible_pages
+        self.results_count = results_count
+        self.past_end = past_end
+        self.probes = []
+
+    def __call__(self, negozio, page_number):
+        self.probes.append(page_number)
+        info = {
+            "offers": 20,
+            "results_count": self.results_count,
+            "max_visible_page": min(self.last_page, self.visible_pages),
+            "current_page": page_number,
+        }
+        if page_number > self.last_page:
+            if self.past_end == "empty":
+                info["offers"] = 0
+            else:
+                # The site serves its last page instead of an empty one
+                info["current_page"] = self.last_page
+        return info
+
+
+@pytest.fixture
+def listing(monkeypatch):
+    def install(*args, **kwargs):
+        fake = FakeListing(*args, **kwargs)
+        monkeypatch.setattr(seller_products, "_probe_listing_page", fake)
+        return fake
+
+    return install
+
+
+def page_numbers(plan):
+    return [entry["page_number"] for entry in plan]
+
+
+def test_results_count_gives_the_last_page_in_one_request(listing):
+    fake = listing(last_page=7, results_count=121)
+    plan = get_pagination_urls("shop")
+    assert page_numbers(plan) == list(range(1, 8))
+    assert fake.probes == [1]
+    assert plan[0]["url"] == "https://www.trovaprezzi.it/negozi/shop/offerte?page=1"
+    assert plan[0]["scraped"] is False
+
+
+@pytest.mark.parametrize("last_page", [1, 5, 6, 37, 160, 1000])
+@pytest.mark.parametrize("past_end", ["empty", "redirect"])
+def test_gallop_and_binary_search_find_the_last_page(listing, last_page, past_end):
+    fake = listing(last_page=last_page, past_end=past_end)
+    plan = get_pagination_urls("shop")
+    assert page_numbers(plan)[-1] == last_page
+    assert len(fake.probes) <= 2 * max(1, last_page).bit_length() + 1
+
+
+def test_max_pages_caps_the_plan(listing):
+    listing(last_page=1000)
+    assert len(get_pagination_urls("shop", max_pages=50)) == 50
+
+
+def test_failed_first_page_gives_a_single_page_plan(monkeypatch):
+    monkeypatch.setattr(seller_products, "_probe_listing_page", lambda negozio, page: None)
+    assert page_numbers(get_pagination_urls("shop")) == [1]
+
+
+def test_error_during_probing_keeps_the_pages_known_to_exist(listing, monkeypatch):
+    fake = listing(last_page=100)
+
+    def flaky(negozio, page_number):
+        if page_number > 20:
+            raise ConnectionError("reset")
+        return fake(negozio, page_number)
+
+    monkeypatch.setattr(seller_products, "_probe_listing_page", flaky)
+    assert page_numbers(get_pagination_urls("shop"))[-1] == 20
@@ -0,0 +1,113 @@
+import json
+import os
+
+import pytest
+
+from scraping_logics import price_analytics
+from scraping_logics.price_analytics import (
+    attach_price_analytics,
+    our_price_cents,
+    own_merchant,
+    price_positions,
+)
+
+EVENT_FILE = os.path.join(os.path.dirname(__file__), os.pardir, "events", "event.json")
+
+
+def scraped(*offers):
+    return {"scraping_result": ([{"venditore": name, "prezzo": price} for name, price in offers], "url")}
+
+
+def test_our_price_cents():
+    assert our_price_cents({"price": "10.00"}) == 1000
+    assert our_price_cents({"price": 5}) == 500
+    assert our_price_cents({}) is None
+
+
+def test_positions_against_competitors():
+    positions = price_positions(
+        [{"price": "10.00"}],
+        [scraped(("a", 9.5), ("me", 1.0), ("b", 12.0), ("c", None))],
+        own_merchant="me",
+    )
+    position = positions[0]
+    # Our own offer and the offer without a price are left out
+    assert position["competitors"] == 2
+    assert position["cheapest"] == 9.5
+    assert position["our_price"] == 10.0
+    assert position["gap_to_cheapest"] == 0.5
+    assert position["gap_to_cheapest_pct"] == 5.26
+    assert position["undercutting"] == 1
+    assert position["our_rank"] == 2
+    assert position["median"] == 10.75
+    assert position["p25"] == pytest.approx(10.125, abs=0.01)
+    assert position["p75"] == pytest.approx(11.375, abs=0.01)
+
+
+def test_cheapest_offer_is_rank_one():
+    position = price_positions([{"price": "8"}], [scraped(("a", 9.0), ("b", 10.0))])[0]
+    assert position["undercutting"] == 0
+    assert position["our_rank"] == 1
+    assert position["gap_to_cheapest"] == -1.0
+
+
+def test_unknown_own_price_leaves_rank_empty():
+    position = price_positions([{"price": None}], [scraped(("a", 3.0))])[0]
+    assert position["cheapest"] == 3.0
+    assert position["our_price"] is None
+    assert position["our_rank"] is None
+    assert position["undercutting"] is None
+
+
+def test_positions_stay_aligned_with_results():
+    positions = price_positions(
+        [{"price": "1"}, {"price": "2"}, {"price": "3"}],
+        [
+            {"scraping_result": ("Nessun risultato", False)},
+            scraped(("a", 2.5)),
+            {"scraping_result": None},
+        ],
+    )
+    assert positions[0] is None
+    assert positions[1]["cheapest"] == 2.5
+    assert positions[1]["our_rank"] == 1
+    assert positions[2] is None
+
+
+def test_no_results():
+    assert price_positions([], []) == []
+
+
+@pytest.fixture
+def event_job():
+    """The scraping job of events/event.json"""
+    with open(EVENT_FILE, encoding="utf-8") as f:
+        return json.load(f)["body"]["scraping_job"]
+
+
+def test_own_merchant_comes_from_the_business_id(event_job, monkeypatch):
+    assert own_merchant(event_job) is None
+    monkeypatch.setattr(price_analytics, "OWN_MERCHANTS", {"10": "erboristeria-named"})
+    assert own_merchant(event_job) == "erboristeria-named"
+    assert own_merchant({**event_job, "business_name": "altro"}) == "altro"
+
+
+def test_own_offer_is_not_a_competitor(event_job, monkeypatch):
+    monkeypatch.setattr(price_analytics, "OWN_MERCHANTS", {"10": "erboristeria-named"})
+    results = [
+        {
+            "product_id": 6,
+            "scraping_result": (
+                [
+                    {"venditore": "erboristeria-named", "prezzo": 10.0},
+                    {"venditore": "farmacia", "prezzo": 9.0},
+                ],
+                "https://www.trovaprezzi.it/scheda",
+            ),
+        }
+    ]
+    attach_price_analytics(event_job, results)
+    analytics = results[0]["price_analytics"]
+    assert analytics["competitors"] == 1
+    assert analytics["undercutting"] == 1
+    assert analytics["our_rank"] == 2
@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+from scraping_logics.price_history import PriceHistory
+
+
+@pytest.fixture
+def history(tmp_path):
+    return PriceHistory(path=str(tmp_path / "price_history.sqlite3"), bucket="")
+
+
+def test_first_scrape_reports_every_competitor(history):
+    changes = history.record("1", {"a": 1000, "b": 1200}, observed_at=100)
+    assert sorted(changes, key=lambda change: change["competitor"]) == [
+        {"competitor": "a", "price_cents": 1000, "previous_cents": None},
+        {"competitor": "b", "price_cents": 1200, "previous_cents": None},
+    ]
+
+
+def test_same_prices_extend_the_run(history):
+    history.record("1", {"a": 1000}, observed_at=100)
+    assert history.record("1", {"a": 1000}, observed_at=200) == []
+    runs = history.history("1")
+    assert len(runs) == 1
+    assert runs[0]["first_seen"] == 100
+    assert runs[0]["last_seen"] == 200
+    assert runs[0]["observations"] == 2
+
+
+def test_price_change_and_gone_competitor(history):
+    history.record("1", {"a": 1000, "b": 1200}, observed_at=100)
+    changes = history.record("1", {"a": 900}, observed_at=200)
+    assert sorted(changes, key=lambda change: change["competitor"]) == [
+        {"competitor": "a", "price_cents": 900, "previous_cents": 1000},
+        {"competitor": "b", "price_cents": None, "previous_cents": 1200},
+    ]
+    # A competitor that stays gone is not reported again
+    assert history.record("1", {"a": 900}, observed_at=300) == []
+
+
+def test_record_returns_none_when_the_history_cannot_be_written(history, monkeypatch):
+    def locked():
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(history, "_connect", locked)
+    assert history.record("1", {"a": 1000}, observed_at=100) is None
+
+
+def test_changes_since(history):
+    history.record("1", {"a": 1000}, observed_at=100)
+    history.record("2", {"a": 500}, observed_at=100)
+    history.record("1", {"a": 900}, observed_at=200)
+    history.record("2", {"a": 500}, observed_at=200)
+    history.record("1", {"a": 950}, observed_at=300)
+
+    assert history.changes_since(150) == [
+        {"product_id": "1", "competitor": "a", "price_cents": 900,
+         "changed_at": 200, "previous_cents": 1000},
+        {"product_id": "1", "competitor": "a", "price_cents": 950,
+         "changed_at": 300, "previous_cents": 900},
+    ]
+    assert [change["changed_at"] for change in history.changes_since(250)] == [300]
+    assert history.changes_since(0, product_ids=["2"])[0]["price_cents"] == 500
+    assert history.changes_since(0, product_ids=[]) == []
+
+
+def test_activity_counts_changes_and_scrapes_without_prices(history):
+    history.record("1", {"a": 1000}, observed_at=100)
+    history.record("1", {"a": 900}, observed_at=200)
+    history.mark_scraped("2", observed_at=300)
+
+    activity = history.activity(["1", "2", "3"])
+    assert activity["1"] == {
+        "changes": 1, "first_seen": 100, "last_seen": 200, "last_scraped": 200,
+    }
+    assert activity["2"]["changes"] == 0
+    assert activity["2"]["last_scraped"] == 300
+    assert "3" not in activity
@@ -0,0 +1,71 @@
+from scraping_logics.product_matcher import ProductMatcher, extract_model_codes, tokenize
+
+
+def test_tokenize_lowercases_and_drops_punctuation():
+    assert tokenize("Named Tea-Tree, 50ml") == {"named", "tea", "tree", "50ml"}
+
+
+def test_extract_model_codes_keeps_order_without_duplicates():
+    assert extract_model_codes("HP 9B9R8EA ABC12-XY 9B9R8EA") == ("9b9r8ea", "abc12-xy")
+
+
+def test_query_is_url_decoded():
+    matcher = ProductMatcher("Named%20Tea%20Tree")
+    assert matcher.keywords == {"named", "tea", "tree"}
+
+
+def test_model_code_match_outranks_token_overlap():
+    matcher = ProductMatcher("HP Laptop 15 9B9R8EA")
+    ranked = matcher.rank(
+        [
+            {"title": "HP Laptop 15", "url": "/a"},
+            {"title": "HP 9B9R8EA", "url": "/b"},
+        ]
+    )
+    assert [candidate["url"] for candidate in ranked] == ["/b", "/a"]
+    assert ranked[0]["score"] > ranked[1]["score"]
+
+
+def test_model_code_is_also_matched_in_the_url():
+    matcher = ProductMatcher("Stampante 9B9R8EA")
+    assert matcher.score("Stampante", "/p/9b9r8ea") > matcher.score("Stampante", "/p/altro")
+
+
+def test_active_candidate_wins_a_tie():
+    matcher = ProductMatcher("Named Tea Tree")
+    assert matcher.score("Named Tea Tree", active=True) == matcher.score("Named Tea Tree") + 0.5
+
+
+def test_rank_skips_incomplete_candidates_and_keeps_page_order_on_ties():
+    matcher = ProductMatcher("Tea Tree")
+    ranked = matcher.rank(
+        [
+            {"title": "Tea Tree", "url": "/first"},
+            {"title": "", "url": "/no-title"},
+            {"title": "Tea Tree", "url": None},
+            {"title": "Tea Tree", "url": "/second"},
+        ]
+    )
+    assert [candidate["url"] for candidate in ranked] == ["/first", "/second"]
+
+
+def test_best_requires_a_positive_score():
+    matcher = ProductMatcher("Named Tea Tree")
+    assert matcher.best([{"title": "Sapone", "url": "/x"}]) is None
+    assert matcher.best([{"title": "Tea Tree oil", "url": "/y"}])["url"] == "/y"
+
+
+def test_brand_names_sizes_and_numbers_are_not_model_codes():
+    assert extract_model_codes("SAMSUNG Galaxy A54 128GB") == ()
+    assert extract_model_codes("Powerbank Anker 10000 mAh") == ()
+    assert extract_model_codes("Powerbank 10000MAH 65W") == ()
+    assert extract_model_codes("LG 55UQ75006LF") == ("55uq75006lf",)
+
+
+def test_same_product():
+    matcher = ProductMatcher("Notebook HP 9B9R8EA 512GB")
+    assert matcher.same_product("HP Laptop 15 9B9R8EA 512GB")
+    assert not matcher.same_product("HP Laptop 15 9B9R8EA 1TB")
+    assert not matcher.same_product("Cover 9B9R8EA")
+    assert not matcher.same_product("HP Laptop 15 9B9R8EA 7C1D2EA")
+    assert not ProductMatcher("SAMSUNG Galaxy A54").same_product("SAMSUNG Galaxy A54")
@@ -0,0 +1,67 @@
+import pytest
+
+from scraping_logics.price_history import PriceHistory
+from scraping_logics.refresh_scheduler import (
+    HOUR,
+    REFRESH_MAX_HOURS,
+    REFRESH_MIN_HOURS,
+    change_rate,
+    plan_refresh,
+    refresh_interval,
+)
+
+NOW = 1_000_000_000
+
+
+@pytest.fixture
+def history(tmp_path):
+    return PriceHistory(path=str(tmp_path / "price_history.sqlite3"), bucket="")
+
+
+def test_volatile_products_are_refreshed_more_often():
+    calm = {"changes": 0, "first_seen": NOW - 30 * 24 * HOUR, "last_seen": NOW}
+    volatile = {"changes": 30, "first_seen": NOW - 30 * 24 * HOUR, "last_seen": NOW}
+    assert change_rate(volatile) > change_rate(calm)
+    assert refresh_interval(change_rate(volatile)) < refresh_interval(change_rate(calm))
+
+
+def test_refresh_interval_is_clamped():
+    assert refresh_interval(1000) == REFRESH_MIN_HOURS * HOUR
+    assert refresh_interval(0) == REFRESH_MAX_HOURS * HOUR
+
+
+def test_never_scraped_products_come_first(history):
+    history.record("recent", {"a": 1000}, observed_at=NOW - HOUR)
+    history.record("stale", {"a": 1000}, observed_at=NOW - 200 * HOUR)
+    products = [
+        {"id": "recent", "scheda_prodotto": "https://example/recent"},
+        {"id": "stale", "scheda_prodotto": "https://example/stale"},
+        {"id": "new"},
+    ]
+
+    plan = plan_refresh(products, request_budget=10, now=NOW, history=history)
+
+    assert [product["id"] for product in plan["batch"]] == ["new", "stale"]
+    # A direct product page costs one request, a search three
+    assert plan["requests"] == 4
+    assert plan["schedule"]["new"]["priority"] is None
+    assert plan["schedule"]["new"]["due"] is True
+    assert plan["schedule"]["recent"]["due"] is False
+    assert plan["schedule"]["stale"]["priority"] > 1
+
+
+def test_scrape_without_prices_postpones_the_product(history):
+    history.mark_scraped("empty", observed_at=NOW - HOUR)
+    plan = plan_refresh([{"id": "empty"}], request_budget=10, now=NOW, history=history)
+    assert plan["batch"] == []
+    assert plan["schedule"]["empty"]["due"] is False
+
+
+def test_budget_skips_products_that_do_not_fit(history):
+    history.record("stale", {"a": 1000}, observed_at=NOW - 200 * HOUR)
+    products = [{"id": "new"}, {"id": "stale", "scheda_prodotto": "https://example/stale"}]
+
+    plan = plan_refresh(products, request_budget=1, now=NOW, history=history)
+
+    assert [product["id"] for product in plan["batch"]] == ["stale"]
+    assert plan["requests"] == 1
@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+from scraping_logics.scheda_index import SchedaIndex, normalize_title
+
+S23_URL = "https://www.trovaprezzi.it/cellulari/prezzi-scheda-prodotto/samsung_galaxy_s23"
+XIAOMI_URL = "https://www.trovaprezzi.it/powerbank/prezzi-scheda-prodotto/xiaomi_10000"
+HP_URL = "https://www.trovaprezzi.it/notebook/prezzi-scheda-prodotto/hp_15_9b9r8ea"
+
+
+@pytest.fixture
+def index(tmp_path):
+    return SchedaIndex(path=str(tmp_path / "scheda_index.sqlite3"))
+
+
+def test_title_lookup_ignores_word_order_and_encoding(index):
+    assert index.record("Named Tea Tree", 7, HP_URL)
+    assert index.lookup("Tree%20Tea%20Named", 7) == HP_URL
+    assert index.lookup("Named Tea Tree", 8) is None
+    assert normalize_title("B a") == "a b"
+
+
+def test_search_urls_are_not_recorded(index):
+    assert not index.record("Named Tea Tree", 7, "https://www.trovaprezzi.it/categoria.aspx?libera=tea")
+    assert index.lookup("Named Tea Tree", 7) is None
+
+
+def test_brand_and_size_do_not_resolve_another_phone(index):
+    index.record("SAMSUNG Galaxy S23 128GB", 1, S23_URL)
+    assert index.lookup("SAMSUNG Galaxy A54 128GB", 1) is None
+
+
+def test_capacity_does_not_resolve_another_powerbank(index):
+    index.record("Powerbank Xiaomi 10000 mAh", 2, XIAOMI_URL)
+    assert index.lookup("Powerbank Anker 10000 mAh", 2) is None
+
+
+def test_model_code_resolves_a_differently_worded_title(index):
+    index.record("HP Laptop 15 9B9R8EA", 3, HP_URL)
+    assert index.lookup("Notebook HP 9B9R8EA", 3) == HP_URL
+
+
+def test_model_code_hit_needs_the_titles_to_agree(index):
+    index.record("HP Laptop 15 9B9R8EA", 3, HP_URL)
+    # Same code, nothing else in common
+    assert index.lookup("Cover 9B9R8EA", 3) is None
+    # Same code, another size
+    index.record("SSD Crucial 1TB CT1000P3", 4, "https://example/1tb")
+    assert index.lookup("SSD Crucial 2TB CT1000P3", 4) is None
+
+
+def test_rows_without_a_title_are_not_used(tmp_path):
+    path = str(tmp_path / "scheda_index.sqlite3")
+    with sqlite3.connect(path) as connection:
+        connection.executescript(
+            """
+            CREATE TABLE scheda_by_model (
+                model_code TEXT NOT NULL, category_id TEXT NOT NULL,
+                url TEXT NOT NULL, updated_at TEXT NOT NULL,
+                PRIMARY KEY (model_code, category_id)
+            );
+            INSERT INTO scheda_by_model VALUES ('9b9r8ea', '3', 'https://example/old', 'x');
+            """
+        )
+    index = SchedaIndex(path=path)
+    assert index.lookup("Notebook HP 9B9R8EA", 3) is None
+    index.record("HP Laptop 15 9B9R8EA", 3, HP_URL)
+    assert index.lookup("Notebook HP 9B9R8EA", 3) == HP_URL
+
+
+def test_forget_drops_title_and_model_entries(index):
+    index.record("HP Laptop 15 9B9R8EA", 3, HP_URL)
+    index.forget(HP_URL)
+    assert index.lookup("HP Laptop 15 9B9R8EA", 3) is None
+    assert index.lookup("Notebook HP 9B9R8EA", 3) is None
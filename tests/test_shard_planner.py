@@ -0,0 +1,122 @@
+import io
+import json
+
+import boto3
+import pytest
+
+from scraping_logics import shard_planner
+from scraping_logics.shard_planner import (
+    SHARD_OVERHEAD_SECONDS,
+    LatencyStats,
+    dispatch_to_sqs,
+    load_shard_event,
+    plan_competitor_shards,
+    serialized_size,
+    split_by_cost,
+)
+
+
+def budget_for(capacity):
+    """Shard time budget that leaves `capacity` seconds of work for one worker"""
+    return SHARD_OVERHEAD_SECONDS + capacity
+
+
+def test_no_items():
+    assert split_by_cost([], [], workers=4) == []
+
+
+def test_everything_fits_in_one_shard():
+    items = list(range(10))
+    assert split_by_cost(items, [10] * 10, workers=1, budget=budget_for(100)) == [items]
+
+
+def test_shards_are_balanced_and_keep_order():
+    items = list(range(10))
+    shards = split_by_cost(items, [10] * 10, workers=1, budget=budget_for(60))
+    assert shards == [items[:5], items[5:]]
+
+
+def test_no_shard_exceeds_the_budget():
+    items = list("abcde")
+    costs = [40] * 5
+    shards = split_by_cost(items, costs, workers=1, budget=budget_for(100))
+    assert [item for shard in shards for item in shard] == items
+    assert all(len(shard) * 40 <= 100 for shard in shards)
+
+
+def test_more_workers_fit_more_work_per_shard():
+    items = list(range(20))
+    costs = [10] * 20
+    assert len(split_by_cost(items, costs, workers=1, budget=budget_for(100))) == 2
+    assert len(split_by_cost(items, costs, workers=2, budget=budget_for(100))) == 1
+
+
+def test_an_item_over_the_budget_gets_its_own_shard():
+    shards = split_by_cost(["a", "big", "b"], [10, 500, 10], workers=1, budget=budget_for(100))
+    assert ["big"] in shards
+    assert [item for shard in shards for item in shard] == ["a", "big", "b"]
+
+
+def test_shards_are_capped_by_serialized_size():
+    items = [{"url": "x" * 1000} for _ in range(10)]
+    shards = split_by_cost(items, [1] * 10, workers=20, max_bytes=3500)
+    assert [len(shard) for shard in shards] == [3, 3, 3, 1]
+    assert all(sum(serialized_size(item) for item in shard) <= 3500 for shard in shards)
+
+
+def test_competitor_jobs_stay_whole_unless_sharding_is_enabled(monkeypatch, tmp_path):
+    # No measured latencies: the defaults apply
+    stats = LatencyStats(path=str(tmp_path / "latency_stats.json"))
+    job = {"id": 5, "products": [{"id": index} for index in range(500)]}
+    events = plan_competitor_shards(job, stats, budget=budget_for(100))
+    assert len(events) == 1
+    assert events[0]["body"]["scraping_job"]["products"] == job["products"]
+
+    monkeypatch.setattr(shard_planner, "COMPETITOR_SHARDING", True)
+    assert len(plan_competitor_shards(job, stats, budget=budget_for(100))) > 1
+
+
+class FakeSQS:
+    def __init__(self):
+        self.calls = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        assert len(Entries) <= 10
+        assert sum(len(entry["MessageBody"].encode("utf-8")) for entry in Entries) <= 256 * 1024
+        self.calls.append(Entries)
+        return {"Successful": [{"Id": entry["Id"]} for entry in Entries]}
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    clients = {"sqs": FakeSQS(), "s3": FakeS3()}
+    monkeypatch.setattr(boto3, "client", lambda service, *args, **kwargs: clients[service])
+    return clients
+
+
+def test_dispatch_keeps_each_call_under_the_batch_limits(aws):
+    events = [{"body": ["x" * 60_000]} for _ in range(12)]
+    assert dispatch_to_sqs(events, "queue", bucket="") == 12
+    assert [len(call) for call in aws["sqs"].calls] == [4, 4, 4]
+
+
+def test_oversized_events_go_through_s3(aws):
+    event = {"queryStringParameters": {"action": "a"}, "body": ["x" * 300_000]}
+    assert dispatch_to_sqs([event], "queue", bucket="") == 0
+
+    assert dispatch_to_sqs([event], "queue", bucket="shards") == 1
+    message = json.loads(aws["sqs"].calls[0][0]["MessageBody"])
+    assert message["s3_payload"]["bucket"] == "shards"
+    assert load_shard_event(message) == event
+    assert load_shard_event({"body": []}) == {"body": []}
@@ -0,0 +1,78 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scraping_logics.single_flight import SingleFlight
+
+
+class SlowFetch:
+    """Blocks until released, counting how often it really runs"""
+
+    def __init__(self, result="page"):
+        self.result = result
+        self.runs = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.runs += 1
+        self.started.set()
+        assert self.release.wait(5)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def run_concurrently(flight, fetch, callers=4):
+    with ThreadPoolExecutor(callers) as pool:
+        leader = pool.submit(flight.do, "key", fetch)
+        assert fetch.started.wait(5)
+        followers = [pool.submit(flight.do, "key", fetch) for _ in range(callers - 1)]
+        # Let the followers reach the shared call before it completes
+        while flight.stats()["shared"] < callers - 1:
+            threading.Event().wait(0.001)
+        fetch.release.set()
+        return [leader] + followers
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight(max_results=0)
+    fetch = SlowFetch()
+    futures = run_concurrently(flight, fetch)
+    assert [future.result() for future in futures] == ["page"] * 4
+    assert fetch.runs == 1
+    assert flight.stats() == {"calls": 1, "shared": 3}
+
+
+def test_errors_reach_every_caller_and_are_not_remembered():
+    flight = SingleFlight()
+    fetch = SlowFetch(result=ConnectionError("reset"))
+    for future in run_concurrently(flight, fetch):
+        with pytest.raises(ConnectionError):
+            future.result()
+    assert flight.do("key", lambda: "retried") == "retried"
+
+
+def test_results_are_remembered_until_reset():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: "first") == "first"
+    assert flight.do("key", lambda: "second") == "first"
+    flight.reset()
+    assert flight.do("key", lambda: "second") == "second"
+
+
+def test_falsy_results_are_not_remembered():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: None) is None
+    assert flight.do("key", lambda: "page") == "page"
+
+
+def test_least_recently_used_results_are_dropped():
+    flight = SingleFlight(max_results=2)
+    flight.do("a", lambda: 1)
+    flight.do("b", lambda: 2)
+    flight.do("a", lambda: 0)
+    flight.do("c", lambda: 3)
+    assert flight.do("a", lambda: 0) == 1
+    assert flight.do("b", lambda: 0) == 0